@@ -0,0 +1,110 @@
+import time
+
+import streamlit as st
+from renal_app.metrics import snapshot, render_prometheus, dump_prometheus, reset
+from renal_app.quota import status as quota_status
+from renal_app.gemini_api import token_budget_report
+from renal_app.preload import preload_status
+from renal_app.airtable_api import dead_letter_airtable_records, queued_airtable_records, flush_airtable_queue, AIRTABLE_DEAD_LETTER_PATH
+from renal_app.reports import formats, registry_export_bytes, registry_export_status, start_registry_export
+from renal_app.memory import session_memory_report, cache_memory_report, sweep_ended_sessions
+
+METRICS_DUMP_PATH = st.secrets.get("METRICS_DUMP_PATH")
+
+def admin_page():
+    """Render the Admin page with per-provider latency metrics"""
+    st.subheader("Admin", anchor=False)
+    st.caption("Provider metrics since the server started (all sessions)")
+
+    rows = snapshot()
+    if not rows:
+        st.info("No provider calls recorded yet.")
+    else:
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+
+    prometheus_text = render_prometheus()
+
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        st.download_button("⬇️ Prometheus", prometheus_text, file_name="renal_metrics.prom", use_container_width=True)
+
+    with col2:
+        if st.button("💾 Dump to File", use_container_width=True, disabled=not METRICS_DUMP_PATH):
+            dump_prometheus(METRICS_DUMP_PATH, force=True)
+            st.success(f"Written to {METRICS_DUMP_PATH}")
+
+    with col3:
+        if st.button("Reset Metrics", use_container_width=True):
+            reset()
+            st.rerun()
+
+    warm = preload_status()
+    st.caption(
+        f"Cache preload: {warm['state']} | {warm['warmed']} of {warm['products']} top product(s) warmed, "
+        f"{warm['skipped']} skipped" + (f" | {warm['error']}" if warm["error"] else "")
+    )
+
+    st.subheader("Provider Health", anchor=False)
+    st.caption("Remaining request budget and circuit breaker state per provider")
+    st.dataframe(quota_status(), hide_index=True, use_container_width=True)
+
+    tokens = token_budget_report()
+    if tokens:
+        st.subheader("Gemini Tokens", anchor=False)
+        st.caption("Prompt and response tokens per operation; the budget is the prompt size one call should stay under")
+        st.dataframe(tokens, hide_index=True, use_container_width=True)
+
+    queued = queued_airtable_records()
+    if queued:
+        st.caption(f"{queued} audit record(s) waiting to be sent to Airtable")
+        if st.button("📤 Send Queued Records"):
+            sent = flush_airtable_queue()
+            st.success(f"Sent {sent} record(s)")
+    rejected = dead_letter_airtable_records()
+    if rejected:
+        st.caption(f"{rejected} audit record(s) rejected by Airtable, set aside in {AIRTABLE_DEAD_LETTER_PATH}")
+
+    st.subheader("Audit Reports", anchor=False)
+    st.caption("Printable reports of every audit in the Airtable registry, in one zip archive")
+    report_format = st.radio("Format", formats(), horizontal=True, format_func=str.upper, key="report_format")
+    export = registry_export_status(report_format)
+    col1, col2 = st.columns(2)
+    with col1:
+        # The archive is written by a background job, so building it never holds up this page
+        if st.button("🗂️ Build Export", use_container_width=True, disabled=export["state"] == "running"):
+            export = start_registry_export(report_format)
+    with col2:
+        st.download_button(
+            "⬇️ Export Reports",
+            data=lambda: registry_export_bytes(report_format),
+            file_name=f"audit_reports_{report_format}.zip",
+            mime="application/zip",
+            on_click="ignore",
+            use_container_width=True,
+            disabled=export["path"] is None,
+        )
+    if export["state"] == "running":
+        st.caption("Building the export in the background; rerun the page to see when it is done")
+    elif export["state"] == "failed":
+        st.error(f"Export failed: {export['error']}")
+    if export["finished"] and export["state"] != "running":
+        built = time.strftime("%Y-%m-%d %H:%M", time.localtime(export["finished"]))
+        count = f"{export['count']} report(s), " if export["count"] is not None else ""
+        st.caption(f"Last export: {count}built {built}")
+
+    st.subheader("Memory", anchor=False)
+    caches = cache_memory_report()
+    sessions = session_memory_report()
+    st.caption(
+        f"Caches: {sum(row['bytes'] for row in caches) / 1e6:.1f} MB | "
+        f"Session state: {sum(row['state_bytes'] for row in sessions) / 1e6:.1f} MB across {len(sessions)} session(s)"
+    )
+    st.dataframe(caches, hide_index=True, use_container_width=True)
+    st.dataframe(sessions, hide_index=True, use_container_width=True)
+    if st.button("🧹 Release Ended Sessions"):
+        released = sweep_ended_sessions(force=True)
+        st.success(f"Released {released} photo reference(s)")
+
+    with st.expander("Prometheus text"):
+        st.code(prometheus_text, language="text")
@@ -1,17 +1,23 @@
 import streamlit as st
-from renal_app.airtable_api import prepare_airtable_record, push_to_airtable, push_to_airtable_with_attachment
+from renal_app.airtable_api import prepare_airtable_record, push_to_airtable
 from renal_app.gemini_api import analyze_ingredients_for_triggers
 from renal_app.logic import (
     calculate_delta,
     units,
-    get_audit_details,
+    audit_all_profiles,
+    get_rule_profiles,
+    DAILY_BUDGETS,
     init_comparison_data,
     update_comparison_data,
     NUTRIENTS_TO_DISPLAY,
 )
-from renal_app.styles import nutrient_comparison_style
+from renal_app.styles import delta_color, nutrient_comparison_style
 from renal_app.wizards import show_usda_wizard, show_label_wizard
-from renal_app.usda_api import fetch_usda_food_details
+from renal_app.usda_api import fetch_usda_food_details, recommend_safer_alternatives
+from renal_app.memory import get_session_blobs
+from renal_app.reports import FORMATS, formats, report_bytes, report_filename, submit_report
+from renal_app.local_cache import remember_food, remember_verdict
+from intake_page import show_add_to_log
 
 
 def clear_session_keys(keys):
@@ -23,6 +29,8 @@ def reset_label_data():
         "label_vals",
         "COMPARISON_DATA",
         "audit_report",
+        "audit_record",
+        "profile_reports",
         "ai_report",
         "label_in",
     ])
@@ -36,12 +44,54 @@ def reset_usda_data():
         "selected_food_name",
         "COMPARISON_DATA",
         "audit_report",
+        "audit_record",
+        "profile_reports",
         "ai_report",
         "usda_in",
     ])
 
     st.rerun()
 
+def select_alternative(alternative):
+    clear_session_keys([
+        "COMPARISON_DATA",
+        "audit_report",
+        "audit_record",
+        "profile_reports",
+        "ai_report",
+        "usda_in",
+    ])
+    st.session_state["selected_fdc_id"] = alternative["fdc_id"]
+    st.session_state["selected_food_name"] = f"{alternative['brand'].title()} - {alternative['description'].title()}"
+
+def select_cached_food(fdc_id, name):
+    """Selects a product opened from the browser's local cache (see renal_app.local_cache)."""
+    clear_session_keys([
+        "COMPARISON_DATA",
+        "audit_report",
+        "audit_record",
+        "profile_reports",
+        "ai_report",
+        "usda_in",
+    ])
+    st.session_state["selected_fdc_id"] = fdc_id
+    st.session_state["selected_food_name"] = name
+    st.session_state.page = "Audit"
+
+def show_report_downloads(record):
+    """Download buttons for the printable audit report; the file is read when the button is clicked."""
+    columns = st.columns(len(formats()))
+    for column, fmt in zip(columns, formats()):
+        with column:
+            st.download_button(
+                f"📄 Report ({fmt.upper()})",
+                data=lambda fmt=fmt: report_bytes(record, fmt),
+                file_name=report_filename(record, fmt),
+                mime=FORMATS[fmt],
+                on_click="ignore",
+                width="stretch",
+            )
+
 def audit_page():
     """Render the Audit page"""
     st.subheader("Audit", anchor=False)
@@ -79,7 +129,8 @@ def audit_page():
         label_vals = st.session_state.get("label_vals", {})
         fdc_id = st.session_state.get("selected_fdc_id")
         label_serving_size = label_vals.get("Serving Size") if label_vals else None
-        food_details = fetch_usda_food_details(fdc_id, label_serving_size) if fdc_id else {}
+        label_serving_unit = label_vals.get("Serving Unit") if label_vals else None
+        food_details = fetch_usda_food_details(fdc_id, label_serving_size, label_serving_unit) if fdc_id else {}
         usda_nutrients = food_details.get("nutrients", {})
 
         # 2. Map both to the comparison table safely
@@ -100,10 +151,14 @@ def audit_page():
             if product_name == "Unknown Product" and "selected_food_name" in st.session_state:
                 product_name = st.session_state["selected_food_name"]
             serving = label_vals.get('Serving Size')
+            s_unit = label_vals.get('Serving Unit')
+            # The note is only shown; the Airtable record keeps the missing serving empty
+            serving_caption = serving
             if serving is None:
-                serving = "Serving size not provided, comparing with 100g USDA values"
+                serving_caption = "Serving size not provided, comparing with 100g USDA values"
                 source = "USDA"
-            s_unit = label_vals.get('Serving Unit')
+            elif food_details.get("nutrients") and not food_details.get("Serving Converted"):
+                source = "Label (unit not convertible for this item, comparing with 100g USDA values)"
             st.session_state["label_in"] = label_vals.get("Ingredients", "Not Available")
 
         else:
@@ -111,14 +166,15 @@ def audit_page():
             product = food_details.get("Product Name")
             brand = food_details.get("Brand")
             product_name = (f"{brand} {product}").strip() or "Unknown Product"
-            serving = 100
+            serving = serving_caption = 100
             s_unit = food_details.get('Serving Unit')
             if s_unit is None:
                 unit = "g"
             st.session_state["usda_in"] = food_details.get("Ingredients", "Not Available")
 
+        remember_food(fdc_id, product_name, food_details)
         st.markdown(f"**Product:** {product_name}")
-        st.caption(f"**Serving Size:** {serving} {s_unit} | Source: {source}")
+        st.caption(f"**Serving Size:** {serving_caption} {s_unit} | Source: {source}")
 
         # Update the grid to include additional nutrients: Calories, Total Fat, and Fiber
         nutrients_to_display = NUTRIENTS_TO_DISPLAY
@@ -132,21 +188,16 @@ def audit_page():
         """, unsafe_allow_html=True)
         # Map nutrients to COMPARISON_DATA
 
+        comparison = st.session_state["COMPARISON_DATA"]
         for nutrient in nutrients_to_display:
-            # Ensure values have the required structure
-            values = st.session_state.get("COMPARISON_DATA", {}).get(nutrient, {"label": None, "usda": None})
-            label_value = values.get("label")
-            usda_value = values.get("usda")
+            label_value = comparison.label[nutrient]
+            usda_value = comparison.usda[nutrient]
 
             delta_percent = calculate_delta(label_value, usda_value)
-            if delta_percent is None:
-                delta_color = "#666"
-            else:
-                delta_color = "#ff4b4b" if delta_percent > 0 else "#00cc66"
             unit = units.get(nutrient, "")
 
             # Pass validated values to nutrient_comparison_style
-            st.markdown(nutrient_comparison_style({"label": label_value, "usda": usda_value}, delta_color, delta_percent, nutrient, unit), unsafe_allow_html=True)
+            st.markdown(nutrient_comparison_style({"label": label_value, "usda": usda_value}, delta_color(delta_percent), delta_percent, nutrient, unit), unsafe_allow_html=True)
 
         st.markdown("")
 
@@ -167,20 +218,43 @@ def audit_page():
         else:
             st.caption(st.session_state["label_in"])
 
+        rule_profiles = get_rule_profiles()
+        profile_name = st.selectbox(
+            "Audit Profile",
+            options=list(rule_profiles),
+            format_func=lambda name: rule_profiles[name].title,
+            key="rule_profile",
+        )
+        # The Daily Log measures totals against the same profile
+        st.session_state["daily_budgets"] = rule_profiles[profile_name].daily_budgets or DAILY_BUDGETS
+
         if st.button("▶️ Start Audit", use_container_width=True):
             with st.spinner("Sending data..."):
 
-                st.session_state["audit_report"] = get_audit_details(st.session_state["COMPARISON_DATA"])
+                # Every profile is evaluated in one pass, so switching profiles needs no new audit
+                reports = audit_all_profiles(st.session_state["COMPARISON_DATA"], rule_profiles.values())
+                st.session_state["profile_reports"] = reports
+                st.session_state["audit_report"] = reports[profile_name]
                 st.session_state["ai_report"] = analyze_ingredients_for_triggers(st.session_state["label_in"], st.session_state["usda_in"])
 
                 current_label = st.session_state.get("label_vals", {})
                 current_usda = food_details # This is already fetched in your audit_page()
-                current_photo = st.session_state.get("label_photo_bytes")
-                final_payload = prepare_airtable_record(product, brand, serving, s_unit, current_usda, current_label, current_photo)
-                push_to_airtable(final_payload)
+                current_photos = get_session_blobs("label_photos")
+                final_payload = prepare_airtable_record(product, brand, serving, s_unit, current_usda, current_label)
+                # The printable report renders in the background while the record is sent
+                st.session_state["audit_record"] = final_payload
+                submit_report(final_payload)
+                remember_verdict(fdc_id, product_name, st.session_state["audit_report"])
+                if not push_to_airtable(final_payload, current_photos):
+                    st.info("Airtable is busy, so this audit was saved locally and will be sent later.")
                 
                 if not st.session_state["audit_report"]:
                     st.error("Failed to send data. Please try again.")
+
+        # The banner follows the selected profile on every rerun, not just the one that was audited
+        profile_reports = st.session_state.get("profile_reports") or {}
+        if profile_name in profile_reports:
+            st.session_state["audit_report"] = profile_reports[profile_name]
         
     if "audit_report" in st.session_state:
         # Display the audit banner
@@ -203,16 +277,52 @@ def audit_page():
                             st.write(disc)
                 with st.expander("🧪 AI Ingredient Analysis"):
                     st.write(st.session_state["ai_report"])
+
+                alternatives = recommend_safer_alternatives(st.session_state.get("selected_fdc_id"))
+                if alternatives:
+                    with st.expander("🥗 Safer Alternatives"):
+                        for alt in alternatives:
+                            n = alt["nutrients"]
+                            st.write(f"**{alt['brand'].title()} {alt['description'].title()}**".strip())
+                            st.caption(f"Per 100g: Sodium {n['Sodium']:.0f}mg | Potassium {n['Potassium']:.0f}mg | Phosphorus {n['Phosphorus']:.0f}mg")
+                            st.button("Use this product", key=f"alt_{alt['fdc_id']}", on_click=select_alternative, args=(alt,))
             
             elif st.session_state["audit_report"]["color"] == "yellow":
-                st.warning(f"### 🟡 [ {product_name} ] Data Mismatch")
+                st.warning(f"### 🟡 [ {product_name} ] {st.session_state['audit_report']['status']}")
                 with st.expander("📊 Nutritional Numbers Audit"):
+                    for flag in st.session_state["audit_report"]["flags"]:
+                        st.write(flag)
                     for disc in st.session_state["audit_report"]["discrepancies"]:
                         st.write(disc)
 
             else:
                 st.success(f"🟢 [ {product_name} ] Renal Safe")
 
+            other_reports = {
+                name: report
+                for name, report in st.session_state.get("profile_reports", {}).items()
+                if name != st.session_state["audit_report"].get("profile")
+            }
+            if other_reports:
+                icons = {"red": "🔴", "yellow": "🟡", "green": "🟢"}
+                rule_profiles = get_rule_profiles()
+                st.caption("Other profiles: " + " · ".join(
+                    f"{icons[report['color']]} {rule_profiles[name].title if name in rule_profiles else name}: {report['status']}"
+                    for name, report in other_reports.items()
+                ))
+
+            if "audit_record" in st.session_state:
+                show_report_downloads(st.session_state["audit_record"])
+
+            comparison = st.session_state["COMPARISON_DATA"]
+            logged_nutrients, portion = comparison.label, None
+            if comparison.label.is_empty():
+                logged_nutrients = comparison.usda
+                # Without a convertible label serving the USDA values are per 100 g, not per serving
+                if not food_details.get("Serving Converted"):
+                    portion = f"{food_details.get('Serving Size', 100):g} {food_details.get('Serving Unit') or 'g'}"
+            show_add_to_log(product_name, logged_nutrients, st.session_state.get("selected_fdc_id"), portion)
+
             if st.button("Clear All Data", width='stretch'):
                 reset_label_data()
                 reset_usda_data()
@@ -0,0 +1,32 @@
+import pytest
+
+from stubs import run_audit
+
+# Seconds added to every provider call (0 = pure local overhead)
+PROVIDER_DELAYS = [0.0, 0.05]
+BATCH_SIZE = 10
+
+
+@pytest.mark.benchmark(group="audit_single")
+@pytest.mark.parametrize("delay", PROVIDER_DELAYS)
+def bench_audit_single(benchmark, providers, clear_caches, photo_corpus, delay):
+    providers.delays = dict.fromkeys(providers.calls, delay)
+    photo = photo_corpus["phone_12mp_portrait"]
+
+    # Cold caches each round so every provider is actually called
+    report = benchmark.pedantic(run_audit, args=(photo,), setup=clear_caches, rounds=5)
+    assert report["color"] in ("red", "yellow", "green")
+
+
+@pytest.mark.benchmark(group="audit_batch")
+@pytest.mark.parametrize("delay", PROVIDER_DELAYS)
+def bench_audit_batch(benchmark, providers, clear_caches, photo_corpus, delay):
+    providers.delays = dict.fromkeys(providers.calls, delay)
+    photos = [photo_corpus[name] for name in sorted(photo_corpus)] * (BATCH_SIZE // len(photo_corpus) + 1)
+
+    def run_batch():
+        return [run_audit(photo) for photo in photos[:BATCH_SIZE]]
+
+    benchmark.extra_info["batch_size"] = BATCH_SIZE
+    reports = benchmark.pedantic(run_batch, setup=clear_caches, rounds=3)
+    assert len(reports) == BATCH_SIZE
@@ -0,0 +1,46 @@
+import pytest
+
+from stubs import load_fixture, recorded_label_vals
+from renal_app.label_parser import parse_label_text
+from renal_app.logic import get_audit_details, init_comparison_data, update_comparison_data
+from renal_app.usda_api import _build_food_details
+
+AUDITS_PER_ROUND = 1_000
+
+
+@pytest.mark.benchmark(group="get_audit_details")
+def bench_get_audit_details_throughput(benchmark):
+    label_vals = recorded_label_vals()
+    foods = load_fixture("usda_search")["foods"]
+    records = [
+        update_comparison_data(
+            init_comparison_data(),
+            label_vals=label_vals,
+            usda_nutrients=_build_food_details(foods[i % len(foods)], 100 + i % 50, "g")["nutrients"],
+        )
+        for i in range(AUDITS_PER_ROUND)
+    ]
+
+    def audit_all():
+        return [get_audit_details(record) for record in records]
+
+    benchmark.extra_info["audits_per_round"] = AUDITS_PER_ROUND
+    reports = benchmark(audit_all)
+    assert len(reports) == AUDITS_PER_ROUND
+
+
+# A comma before exactly three digits groups thousands (US labels); otherwise it is a decimal point
+LABEL_NUMBER_CASES = {
+    "thousands": ("Serving Size 1 cup (240 mL)\nCalories 1,050\nSodium 1,200 mg 52%\nPotassium 2,100mg",
+                  {"Calories": 1050, "Sodium": 1200, "Potassium": 2100, "Serving Size": 240}),
+    "decimal_comma": ("Per 100 g\nProtein 0,5 g\nSodium 12,5 mg",
+                      {"Protein": 0.5, "Sodium": 12.5, "Serving Size": 100}),
+}
+
+
+@pytest.mark.benchmark(group="parse_label_text")
+@pytest.mark.parametrize("case", list(LABEL_NUMBER_CASES))
+def bench_parse_label_numbers(benchmark, case):
+    text, expected = LABEL_NUMBER_CASES[case]
+    vals = benchmark(parse_label_text, text)
+    assert {name: vals[name] for name in expected} == pytest.approx(expected)
@@ -0,0 +1,15 @@
+import io
+
+import pytest
+
+from conftest import PHOTO_CORPUS
+from renal_app.wizards import prepare_photo
+
+
+@pytest.mark.benchmark(group="prepare_photo")
+@pytest.mark.parametrize("name", [name for name, *_ in PHOTO_CORPUS])
+def bench_prepare_photo(benchmark, photo_corpus, name):
+    data = photo_corpus[name]
+    compressed = benchmark(lambda: prepare_photo(io.BytesIO(data)))
+    benchmark.extra_info["input_bytes"] = len(data)
+    benchmark.extra_info["output_bytes"] = len(compressed)
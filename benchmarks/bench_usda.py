@@ -0,0 +1,20 @@
+import pytest
+
+from stubs import candidate_foods, load_fixture
+from renal_app.usda_api import _build_food_details, sort_results_by_relevance
+
+
+@pytest.mark.benchmark(group="sort_results_by_relevance")
+@pytest.mark.parametrize("n", [100, 1_000, 10_000])
+def bench_sort_results_by_relevance(benchmark, n):
+    foods = candidate_foods(n)
+    result = benchmark(sort_results_by_relevance, foods, "liberte greek yogurt plain")
+    assert len(result) == n
+
+
+@pytest.mark.benchmark(group="build_food_details")
+@pytest.mark.parametrize("serving", [(None, None), (175, "g"), (0.75, "cup")])
+def bench_build_food_details(benchmark, serving):
+    food = load_fixture("usda_search")["foods"][0]
+    details = benchmark(_build_food_details, food, *serving)
+    assert details["nutrients"]["Sodium"] is not None
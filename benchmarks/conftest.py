@@ -0,0 +1,59 @@
+"""Benchmark suite for the audit hot paths, replaying recorded provider responses.
+
+Run from this directory:
+
+    pip install -r ../requirements.txt -r requirements.txt
+    pytest
+
+Add --benchmark-autosave to keep a run in history/ (git-ignored) with the commit id,
+then compare two saved runs:
+
+    pytest-benchmark --storage file://history compare 0001 0002 --group-by=group
+"""
+
+import os
+
+import pytest
+
+from stubs import ProviderStandIns, install_secrets, label_photo
+
+_secrets_path = install_secrets()
+
+# (name, size, mode, format) - typical phone captures plus an already-small upload
+PHOTO_CORPUS = [
+    ("phone_12mp_landscape", (4032, 3024), "RGB", "JPEG"),
+    ("phone_12mp_portrait", (3024, 4032), "RGB", "JPEG"),
+    ("tablet_png_alpha", (2048, 1536), "RGBA", "PNG"),
+    ("small_upload", (1200, 900), "RGB", "JPEG"),
+]
+
+
+def pytest_sessionfinish(session, exitstatus):
+    os.remove(_secrets_path)
+
+
+@pytest.fixture(scope="session")
+def photo_corpus():
+    return {name: label_photo(size, mode, fmt) for name, size, mode, fmt in PHOTO_CORPUS}
+
+
+@pytest.fixture
+def clear_caches():
+    import streamlit as st
+
+    def clear():
+        st.cache_data.clear()
+    clear()
+    return clear
+
+
+@pytest.fixture
+def providers(monkeypatch, clear_caches):
+    from renal_app import quota
+
+    # Benchmarks replay far faster than the real rate limits allow; measure the
+    # code path, not the quota manager turning calls away
+    for provider, pool in list(quota._pools.items()):
+        unlimited = [quota.ProviderHealth(provider, float("inf"), 1, key=h.key, label=h.label) for h in pool]
+        monkeypatch.setitem(quota._pools, provider, unlimited)
+    return ProviderStandIns().install(monkeypatch)
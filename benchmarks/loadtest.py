@@ -0,0 +1,441 @@
+"""Load test: N simulated users driving one app server over its websocket.
+
+The app runs once under `streamlit run` (loadtest_app.py) with the provider
+stand-ins from stubs.py, which add log-normal latency and random errors. The
+users are concurrent websocket clients that speak Streamlit's protocol the way
+the browser does: they rerun the script with widget states, upload the label
+photo through the upload endpoint and wait for each run to finish. The
+sessions therefore share one process, its caches, quota state and script
+threads, and the report shows how many audits one server instance sustains
+while slow provider calls hold its threads.
+
+    cd benchmarks
+    python loadtest.py --users 20 --audits 3 \\
+        --latency usda=0.4:0.5 --latency gemini=1.5:0.4 --latency ocr_space=2.0:0.3 \\
+        --error-rate usda=0.02
+
+Latency is given as median_seconds:sigma per provider.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from stubs import ProviderStandIns, install_secrets, label_photo
+
+SERVER_SCRIPT = Path(__file__).resolve().parent / "loadtest_app.py"
+# Server settings passed to loadtest_app.py as JSON
+CONFIG_ENV = "RENAL_LOADTEST_CONFIG"
+STATS_QUERY = "loadtest=stats"
+SERVER_START_TIMEOUT = 60
+
+QUERIES = [
+    "liberte greek yogurt",
+    "campbell's chicken noodle soup",
+    "lay's potato chips",
+    "coca-cola",
+    "nature's own whole wheat bread",
+]
+
+
+def lognormal(median, sigma, rng):
+    return lambda: rng.lognormvariate(0, sigma) * median if sigma else median
+
+
+def parse_provider_values(pairs):
+    values = {}
+    for pair in pairs or []:
+        provider, _, value = pair.partition("=")
+        values[provider] = value
+    return values
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def process_memory(pid):
+    """(current, peak) resident set size of a process in bytes, from /proc."""
+    values = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                values[key] = int(value.split()[0]) * 1024
+    return values.get("VmRSS"), values.get("VmHWM")
+
+
+# Server side (runs inside `streamlit run loadtest_app.py`)
+
+_providers = None
+
+
+def install_server():
+    """Installs the provider stand-ins once per server process, from the settings in CONFIG_ENV."""
+    global _providers
+    if _providers is None:
+        config = json.loads(os.environ[CONFIG_ENV])
+        rng = random.Random(config["seed"])
+        delays = {provider: lognormal(median, sigma, rng) for provider, (median, sigma) in config["latency"].items()}
+        _providers = ProviderStandIns(delays=delays, error_rates=config["error_rates"], seed=config["seed"]).install()
+    return _providers
+
+
+def write_server_stats():
+    """Writes provider call counts and per-session memory to the stats file named in CONFIG_ENV."""
+    from renal_app.memory import session_memory_report
+
+    config = json.loads(os.environ[CONFIG_ENV])
+    stats = {
+        "provider_calls": _providers.calls,
+        "provider_errors": _providers.errors,
+        "sessions": session_memory_report(),
+    }
+    with open(config["stats_path"], "w", encoding="utf-8") as f:
+        json.dump(stats, f)
+
+
+# Client side
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def app_server(secrets_path, config):
+    """Runs loadtest_app.py under `streamlit run` on a free local port; yields (base_url, process)."""
+    import httpx
+
+    port = _free_port()
+    env = {**os.environ, CONFIG_ENV: json.dumps(config)}
+    command = [
+        sys.executable, "-m", "streamlit", "run", str(SERVER_SCRIPT),
+        "--server.headless=true", f"--server.port={port}", "--server.address=127.0.0.1",
+        # The upload endpoint checks an XSRF cookie the simulated users don't have
+        "--server.enableXsrfProtection=false",
+        "--server.fileWatcherType=none", "--browser.gatherUsageStats=false",
+        f"--secrets.files={secrets_path}", "--logger.level=error",
+    ]
+    server = subprocess.Popen(command, env=env, cwd=SERVER_SCRIPT.parent, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"App server exited with code {server.returncode}")
+            try:
+                if httpx.get(f"{base_url}/_stcore/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("App server did not start")
+            time.sleep(0.2)
+        yield base_url, server
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+class AppSession:
+    """
+    One browser tab: a websocket session that reruns the script with widget states,
+    as the Streamlit frontend does, and keeps the elements of the last finished run.
+    """
+
+    def __init__(self, base_url, timeout, query_string=""):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.query_string = query_string
+        self.ws = None
+        self.session_id = None
+        self.page_script_hash = ""
+        self.elements = {}
+        self.widget_states = {}
+        self.exceptions = []
+
+    async def __aenter__(self):
+        import websockets
+
+        url = self.base_url.replace("http", "ws", 1) + "/_stcore/stream"
+        self.ws = await websockets.connect(url, subprotocols=["streamlit"], max_size=None, ping_interval=None)
+        await self.rerun()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.ws.close()
+
+    async def _send(self, back_msg):
+        await self.ws.send(back_msg.SerializeToString())
+
+    async def _receive(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        msg = ForwardMsg()
+        msg.ParseFromString(await self.ws.recv())
+        kind = msg.WhichOneof("type")
+        if kind == "new_session":
+            self.session_id = msg.new_session.initialize.session_id
+            self.page_script_hash = msg.new_session.page_script_hash
+            self.elements = {}
+            self.exceptions = []
+        elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+            element = msg.delta.new_element
+            self.elements[tuple(msg.metadata.delta_path)] = element
+            if element.WhichOneof("type") == "exception":
+                self.exceptions.append(element.exception.message)
+        return msg
+
+    async def _run_finished(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        while True:
+            msg = await self._receive()
+            # st.rerun() ends a run early and the server starts the next one itself
+            if msg.WhichOneof("type") == "script_finished" and msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return
+
+    async def rerun(self, *changes):
+        """Reruns the script with the given WidgetStates changed; returns the seconds until it finished."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        active = {widget.id for widget in self._widgets()}
+        self.widget_states = {
+            widget_id: state for widget_id, state in self.widget_states.items()
+            if widget_id in active and state.WhichOneof("value") != "trigger_value"
+        }
+        for state in changes:
+            self.widget_states[state.id] = state
+
+        back_msg = BackMsg()
+        back_msg.rerun_script.query_string = self.query_string
+        back_msg.rerun_script.page_script_hash = self.page_script_hash
+        back_msg.rerun_script.widget_states.widgets.extend(self.widget_states.values())
+
+        start = time.perf_counter()
+        await self._send(back_msg)
+        await asyncio.wait_for(self._run_finished(), self.timeout)
+        elapsed = time.perf_counter() - start
+        if self.exceptions:
+            raise RuntimeError(self.exceptions[0])
+        return elapsed
+
+    def _widgets(self):
+        for element in self.elements.values():
+            proto = getattr(element, element.WhichOneof("type"))
+            if getattr(proto, "id", None):
+                yield proto
+
+    def widget(self, key=None, label=None):
+        """The widget proto with this key (the suffix Streamlit puts on its id) or label."""
+        for proto in self._widgets():
+            if (key and proto.id.endswith(f"-{key}")) or (label and getattr(proto, "label", None) == label):
+                return proto
+        raise LookupError(f"No widget {key or label!r} in the last run")
+
+    async def click(self, key=None, label=None):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        return await self.rerun(WidgetState(id=self.widget(key, label).id, trigger_value=True))
+
+    async def set_text(self, key, value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        return await self.rerun(WidgetState(id=self.widget(key).id, string_value=value))
+
+    async def choose(self, key, option=None, index=0):
+        """Selects a radio option, or a segmented control / pills option, by content or index."""
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        proto = self.widget(key)
+        options = [getattr(o, "content", o) for o in proto.options]
+        value = option if option is not None else options[index]
+        state = WidgetState(id=proto.id)
+        if hasattr(proto, "click_mode"):
+            state.string_array_value.data[:] = [value]
+        else:
+            state.string_value = value
+        return await self.rerun(state)
+
+    async def upload(self, key, name, data, mime_type):
+        """Uploads a file through the upload endpoint, then reruns with it in the file uploader."""
+        import httpx
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        back_msg = BackMsg()
+        back_msg.file_urls_request.request_id = uuid.uuid4().hex
+        back_msg.file_urls_request.session_id = self.session_id
+        back_msg.file_urls_request.file_names.append(name)
+        start = time.perf_counter()
+        await self._send(back_msg)
+        while True:
+            msg = await asyncio.wait_for(self._receive(), self.timeout)
+            if msg.WhichOneof("type") == "file_urls_response" and msg.file_urls_response.response_id == back_msg.file_urls_request.request_id:
+                break
+        urls = msg.file_urls_response.file_urls[0]
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout) as client:
+            response = await client.put(urls.upload_url, files={"file": (name, data, mime_type)})
+            response.raise_for_status()
+
+        state = WidgetState(id=self.widget(key).id)
+        info = state.file_uploader_state_value.uploaded_file_info.add()
+        info.name, info.size, info.file_id = name, len(data), urls.file_id
+        info.file_urls.CopyFrom(urls)
+        return time.perf_counter() - start + await self.rerun(state)
+
+
+class SimulatedUser:
+    def __init__(self, user_id, audits, photo, timeout):
+        self.user_id = user_id
+        self.audits = audits
+        self.photo = photo
+        self.timeout = timeout
+        self.step_latencies = []
+        self.audit_latencies = []
+        self.completed = 0
+        self.failures = []
+
+    async def _step(self, action):
+        elapsed = await action
+        self.step_latencies.append(elapsed)
+        return elapsed
+
+    async def run(self, base_url):
+        try:
+            async with AppSession(base_url, self.timeout) as app:
+                await self._step(app.click(key="nav_audit"))
+
+                # Label scan once per session: prepare_photo, OCR and Gemini extraction
+                if self.photo:
+                    await self._step(app.choose("wizard_choice", "🏷️ Label Data"))
+                    await self._step(app.choose("label_step_navigator", "📸 Scan Label"))
+                    await self._step(app.upload("label_upload", "label.jpg", self.photo, "image/jpeg"))
+
+                for i in range(self.audits):
+                    query = QUERIES[(self.user_id + i) % len(QUERIES)]
+                    await self._step(app.choose("wizard_choice", "🔍 USDA Data"))
+                    await self._step(app.set_text("usda_search_input", query))
+                    await self._step(app.choose("manual_entry_usda_radio", index=0))
+
+                    self.audit_latencies.append(await self._step(app.click(label="▶️ Start Audit")))
+                    self.completed += 1
+                    await self._step(app.click(label="Clear USDA Data"))
+        except Exception as e:
+            self.failures.append(f"user {self.user_id}: {e!r}")
+
+
+async def _run_users(base_url, users):
+    await asyncio.gather(*(user.run(base_url) for user in users))
+
+
+async def _server_stats(base_url, stats_path, timeout):
+    async with AppSession(base_url, timeout, query_string=STATS_QUERY):
+        pass
+    with open(stats_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_load_test(users, audits, latency=None, error_rates=None, scan_label=True, timeout=60, seed=0):
+    """
+    Runs the users concurrently against one app server and returns the report dict.
+    latency maps provider -> (median seconds, sigma); error_rates maps provider -> probability.
+    """
+    photo = label_photo((3024, 4032)) if scan_label else None
+    secrets_path = install_secrets()
+    stats_path = Path(tempfile.gettempdir()) / f"renal_loadtest_stats_{os.getpid()}.json"
+    config = {"latency": latency or {}, "error_rates": error_rates or {}, "seed": seed, "stats_path": str(stats_path)}
+    simulated = [SimulatedUser(i, audits, photo, timeout) for i in range(users)]
+
+    try:
+        with app_server(secrets_path, config) as (base_url, server):
+            # One session first, so the baseline includes the imported app and loaded resources
+            asyncio.run(_server_stats(base_url, stats_path, timeout))
+            baseline, _ = process_memory(server.pid)
+
+            start = time.perf_counter()
+            asyncio.run(_run_users(base_url, simulated))
+            wall_time = time.perf_counter() - start
+
+            stats = asyncio.run(_server_stats(base_url, stats_path, timeout))
+            current, peak = process_memory(server.pid)
+    finally:
+        stats_path.unlink(missing_ok=True)
+        os.unlink(secrets_path)
+
+    steps = [s for user in simulated for s in user.step_latencies]
+    audit_times = [s for user in simulated for s in user.audit_latencies]
+    completed = sum(user.completed for user in simulated)
+    state_bytes = [row["state_bytes"] for row in stats["sessions"] if row["keys"]]
+
+    def latency_summary(samples):
+        return {f"p{int(q * 100)}_ms": round(1000 * percentile(samples, q), 1) if samples else None for q in (0.5, 0.95, 0.99)}
+
+    return {
+        "users": users,
+        "audits_per_user": audits,
+        "wall_time_s": round(wall_time, 2),
+        "completed_audits": completed,
+        "throughput_audits_per_s": round(completed / wall_time, 3) if wall_time else None,
+        "interaction_latency": latency_summary(steps),
+        "audit_latency": latency_summary(audit_times),
+        "server_memory": {
+            "rss_growth_bytes": current - baseline,
+            "growth_bytes_per_session": (current - baseline) // users if users else None,
+            "peak_rss_bytes": peak,
+            "session_state_bytes_p50": percentile(state_bytes, 0.5),
+            "session_state_bytes_max": max(state_bytes) if state_bytes else None,
+        },
+        "provider_calls": stats["provider_calls"],
+        "provider_errors": stats["provider_errors"],
+        "failures": [f for user in simulated for f in user.failures],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent audit sessions against one app server with stubbed providers.")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--audits", type=int, default=3, help="USDA audits per user")
+    parser.add_argument("--latency", action="append", metavar="PROVIDER=MEDIAN:SIGMA",
+                        help="Log-normal latency per provider (usda, ocr_space, gemini, airtable)")
+    parser.add_argument("--error-rate", action="append", metavar="PROVIDER=P", help="Failure probability per provider")
+    parser.add_argument("--no-scan", action="store_true", help="Skip the label photo upload step")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-interaction timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    latency = {}
+    for provider, value in parse_provider_values(args.latency).items():
+        median, _, sigma = value.partition(":")
+        latency[provider] = (float(median), float(sigma or 0))
+    error_rates = {provider: float(p) for provider, p in parse_provider_values(args.error_rate).items()}
+
+    report = run_load_test(args.users, args.audits, latency, error_rates, scan_label=not args.no_scan,
+                           timeout=args.timeout, seed=args.seed)
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""The app as loadtest.py serves it: streamlit_app behind the provider stand-ins.
+
+loadtest.py starts this with `streamlit run`; it is not meant to be run by hand.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import streamlit as st
+
+from loadtest import STATS_QUERY, install_server, write_server_stats
+
+install_server()
+
+if st.query_params.get("loadtest") == STATS_QUERY.partition("=")[2]:
+    write_server_stats()
+    st.stop()
+
+from renal_app.styles import apply_custom_styles
+from streamlit_app import main
+
+st.set_page_config(
+    page_title="Renal Audit",
+    page_icon="🏥",
+    layout="centered",
+    initial_sidebar_state="collapsed"
+)
+apply_custom_styles()
+main()
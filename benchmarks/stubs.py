@@ -0,0 +1,201 @@
+"""Local stand-ins that replay recorded provider responses.
+
+Each stand-in sleeps for a configurable delay to simulate provider latency,
+then returns a response recorded from the real USDA, OCR.space, Gemini or
+Airtable API (see fixtures/), or a provider error at a configurable rate.
+"""
+
+import asyncio
+import atexit
+import io
+import json
+import random
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+SECRET_KEYS = [
+    "USDA_API_KEY", "OCR_API_KEY", "GEMINI_API_KEY",
+    "AIRTABLE_API_KEY", "AIRTABLE_BASE_ID", "AIRTABLE_TABLE_NAME", "AIRTABLE_TABLE_ID",
+]
+
+
+def install_secrets():
+    """
+    Points st.secrets at a throwaway secrets.toml, since the app modules read it at import.
+    Returns the file path so the caller can remove it.
+    """
+    from streamlit import config
+
+    # Local stores start empty on every run, so photo scans measure OCR rather than earlier runs' cache
+    data_dir = Path(tempfile.mkdtemp(prefix="renal_benchmark_"))
+    atexit.register(shutil.rmtree, data_dir, ignore_errors=True)
+    with tempfile.NamedTemporaryFile("w", suffix=".toml", delete=False) as f:
+        f.write("\n".join(f'{key} = "benchmark"' for key in SECRET_KEYS))
+        f.write(f'\nAIRTABLE_QUEUE_PATH = "{data_dir / "airtable_queue.jsonl"}"')
+        f.write(f'\nAIRTABLE_DEAD_LETTER_PATH = "{data_dir / "airtable_dead_letter.jsonl"}"')
+        f.write(f'\nLABEL_CACHE_PATH = "{data_dir / "label_cache.jsonl"}"')
+        f.write(f'\nBLOB_STORE_PATH = "{data_dir / "blobs"}"')
+        f.write(f'\nGTIN_INDEX_PATH = "{data_dir / "gtin_index.jsonl"}"')
+        f.write(f'\nINTAKE_DB_PATH = "{data_dir / "intake.sqlite3"}"')
+        f.write(f'\nREPORT_CACHE_PATH = "{data_dir / "reports"}"')
+        f.write(f'\nREPORT_EXPORT_PATH = "{data_dir / "exports"}"')
+    config.set_option("secrets.files", [f.name])
+    config.set_option("logger.level", "error")
+    return f.name
+
+
+def load_fixture(name):
+    with open(FIXTURES / f"{name}.json", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ProviderStandIns:
+    """
+    Replays recorded responses through an httpx mock transport on the shared provider client.
+    delays maps provider name ("usda", "ocr_space", "gemini", "airtable") to seconds,
+    or to a callable returning seconds for a latency distribution. error_rates maps
+    provider name to the probability that a call fails. Delays are awaited, so many
+    calls can be in flight at once, as with the real providers.
+    """
+
+    def __init__(self, delays=None, error_rates=None, seed=None):
+        self.delays = delays or {}
+        self.error_rates = error_rates or {}
+        self.calls = {"usda": 0, "ocr_space": 0, "gemini": 0, "airtable": 0}
+        self.errors = dict.fromkeys(self.calls, 0)
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._search = load_fixture("usda_search")
+        self._food = load_fixture("usda_food")
+        self._ocr = load_fixture("ocr_space")
+        self._extract = load_fixture("gemini_extract")["text"]
+        self._triggers = load_fixture("gemini_triggers")["text"]
+        self._airtable = load_fixture("airtable_create")
+
+    async def _wait(self, provider):
+        """Sleeps for the provider's delay; returns True if this call should fail."""
+        delay = self.delays.get(provider, 0.0)
+        with self._lock:
+            self.calls[provider] += 1
+            failed = self._rng.random() < self.error_rates.get(provider, 0.0)
+            self.errors[provider] += int(failed)
+        delay = delay() if callable(delay) else delay
+        if delay:
+            await asyncio.sleep(delay)
+        return failed
+
+    async def handle(self, request):
+        import httpx
+
+        host, path = request.url.host, request.url.path
+        if host == "api.nal.usda.gov":
+            if await self._wait("usda"):
+                return httpx.Response(429, json={"error": {"code": "OVER_RATE_LIMIT"}})
+            if path.endswith("/foods/search"):
+                query = request.url.params.get("query", "")
+                page_size = int(request.url.params.get("pageSize", 100))
+                foods = self._search["foods"]
+                # fetch_usda_food_details searches by FDC ID with pageSize=1
+                matches = [f for f in foods if str(f["fdcId"]) == query] or foods
+                return httpx.Response(200, json={**self._search, "foods": matches[:page_size]})
+            return httpx.Response(200, json=self._food)
+        if host == "api.ocr.space":
+            if await self._wait("ocr_space"):
+                return httpx.Response(200, json={"OCRExitCode": 99, "ErrorMessage": ["Rate limit exceeded"]})
+            return httpx.Response(200, json=self._ocr)
+        if host == "generativelanguage.googleapis.com":
+            if await self._wait("gemini"):
+                return httpx.Response(429, json={"error": {"status": "RESOURCE_EXHAUSTED"}})
+            prompt = json.loads(request.content)["contents"][0]["parts"][0]["text"]
+            text = self._extract if "data extraction expert" in prompt else self._triggers
+            return httpx.Response(200, json={"candidates": [{"content": {"parts": [{"text": text}]}}]})
+        if await self._wait("airtable"):
+            return httpx.Response(429, json={"errors": [{"error": "RATE_LIMIT_REACHED"}]})
+        return httpx.Response(200, json=self._airtable)
+
+    def client(self):
+        import httpx
+
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+
+    def install(self, monkeypatch=None):
+        """Routes the shared provider client through these stand-ins (undone by monkeypatch if given)."""
+        from renal_app.core import runner
+
+        if monkeypatch:
+            monkeypatch.setattr(runner, "_client", self.client())
+        else:
+            runner.set_client(self.client())
+        return self
+
+
+def recorded_label_vals():
+    """The label_vals dict Gemini returned for the recorded OCR text."""
+    text = load_fixture("gemini_extract")["text"]
+    return json.loads(text[text.index("{"):text.rindex("}") + 1])
+
+
+def candidate_foods(n):
+    """n USDA search results built from the recorded payload with varied descriptions."""
+    recorded = load_fixture("usda_search")["foods"]
+    words = ["original", "light", "organic", "family size", "low sodium", "vanilla", "classic", "unsalted"]
+    foods = []
+    for i in range(n):
+        food = dict(recorded[i % len(recorded)])
+        food["fdcId"] = 1_000_000 + i
+        food["description"] = f"{food['description']} {words[i % len(words)]} {i}"
+        foods.append(food)
+    return foods
+
+
+def label_photo(size, mode="RGB", fmt="JPEG"):
+    """A synthetic label photo: dark text lines on a light background, like a phone capture."""
+    from PIL import Image, ImageDraw
+
+    img = Image.new(mode, size, "white")
+    draw = ImageDraw.Draw(img)
+    line_height = max(size[1] // 40, 10)
+    text = load_fixture("ocr_space")["ParsedResults"][0]["ParsedText"].splitlines()
+    for i in range(size[1] // line_height):
+        draw.text((size[0] // 10, i * line_height), text[i % len(text)], fill="black")
+    buf = io.BytesIO()
+    img.save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def run_audit(photo_bytes):
+    """One label audit end to end, the way audit_page and the wizards chain the providers."""
+    import streamlit as st
+    from renal_app.airtable_api import prepare_airtable_record, push_to_airtable
+    from renal_app.gemini_api import analyze_ingredients_for_triggers, extract_label_info_from_ocr
+    from renal_app.logic import get_audit_details, init_comparison_data, update_comparison_data
+    from renal_app.ocr_api import perform_ocr
+    from renal_app.usda_api import fetch_usda_food_details, search_usda_foods, sort_results_by_relevance
+    from renal_app.wizards import prepare_photo
+
+    photo = prepare_photo(io.BytesIO(photo_bytes))
+    label_vals = extract_label_info_from_ocr(perform_ocr(photo))
+
+    query = f"{label_vals.get('Brand', '')} {label_vals.get('Product Name', '')}".strip()
+    foods = sort_results_by_relevance(search_usda_foods(query).get("foods", []), query)
+    fdc_id = foods[0]["fdcId"]
+    st.session_state["selected_fdc_id"] = fdc_id
+    food_details = fetch_usda_food_details(fdc_id, label_vals.get("Serving Size"), label_vals.get("Serving Unit"))
+
+    comparison = update_comparison_data(init_comparison_data(), label_vals, food_details.get("nutrients"))
+    st.session_state["audit_report"] = get_audit_details(comparison)
+    st.session_state["ai_report"] = analyze_ingredients_for_triggers(
+        label_vals.get("Ingredients"), food_details.get("Ingredients")
+    )
+
+    payload = prepare_airtable_record(
+        label_vals.get("Product Name"), label_vals.get("Brand"),
+        label_vals.get("Serving Size"), label_vals.get("Serving Unit"),
+        food_details, label_vals,
+    )
+    push_to_airtable(payload, [photo])
+    return st.session_state["audit_report"]
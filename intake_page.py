@@ -0,0 +1,118 @@
+"""Daily Log page: today's logged items against the daily budgets, and the last week.
+
+Signed-in users' logs are keyed by their email. Without sign-in, the log is
+keyed by a random id kept in the URL (?log=...), and that URL is the only
+credential: anyone who has the link can read and change the log. The page
+says so, so users don't share it as they would a product link.
+"""
+
+import datetime
+import uuid
+
+import pandas as pd
+import streamlit as st
+from renal_app.intake import IntakeLog
+from renal_app.logic import DAILY_BUDGETS
+from renal_app.nutrients import units
+
+INTAKE_DB_PATH = st.secrets.get("INTAKE_DB_PATH", "data/intake.sqlite3")
+HISTORY_DAYS = 7
+
+
+@st.cache_resource
+def get_intake_log():
+    """Opens the intake log once per process; every session shares the connection."""
+    return IntakeLog(INTAKE_DB_PATH)
+
+def current_user_id():
+    """
+    The signed-in user's email, or an anonymous log id kept in the URL (?log=...)
+    so a bookmarked link opens the same log again. Whoever has that URL has the log.
+    """
+    if st.user.get("is_logged_in") and st.user.get("email"):
+        return st.user.email
+    log_id = st.session_state.get("intake_user") or st.query_params.get("log") or uuid.uuid4().hex[:12]
+    st.session_state["intake_user"] = log_id
+    if st.query_params.get("log") != log_id:
+        st.query_params["log"] = log_id
+    return log_id
+
+def daily_budgets():
+    """Budgets of the rule profile chosen on the Audit page (the general renal budgets by default)."""
+    return st.session_state.get("daily_budgets") or DAILY_BUDGETS
+
+def show_add_to_log(product_name, nutrients, fdc_id=None, portion=None):
+    """
+    Servings input and button that log the audited product for today. portion names the
+    amount nutrients are for (e.g. "100 g") when it is not the product's serving; it is
+    shown on the input and kept in the logged item's name.
+    """
+    col1, col2 = st.columns([1, 2], vertical_alignment="bottom")
+    with col1:
+        label = f"Servings (× {portion})" if portion else "Servings"
+        servings = st.number_input(label, min_value=0.25, value=1.0, step=0.25, key="log_servings")
+    with col2:
+        if st.button("➕ Add to Today's Log", width="stretch"):
+            name = f"{product_name} ({portion})" if portion else product_name
+            get_intake_log().add_item(
+                current_user_id(), datetime.date.today(), name, nutrients, servings, fdc_id=fdc_id
+            )
+            amount = f"{servings:g} × {portion}" if portion else f"{servings:g} serving(s)"
+            st.toast(f"Logged {amount} of {product_name}")
+
+def show_budget(totals, budgets):
+    for nutrient, budget in budgets.items():
+        total = totals.get(nutrient, 0.0)
+        unit = units.get(nutrient, "")
+        ratio = total / budget if budget else 0.0
+        icon = "🔴" if ratio > 1 else "🟡" if ratio > 0.8 else "🟢"
+        st.progress(min(ratio, 1.0), text=f"{icon} {nutrient}: {total:.0f} / {budget:g}{unit}")
+
+def intake_page():
+    """Render the Daily Log page"""
+    st.subheader("Daily Log", anchor=False)
+
+    log = get_intake_log()
+    user = current_user_id()
+    if not st.user.get("is_logged_in"):
+        st.caption("🔗 This log is saved under the link in your address bar. Bookmark it to come back, "
+                   "and keep it private: anyone with the link can see and change this log.")
+    day = st.date_input("Day", value=datetime.date.today(), max_value=datetime.date.today())
+
+    budgets = daily_budgets()
+    totals, count = log.day_totals(user, day)
+    with st.container(border=True):
+        st.caption(f"{count} item(s) logged")
+        show_budget(totals, budgets)
+
+    for item in log.items(user, day):
+        col1, col2 = st.columns([4, 1], vertical_alignment="center")
+        with col1:
+            n = item["nutrients"]
+            st.write(f"**{item['name']}** × {item['servings']:g}")
+            st.caption(" | ".join(
+                f"{nutrient} {n[nutrient] * item['servings']:.0f}{units[nutrient]}"
+                for nutrient in budgets
+                if n[nutrient] is not None
+            ))
+        with col2:
+            if st.button("🗑️", key=f"remove_{item['id']}", help="Remove from log"):
+                log.remove_item(user, item["id"])
+                st.rerun()
+
+    # The last week's totals come from one range read of the per-day totals
+    start = day - datetime.timedelta(days=HISTORY_DAYS - 1)
+    history = log.totals_range(user, start, day)
+    if history:
+        st.markdown(f"Last {HISTORY_DAYS} days (% of daily budget)")
+        frame = pd.DataFrame(
+            {
+                nutrient: [100 * day_totals.get(nutrient, 0.0) / budget if budget else 0.0 for _, day_totals, _ in history]
+                for nutrient, budget in budgets.items()
+            },
+            index=[logged_day for logged_day, _, _ in history],
+        )
+        st.bar_chart(frame, stack=False)
+
+    if not count:
+        st.caption("Audit a product and press **Add to Today's Log** to start tracking.")
@@ -1,21 +1,77 @@
+import ast
+import base64
 import json
-import tempfile
 import os
 import io
-from pyairtable import Api
-import requests
+import threading
 import streamlit as st
+from renal_app.nutrients import NutrientVector
+from renal_app.metrics import traced, add_payload, mark_error
+from renal_app.providers import CONFIG
+from renal_app.core import runner
+from renal_app.core import airtable as core_airtable
+from renal_app.core.results import is_rejected
 
-AIRTABLE_API_KEY = st.secrets.get("AIRTABLE_API_KEY")
-AIRTABLE_BASE_ID = st.secrets.get("AIRTABLE_BASE_ID")
-AIRTABLE_TABLE_NAME = st.secrets.get("AIRTABLE_TABLE_NAME")
-AIRTABLE_TABLE_ID = st.secrets.get("AIRTABLE_TABLE_ID")
+AIRTABLE_QUEUE_PATH = st.secrets.get("AIRTABLE_QUEUE_PATH", "data/airtable_queue.jsonl")
+# Entries Airtable rejected outright (e.g. 422 on a field value), kept for a person to fix
+AIRTABLE_DEAD_LETTER_PATH = st.secrets.get("AIRTABLE_DEAD_LETTER_PATH", "data/airtable_dead_letter.jsonl")
+# Entries a flush has taken out of the queue; left behind only if that flush was interrupted
+AIRTABLE_FLUSHING_PATH = f"{AIRTABLE_QUEUE_PATH}.flushing"
+AIRTABLE_FLUSH_BATCH = 3
+LABEL_PHOTO_FIELD = "Label Photo"
 
-def prepare_airtable_record(product, brand, serving_size, unit, usda_data=None, label_data=None, image_bytes=None):
+_queue_lock = threading.Lock()
+# One flush at a time, so two sessions never send the same entries
+_flush_lock = threading.Lock()
+
+def audit_result_text(report, ai_report):
+    """The "Audit Result" column: the flag and discrepancy lists followed by the AI analysis."""
+    return f"{report.get('flags', '')}{report.get('discrepancies', '')}{ai_report}"
+
+def _list_literal_end(text, start):
+    """Index just past the Python list repr starting at text[start], or None."""
+    if text[start:start + 1] != "[":
+        return None
+    depth, quote, i = 0, None, start
+    while i < len(text):
+        char = text[i]
+        if quote:
+            if char == "\\":
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == "[":
+            depth += 1
+        elif char == "]":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return None
+
+def split_audit_result(audit_result):
+    """
+    Inverse of audit_result_text: (flags, discrepancies, AI analysis) of a stored "Audit Result".
+    Text not in that shape is returned whole as the AI analysis, so nothing is lost.
+    """
+    text = audit_result or ""
+    lists, end = [], 0
+    for _ in range(2):
+        start, end = end, _list_literal_end(text, end)
+        if end is None:
+            return [], [], text
+        try:
+            lists.append(list(ast.literal_eval(text[start:end])))
+        except (ValueError, SyntaxError):
+            return [], [], text
+    return lists[0], lists[1], text[end:]
+
+def prepare_airtable_record(product, brand, serving_size, unit, usda_data=None, label_data=None):
     # Ensure we are working with dictionaries even if None is passed
     usda = usda_data if usda_data else {}
     label = label_data if label_data else {}
-    image = image_bytes if image_bytes else None
 
     # This dictionary will not crash because .get() returns None instead of erroring
     record = {
@@ -25,75 +81,147 @@ def prepare_airtable_record(product, brand, serving_size, unit, usda_data=None,
         "Serving Unit": unit,
         "FDC_ID": str(st.session_state.get("selected_fdc_id",{})),
 
-        "Label Protein (g)": label.get("Protein"),
-        "Label Sodium (mg)": label.get("Sodium"),
-        "Label Potassium (mg)": label.get("Potassium"),
-        "Label Phosphorus (mg)": label.get("Phosphorus"),
-        "Label Sugar (g)": label.get("Sugar"),
-        "Label Saturated Fat (g)": label.get("Saturated Fat"),
-        "Label Trans Fat (g)": label.get("Trans Fat"),
-        "Label Calories (kcal)": label.get("Calories"),
         "Label Ingredients": label.get("Ingredients"),
-
-        "USDA Protein (g)": usda.get("nutrients", {}).get("Protein"),
-        "USDA Sodium (mg)": usda.get("nutrients", {}).get("Sodium"),
-        "USDA Potassium (mg)": usda.get("nutrients", {}).get("Potassium"),
-        "USDA Phosphorus (mg)": usda.get("nutrients", {}).get("Phosphorus"),
-        "USDA Sugar (g)": usda.get("nutrients", {}).get("Sugar"),
-        "USDA Saturated Fat (g)": usda.get("nutrients", {}).get("Saturated Fat"),
-        "USDA Trans Fat (g)": usda.get("nutrients", {}).get("Trans Fat"),
-        "USDA Calories (kcal)": usda.get("nutrients", {}).get("Calories"),
         "USDA Ingredients": usda.get("Ingredients"),
-        
+        **NutrientVector.from_mapping(label).to_fields("Label"),
+        **NutrientVector.from_mapping(usda.get("nutrients")).to_fields("USDA"),
+
         # Meta Data
+        "Audit Profile": st.session_state.get("audit_report", {}).get("profile"),
         "Audit Colour": st.session_state.get("audit_report", {}).get("color"),
-        "Audit Result": f"{st.session_state.get('audit_report', {}).get('flags', '')}{st.session_state.get('audit_report', {}).get('discrepancies', '')}{st.session_state.get('ai_report', '')}",
+        "Audit Result": audit_result_text(st.session_state.get("audit_report", {}), st.session_state.get("ai_report", "")),
     }
     
     return record
 
-def push_to_airtable_with_attachment(payload_fields, image_bytes=None):
-    api = Api(AIRTABLE_API_KEY)
-    table = api.table(AIRTABLE_BASE_ID, AIRTABLE_TABLE_ID)
-    
-    # 1. Create the record first (Text/Numbers only)
-    record = table.create(payload_fields)
-    
-    # 2. Upload the attachment using a temporary file
-    if image_bytes:
-        # Create a temporary file that deletes itself after the 'with' block
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-            tmp.write(image_bytes)
-            tmp_path = tmp.name  # This is the actual path on the disk
-        
-        try:
-            # Pass the PATH string to Airtable
-            table.upload_attachment(
-                record["id"], 
-                "Label Photo", 
-                tmp_path
-            )
-        finally:
-            # Clean up: remove the temp file from the server disk
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-    
-    return record
+def _send_entry(entry):
+    """
+    Sends one queue entry. {"fields": ..., "photos": [...]} creates the record and
+    attaches the photos; {"record_id": ..., "photos": [...]} only attaches them.
+    Photos are base64 strings. Returns (left, failure): left is None when done, or
+    what is still left to send, and failure is the ProviderFailure that stopped it.
+    """
+    record_id = entry.get("record_id")
+    if record_id is None:
+        result = runner.run(core_airtable.create_record, CONFIG, entry["fields"])
+        add_payload(result.payload_bytes)
+        if not result.ok:
+            return entry, result.failure
+        record_id = result.value["id"]
 
-def push_to_airtable(record_dict):
-    url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_TABLE_ID}"
-    headers = {
-        "Authorization": f"Bearer {AIRTABLE_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    # Airtable expects a "fields" wrapper around the data
-    payload = {"fields": record_dict}
-    
-    response = requests.post(url, headers=headers, data=json.dumps(payload))
-    
-    if response.status_code == 200:
+    photos = entry.get("photos") or []
+    if not photos:
+        return None, None
+    # All photos go up concurrently right after the record is created
+    files = [(f"label_{i + 1}.jpg", base64.b64decode(photo)) for i, photo in enumerate(photos)]
+    results = runner.run(core_airtable.upload_attachments, CONFIG, record_id, LABEL_PHOTO_FIELD, files)
+    add_payload(sum(result.payload_bytes for result in results))
+    failed = [(photo, result.failure) for photo, result in zip(photos, results) if not result.ok]
+    if not failed:
+        return None, None
+    # A transient failure wins, so photos are only dead-lettered when every one was rejected
+    failure = next((f for _, f in failed if not is_rejected(f)), failed[0][1])
+    return {"record_id": record_id, "photos": [photo for photo, _ in failed]}, failure
+
+def _read_entries(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def _write_entries(path, entries, mode="w"):
+    if not entries:
+        if mode == "w" and os.path.exists(path):
+            os.remove(path)
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, mode, encoding="utf-8") as f:
+        f.writelines(json.dumps(entry, default=str) + "\n" for entry in entries)
+
+def queue_airtable_entry(entry):
+    """Appends an unsent entry to the local queue file, to be sent by flush_airtable_queue."""
+    with _queue_lock:
+        _write_entries(AIRTABLE_QUEUE_PATH, [entry], mode="a")
+
+def dead_letter_airtable_entry(entry, failure):
+    """Sets aside an entry Airtable rejected, with the reason, instead of retrying it forever."""
+    with _queue_lock:
+        _write_entries(AIRTABLE_DEAD_LETTER_PATH, [{**entry, "error": failure.to_dict()}], mode="a")
+
+def _count_entries(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+def queued_airtable_records():
+    with _queue_lock:
+        return _count_entries(AIRTABLE_QUEUE_PATH) + _count_entries(AIRTABLE_FLUSHING_PATH)
+
+def dead_letter_airtable_records():
+    with _queue_lock:
+        return _count_entries(AIRTABLE_DEAD_LETTER_PATH)
+
+def flush_airtable_queue(max_records=None):
+    """
+    Sends queued entries while Airtable's budget allows, keeping the rest queued.
+    Entries Airtable rejects are moved to the dead-letter file and the rest keep
+    draining; a rate limit or outage stops the flush. Returns the number of entries completed.
+    """
+    if not _flush_lock.acquire(blocking=False):
+        # Another session is already draining the queue
+        return 0
+    try:
+        # Take the entries out under the lock and send without it, so other sessions can keep queueing
+        with _queue_lock:
+            pending = _read_entries(AIRTABLE_FLUSHING_PATH) + _read_entries(AIRTABLE_QUEUE_PATH)
+            if not pending:
+                return 0
+            _write_entries(AIRTABLE_FLUSHING_PATH, pending)
+            _write_entries(AIRTABLE_QUEUE_PATH, [])
+
+        sent, rejected = 0, []
+        while pending and (max_records is None or sent < max_records):
+            entry = pending[0]
+            # Entries queued before photos were supported are bare field dicts
+            if "fields" not in entry and "record_id" not in entry:
+                entry = {"fields": entry}
+            left, failure = _send_entry(entry)
+            if left is None:
+                sent += 1
+            elif is_rejected(failure):
+                rejected.append({**left, "error": failure.to_dict()})
+            else:
+                pending[0] = left
+                break
+            pending.pop(0)
+
+        with _queue_lock:
+            # Entries queued during the flush go after the ones still unsent
+            _write_entries(AIRTABLE_QUEUE_PATH, pending + _read_entries(AIRTABLE_QUEUE_PATH))
+            _write_entries(AIRTABLE_DEAD_LETTER_PATH, rejected, mode="a")
+            _write_entries(AIRTABLE_FLUSHING_PATH, [])
+        return sent
+    finally:
+        _flush_lock.release()
+
+@traced("airtable", "create")
+def push_to_airtable(record_dict, photos=None):
+    """
+    Creates the audit record in Airtable and attaches the label photos to it.
+    If Airtable is over its rate limit or its circuit is open, whatever was not
+    sent is queued locally instead and False is returned. An entry Airtable
+    rejects goes to the dead-letter file rather than the queue.
+    """
+    entry = {"fields": record_dict, "photos": [base64.b64encode(photo).decode("ascii") for photo in photos or []]}
+    left, failure = _send_entry(entry)
+    if left is None:
+        # Airtable is healthy again, so drain a few queued records
+        flush_airtable_queue(max_records=AIRTABLE_FLUSH_BATCH)
         return True
+    mark_error()
+    if is_rejected(failure):
+        dead_letter_airtable_entry(left, failure)
     else:
-        return False
-
+        queue_airtable_entry(left)
+    return False
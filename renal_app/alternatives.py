@@ -0,0 +1,89 @@
+"""Safer-alternative recommendations over the precomputed renal profile table."""
+
+import numpy as np
+from rapidfuzz import fuzz
+
+from renal_app.logic import CRITICAL_NUTRIENTS
+from renal_app.nutrients import NUTRIENT_INDEX
+from renal_app.profiles import find_profile, profile_text
+
+# An alternative must be under SAFETY_LIMITS (per 100g) for all of these
+RENAL_KEY_NUTRIENTS = ["Sodium", "Potassium", "Phosphorus"]
+
+_KEY_COLUMNS = [CRITICAL_NUTRIENTS.index(name) for name in RENAL_KEY_NUTRIENTS]
+
+
+def build_alternatives_index(profiles):
+    """
+    Prebuilds the normalized nutrient matrix and per-category lists of safe rows.
+    Items with a missing sodium, potassium or phosphorus value are never recommended.
+    """
+    nutrients = np.nan_to_num(np.asarray(profiles["nutrients"], dtype=np.float32))
+    scale = nutrients.std(axis=0)
+    scale[scale == 0] = 1.0
+
+    key_ratios = np.asarray(profiles["limit_ratio"])[:, _KEY_COLUMNS]
+    safe = np.all(key_ratios < 1.0, axis=1)  # NaN compares False, so unknowns drop out
+
+    row_count = len(profiles["fdc_id"])
+    categories = [profile_text(profiles, row, "category") for row in range(row_count)]
+    names, category_codes = np.unique(np.array(categories, dtype=object), return_inverse=True)
+
+    safe_rows = np.flatnonzero(safe)
+    by_category = {
+        code: safe_rows[category_codes[safe_rows] == code]
+        for code in range(len(names))
+    }
+
+    return {
+        "profiles": profiles,
+        "vectors": nutrients / scale,
+        "category_codes": category_codes,
+        "safe_rows": safe_rows,
+        "safe_by_category": by_category,
+    }
+
+
+def find_safer_alternatives(index, fdc_id, k=5, shortlist=200):
+    """
+    Returns up to k safe products similar to fdc_id, best match first.
+    Candidates come from the same food category (or the whole catalogue if that
+    category has none), are shortlisted by nutrient distance, then re-ranked by
+    fuzzy description match.
+    """
+    profiles = index["profiles"]
+    row = find_profile(profiles, fdc_id)
+    if row is None:
+        return []
+
+    candidates = index["safe_by_category"].get(index["category_codes"][row])
+    if candidates is None or len(candidates) == 0:
+        candidates = index["safe_rows"]
+    candidates = candidates[candidates != row]
+    if len(candidates) == 0:
+        return []
+
+    distances = np.linalg.norm(index["vectors"][candidates] - index["vectors"][row], axis=1)
+    if len(candidates) > shortlist:
+        nearest = np.argpartition(distances, shortlist)[:shortlist]
+        candidates, distances = candidates[nearest], distances[nearest]
+
+    description = profile_text(profiles, row, "description").lower()
+    results = []
+    for candidate, distance in zip(candidates, distances):
+        candidate_desc = profile_text(profiles, candidate, "description")
+        text_score = fuzz.token_set_ratio(description, candidate_desc.lower()) / 100
+        nutrients = profiles["nutrients"][candidate]
+        results.append({
+            "fdc_id": int(profiles["fdc_id"][candidate]),
+            "description": candidate_desc,
+            "brand": profile_text(profiles, candidate, "brand"),
+            "nutrients": {
+                name: float(nutrients[NUTRIENT_INDEX[name]])
+                for name in RENAL_KEY_NUTRIENTS
+            },
+            "score": (text_score * 0.5) + (0.5 / (1.0 + float(distance))),
+        })
+
+    results.sort(key=lambda x: x["score"], reverse=True)
+    return results[:k]
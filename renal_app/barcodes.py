@@ -0,0 +1,139 @@
+"""Barcode (UPC/EAN/GTIN) decoding and a GTIN -> FDC ID index.
+
+Branded FDC records carry the package barcode in `gtinUpc`, stored
+inconsistently as 12-digit UPC-A, 13-digit EAN or zero-padded GTIN-14.
+Every code is normalized to its integer value (so leading zeros and the
+UPC-A/EAN-13/GTIN-14 forms of one product compare equal) after checking its
+check digit; UPC-E is expanded to UPC-A first.
+
+Decoding uses zxing-cpp or, failing that, zbar (pyzbar) when either is
+installed; without a decoder `decode_barcodes` returns no codes.
+"""
+
+import io
+import json
+import os
+import threading
+
+from PIL import Image
+
+try:
+    import zxingcpp
+except ImportError:  # Barcode decoding is optional
+    zxingcpp = None
+
+try:
+    from pyzbar import pyzbar
+except ImportError:
+    pyzbar = None
+
+GTIN_LENGTHS = (8, 12, 13, 14)
+
+
+def decoder_available():
+    return zxingcpp is not None or pyzbar is not None
+
+
+def check_digit_ok(digits):
+    """GS1 mod-10 check: weights 3 and 1 alternate leftwards from the digit before the check digit."""
+    body, check = digits[:-1], int(digits[-1])
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(body)))
+    return (10 - total % 10) % 10 == check
+
+
+def expand_upc_e(digits):
+    """The 12-digit UPC-A for an 8-digit UPC-E code (number system, 6 digits, check)."""
+    system, d, check = digits[0], digits[1:7], digits[7]
+    last = d[5]
+    if last in "012":
+        middle = d[0:2] + last + "0000" + d[2:5]
+    elif last == "3":
+        middle = d[0:3] + "00000" + d[3:5]
+    elif last == "4":
+        middle = d[0:4] + "00000" + d[4]
+    else:
+        middle = d[0:5] + "0000" + last
+    return system + middle + check
+
+
+def normalize_gtin(code, upc_e=False):
+    """
+    The integer GTIN for a scanned or stored code, or None if it is not a valid GTIN.
+    Pass upc_e=True for codes the decoder reported as UPC-E.
+    """
+    digits = "".join(ch for ch in str(code or "") if ch.isdigit())
+    if upc_e and len(digits) == 8:
+        digits = expand_upc_e(digits)
+    if len(digits) not in GTIN_LENGTHS or not check_digit_ok(digits):
+        return None
+    gtin = int(digits)
+    return gtin or None
+
+
+def gtin_text(gtin):
+    """Display / search form: at least 12 digits, as printed under a UPC-A barcode."""
+    return f"{gtin:012d}"
+
+
+def _decode_zxing(image):
+    return [
+        (result.text, "UPC-E" in str(result.format) or "UPCE" in str(result.format))
+        for result in zxingcpp.read_barcodes(image)
+    ]
+
+
+def _decode_zbar(image):
+    return [(result.data.decode("ascii", "ignore"), result.type == "UPCE") for result in pyzbar.decode(image)]
+
+
+def decode_barcodes(image_bytes):
+    """Distinct valid GTINs found in the photo, in the order the decoder reported them."""
+    if not decoder_available():
+        return []
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        image = img.convert("L")
+    raw = _decode_zxing(image) if zxingcpp is not None else _decode_zbar(image)
+    gtins = (normalize_gtin(text, upc_e=is_upc_e) for text, is_upc_e in raw)
+    return list(dict.fromkeys(gtin for gtin in gtins if gtin))
+
+
+class GtinIndex:
+    """GTIN -> FDC item learned from USDA search results, backed by an append-only JSONL file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.items = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.items[entry["gtin"]] = entry
+
+    def get(self, gtin):
+        return self.items.get(gtin)
+
+    def add_foods(self, foods):
+        """Records every branded food with a valid gtinUpc that is not indexed yet."""
+        new = []
+        for food in foods:
+            gtin = normalize_gtin(food.get("gtinUpc"))
+            if gtin is None or food.get("fdcId") is None or gtin in self.items:
+                continue
+            new.append({
+                "gtin": gtin,
+                "fdc_id": int(food["fdcId"]),
+                "description": food.get("description") or "",
+                "brand": food.get("brandName") or food.get("brandOwner") or "",
+            })
+        if not new:
+            return 0
+        with self._lock:
+            new = [entry for entry in new if entry["gtin"] not in self.items]
+            for entry in new:
+                self.items[entry["gtin"]] = entry
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(entry) + "\n" for entry in new)
+        return len(new)
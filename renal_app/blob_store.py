@@ -0,0 +1,103 @@
+"""Content-addressed store for large session blobs (label photos).
+
+Sessions keep only the SHA-256 digest of a blob in st.session_state; the
+bytes live once per server process in files named by digest, however many
+sessions uploaded the same photo. Each blob tracks the sessions (owners)
+that reference it and is deleted when the last one releases it, so a
+session that ends can give back its blobs with `release_owner`.
+
+Each process writes to its own subdirectory of the configured path, removed
+when the process exits, so servers sharing the path never touch each
+other's blobs.
+"""
+
+import atexit
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+
+class BlobStore:
+    """Blobs on disk, reference-counted by owner in memory."""
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=f"{os.getpid()}-", dir=path)
+        atexit.register(shutil.rmtree, self.path, ignore_errors=True)
+        self._lock = threading.Lock()
+        self._owners = {}   # digest -> set of owner ids
+        self._sizes = {}    # digest -> byte length
+
+    def _file(self, digest):
+        return os.path.join(self.path, digest)
+
+    def put(self, data, owner):
+        """Stores data (once per distinct content) for owner and returns its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if digest not in self._sizes:
+                tmp = f"{self._file(digest)}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, self._file(digest))
+                self._sizes[digest] = len(data)
+            self._owners.setdefault(digest, set()).add(owner)
+        return digest
+
+    def get(self, digest):
+        """The blob's bytes, or None if it has been released."""
+        try:
+            with open(self._file(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _drop(self, digest, owner):
+        owners = self._owners.get(digest)
+        if owners is None:
+            return
+        owners.discard(owner)
+        if not owners:
+            del self._owners[digest]
+            del self._sizes[digest]
+            try:
+                os.remove(self._file(digest))
+            except FileNotFoundError:
+                pass
+
+    def release(self, digests, owner):
+        """Drops owner's references to these blobs, deleting any nobody else references."""
+        with self._lock:
+            for digest in digests:
+                self._drop(digest, owner)
+
+    def release_owner(self, owner):
+        """Drops every reference owner holds; returns the number of blobs released."""
+        with self._lock:
+            held = [digest for digest, owners in self._owners.items() if owner in owners]
+            for digest in held:
+                self._drop(digest, owner)
+        return len(held)
+
+    def owners(self):
+        with self._lock:
+            return set().union(*self._owners.values()) if self._owners else set()
+
+    def owner_bytes(self):
+        """{owner: bytes of the blobs it references} (shared blobs count for each owner)."""
+        with self._lock:
+            totals = {}
+            for digest, owners in self._owners.items():
+                for owner in owners:
+                    totals[owner] = totals.get(owner, 0) + self._sizes[digest]
+            return totals
+
+    def stats(self):
+        with self._lock:
+            return {
+                "blobs": len(self._sizes),
+                "bytes": sum(self._sizes.values()),
+                "references": sum(len(owners) for owners in self._owners.values()),
+            }
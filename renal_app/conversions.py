@@ -0,0 +1,157 @@
+"""Serving-size unit conversion for scaling USDA per-100 values to a label serving."""
+
+import re
+from fractions import Fraction
+
+MASS_TO_GRAMS = {"g": 1.0, "mg": 0.001, "kg": 1000.0, "oz": 28.3495, "lb": 453.592}
+
+VOLUME_TO_ML = {
+    "ml": 1.0,
+    "l": 1000.0,
+    "tsp": 4.92892,
+    "tbsp": 14.7868,
+    "fl oz": 29.5735,
+    "cup": 236.588,
+}
+
+UNIT_ALIASES = {
+    "gram": "g", "grams": "g", "grm": "g", "gm": "g", "gr": "g",
+    "milligram": "mg", "mgm": "mg",
+    "kilogram": "kg",
+    "ounce": "oz", "onz": "oz",
+    "pound": "lb", "lbs": "lb",
+    "milliliter": "ml", "millilitre": "ml", "mlt": "ml",
+    "liter": "l", "litre": "l", "ltr": "l",
+    "teaspoon": "tsp", "tablespoon": "tbsp", "tbs": "tbsp",
+    "fluid ounce": "fl oz", "fl. oz": "fl oz", "floz": "fl oz",
+}
+
+_HOUSEHOLD = re.compile(r"^\s*(\d+\s+\d+/\d+|\d+/\d+|\d*\.?\d+)\s*([a-zA-Z][a-zA-Z .]*)")
+
+
+def normalize_unit(unit):
+    """Lower-cases a unit and maps spellings/plurals to one key ("Cups" -> "cup")."""
+    if not unit:
+        return ""
+    unit = re.sub(r"\s+", " ", str(unit).strip().lower().rstrip("."))
+    unit = re.sub(r"\s*\(.*\)$", "", unit)
+    if unit in UNIT_ALIASES:
+        return UNIT_ALIASES[unit]
+    if unit in MASS_TO_GRAMS or unit in VOLUME_TO_ML:
+        return unit
+    singular = unit[:-2] if unit.endswith("ches") else unit[:-1] if unit.endswith("s") else unit
+    return UNIT_ALIASES.get(singular, singular)
+
+
+def _parse_amount(text):
+    return float(sum(Fraction(part) for part in text.split()))
+
+
+def parse_household_serving(text):
+    """Splits household text such as "1 1/2 cups (240 ml)" into (1.5, "cup")."""
+    match = _HOUSEHOLD.match(text or "")
+    if not match:
+        return None, ""
+    try:
+        amount = _parse_amount(match.group(1))
+    except (ValueError, ZeroDivisionError):
+        return None, ""
+    return amount, normalize_unit(match.group(2))
+
+
+def base_unit(food=None):
+    """The unit an FDC item's per-100 values are in: "ml" when its servingSizeUnit is a volume, else "g"."""
+    return "ml" if normalize_unit((food or {}).get("servingSizeUnit")) in VOLUME_TO_ML else "g"
+
+
+def rebase_factors(factors, base):
+    """
+    Re-expresses conversion factors in another base unit ("g" or "ml"), or returns
+    None when the item has no density to cross between mass and volume.
+    """
+    per_base = factors.get(base)
+    if not per_base:
+        return None
+    return {unit: per_unit / per_base for unit, per_unit in factors.items()}
+
+
+def _in_base(amount, unit, base, density):
+    """An amount in unit ("g" or "ml") expressed in base, crossing by density (g per mL); None if unknown."""
+    if unit == base:
+        return amount
+    if not density:
+        return None
+    return amount * density if base == "g" else amount / density
+
+
+def conversion_factors(food=None, base=None):
+    """
+    Returns {unit: base units per 1 unit} for one FDC item.
+    The base unit is what the USDA per-100 values are expressed in: grams, or mL for
+    branded items whose servingSizeUnit is a volume (base overrides it when there is
+    no payload to tell, e.g. for the profile table). Household servings and
+    foodPortions add item-specific units (cup, piece, slice...) and a density that
+    lets mass and volume units convert into each other.
+    """
+    food = food or {}
+    base = base or base_unit(food)
+    table = MASS_TO_GRAMS if base == "g" else VOLUME_TO_ML
+    factors = dict(table)
+
+    # Portions are (unit, amount per unit, the unit that amount is in)
+    portions = []
+    # Branded: "servingSize": 240, "servingSizeUnit": "g", "householdServingFullText": "1 cup"
+    serving_size = food.get("servingSize")
+    amount, unit = parse_household_serving(food.get("householdServingFullText"))
+    if serving_size and amount and unit:
+        portions.append((unit, serving_size / amount, base))
+
+    # Foundation/SR/Survey: "foodPortions": [{"amount": 1, "gramWeight": 244, "measureUnit": {...}}]
+    # Their weights are grams whatever the base, so mL-based items convert them through the density
+    for portion in food.get("foodPortions") or []:
+        grams = portion.get("gramWeight")
+        if not grams:
+            continue
+        unit = normalize_unit((portion.get("measureUnit") or {}).get("name"))
+        amount = portion.get("amount") or 1
+        if not unit or unit == "undetermined":
+            amount, unit = parse_household_serving(portion.get("portionDescription") or portion.get("modifier"))
+        if amount and unit:
+            portions.append((unit, grams / amount, "g"))
+
+    # A volume portion weighed in grams (or a mass portion measured in mL) gives the density
+    density = None
+    for unit, per_unit, measured in portions:
+        if measured == "g" and unit in VOLUME_TO_ML:
+            density = per_unit / VOLUME_TO_ML[unit]
+        elif measured == "ml" and unit in MASS_TO_GRAMS:
+            density = MASS_TO_GRAMS[unit] / per_unit
+        if density:
+            break
+
+    for unit, per_unit, measured in portions:
+        per_base = _in_base(per_unit, measured, base, density)
+        if per_base is None:
+            continue
+        factors.setdefault(unit, per_base)
+        # "large egg" should also answer a label that just says "egg"
+        factors.setdefault(unit.split(" ")[-1], per_base)
+
+    # The density also crosses between the two tables
+    if density:
+        other, measured = (VOLUME_TO_ML, "ml") if base == "g" else (MASS_TO_GRAMS, "g")
+        for other_unit, size in other.items():
+            factors.setdefault(other_unit, _in_base(size, measured, base, density))
+
+    return factors
+
+
+def to_base_amount(serving_size, serving_unit, factors):
+    """Converts a label serving to base units, or None if the unit is not known for this item."""
+    if serving_size is None:
+        return None
+    unit = normalize_unit(serving_unit) or "g"
+    factor = factors.get(unit)
+    if factor is None:
+        return None
+    return serving_size * factor
@@ -0,0 +1,153 @@
+"""Async Airtable writes."""
+
+import asyncio
+import base64
+import json
+
+from renal_app import quota
+from renal_app.core.http import acquire_key, send
+from renal_app.core.results import CONFIG, PARSE, ProviderResult
+
+AIRTABLE_URL = "https://api.airtable.com/v0/{}/{}"
+AIRTABLE_UPLOAD_URL = "https://content.airtable.com/v0/{}/{}/{}/uploadAttachment"
+# Airtable answers 429 with a 30 second penalty when the 5 req/s limit is exceeded
+AIRTABLE_RATE_PENALTY = 30
+# Most records one list page returns / one update request may change
+AIRTABLE_PAGE_SIZE = 100
+AIRTABLE_BATCH_SIZE = 10
+
+
+def _read_json(response, sent_bytes=0):
+    """
+    The body of a 2xx response as (data, None), or (None, failed result) when it is not
+    JSON (e.g. a proxy's error page), recording either outcome with the quota manager.
+    """
+    try:
+        data = response.json()
+    except ValueError as e:
+        quota.record_failure("airtable", e)
+        return None, ProviderResult.failed("airtable", PARSE, f"Invalid JSON: {e}",
+                                           payload_bytes=sent_bytes + len(response.content))
+    quota.record_success("airtable", response.headers)
+    return data, None
+
+
+async def create_record(client, config, fields):
+    """Creates one record; value is the created record's JSON."""
+    if not (config.airtable_key and config.airtable_base_id and config.airtable_table_id):
+        return ProviderResult.failed("airtable", CONFIG, "Airtable key, base or table is not set.")
+    _, refused = acquire_key("airtable")
+    if refused:
+        return refused
+
+    # Airtable expects a "fields" wrapper around the data
+    data = json.dumps({"fields": fields}, default=str)
+    headers = {
+        "Authorization": f"Bearer {config.airtable_key}",
+        "Content-Type": "application/json",
+    }
+    response, failed = await send(client, "airtable", "POST",
+                                  AIRTABLE_URL.format(config.airtable_base_id, config.airtable_table_id),
+                                  sent_bytes=len(data), penalty=AIRTABLE_RATE_PENALTY,
+                                  timeout=config.timeouts["airtable"], headers=headers, content=data)
+    if failed:
+        return failed
+    value, failed = _read_json(response, len(data))
+    if failed:
+        return failed
+    return ProviderResult("airtable", value, payload_bytes=len(data) + len(response.content))
+
+
+async def upload_attachment(client, config, record_id, field, content, filename, content_type="image/jpeg"):
+    """Uploads one file (up to 5 MB) straight into an attachment field of an existing record."""
+    if not (config.airtable_key and config.airtable_base_id):
+        return ProviderResult.failed("airtable", CONFIG, "Airtable key or base is not set.")
+    _, refused = acquire_key("airtable")
+    if refused:
+        return refused
+
+    data = json.dumps({
+        "contentType": content_type,
+        "file": base64.b64encode(content).decode("ascii"),
+        "filename": filename,
+    })
+    headers = {
+        "Authorization": f"Bearer {config.airtable_key}",
+        "Content-Type": "application/json",
+    }
+    response, failed = await send(client, "airtable", "POST",
+                                  AIRTABLE_UPLOAD_URL.format(config.airtable_base_id, record_id, field),
+                                  sent_bytes=len(data), penalty=AIRTABLE_RATE_PENALTY,
+                                  timeout=config.timeouts["airtable"], headers=headers, content=data)
+    if failed:
+        return failed
+    value, failed = _read_json(response, len(data))
+    if failed:
+        return failed
+    return ProviderResult("airtable", value, payload_bytes=len(data) + len(response.content))
+
+
+async def upload_attachments(client, config, record_id, field, files):
+    """
+    Uploads [(filename, content), ...] to one record concurrently.
+    Returns one ProviderResult per file, in order.
+    """
+    return await asyncio.gather(*(
+        upload_attachment(client, config, record_id, field, content, filename)
+        for filename, content in files
+    ))
+
+
+async def list_records(client, config, offset=None, fields=(), page_size=AIRTABLE_PAGE_SIZE):
+    """
+    One page of records, optionally only the given fields.
+    value is {"records": [...], "offset": token for the next page, or None on the last page}.
+    """
+    if not (config.airtable_key and config.airtable_base_id and config.airtable_table_id):
+        return ProviderResult.failed("airtable", CONFIG, "Airtable key, base or table is not set.")
+    _, refused = acquire_key("airtable")
+    if refused:
+        return refused
+
+    params = [("pageSize", page_size), *(("fields[]", field) for field in fields)]
+    if offset:
+        params.append(("offset", offset))
+    headers = {"Authorization": f"Bearer {config.airtable_key}"}
+    response, failed = await send(client, "airtable", "GET",
+                                  AIRTABLE_URL.format(config.airtable_base_id, config.airtable_table_id),
+                                  penalty=AIRTABLE_RATE_PENALTY, timeout=config.timeouts["airtable"],
+                                  headers=headers, params=params)
+    if failed:
+        return failed
+    data, failed = _read_json(response)
+    if failed:
+        return failed
+    page = {"records": data.get("records", []), "offset": data.get("offset")}
+    return ProviderResult("airtable", page, payload_bytes=len(response.content))
+
+
+async def update_records(client, config, records):
+    """Updates up to AIRTABLE_BATCH_SIZE records ([{"id": ..., "fields": {...}}]) in one PATCH."""
+    if not (config.airtable_key and config.airtable_base_id and config.airtable_table_id):
+        return ProviderResult.failed("airtable", CONFIG, "Airtable key, base or table is not set.")
+    if len(records) > AIRTABLE_BATCH_SIZE:
+        raise ValueError(f"Airtable updates at most {AIRTABLE_BATCH_SIZE} records per request")
+    _, refused = acquire_key("airtable")
+    if refused:
+        return refused
+
+    data = json.dumps({"records": records}, default=str)
+    headers = {
+        "Authorization": f"Bearer {config.airtable_key}",
+        "Content-Type": "application/json",
+    }
+    response, failed = await send(client, "airtable", "PATCH",
+                                  AIRTABLE_URL.format(config.airtable_base_id, config.airtable_table_id),
+                                  sent_bytes=len(data), penalty=AIRTABLE_RATE_PENALTY,
+                                  timeout=config.timeouts["airtable"], headers=headers, content=data)
+    if failed:
+        return failed
+    value, failed = _read_json(response, len(data))
+    if failed:
+        return failed
+    return ProviderResult("airtable", value, payload_bytes=len(data) + len(response.content))
@@ -0,0 +1,29 @@
+"""Injected provider configuration for the async core (no Streamlit, no environment reads)."""
+
+from renal_app import quota
+
+
+class ProviderConfig:
+    __slots__ = (
+        "usda_keys", "ocr_keys", "gemini_key", "gemini_model",
+        "airtable_key", "airtable_base_id", "airtable_table_id", "timeouts",
+    )
+
+    DEFAULT_TIMEOUTS = {"usda": 10.0, "ocr_space": 20.0, "gemini": 30.0, "airtable": 10.0}
+
+    def __init__(self, usda_keys=(), ocr_keys=(), gemini_key=None, gemini_model="gemini-2.5-flash-lite",
+                 airtable_key=None, airtable_base_id=None, airtable_table_id=None, timeouts=None):
+        self.usda_keys = [key for key in usda_keys if key]
+        self.ocr_keys = [key for key in ocr_keys if key]
+        self.gemini_key = gemini_key
+        self.gemini_model = gemini_model
+        self.airtable_key = airtable_key
+        self.airtable_base_id = airtable_base_id
+        self.airtable_table_id = airtable_table_id
+        self.timeouts = {**self.DEFAULT_TIMEOUTS, **(timeouts or {})}
+
+    def register_keys(self):
+        """Hands the key pools to the quota manager so calls rotate across them."""
+        quota.register_keys("usda", self.usda_keys)
+        quota.register_keys("ocr_space", self.ocr_keys)
+        return self
@@ -0,0 +1,106 @@
+"""Async Gemini calls over the REST generateContent endpoint."""
+
+import json
+import re
+
+from renal_app import quota
+from renal_app.core.http import acquire_key, send
+from renal_app.core.results import CONFIG, PARSE, ProviderResult
+
+GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/{}:generateContent"
+
+# Prompts are kept short: every instruction token is paid on every call.
+# The OCR text arrives pre-trimmed (label_parser.trim_ocr_text) and the
+# ingredients deduplicated (logic.merge_ingredients).
+EXTRACT_PROMPT = """You are a data extraction expert. From the nutrition label OCR text below, return one JSON object with only these keys:
+"Product Name", "Brand", "Serving Size", "Serving Unit", "Protein", "Sodium", "Potassium", "Phosphorus", "Sugar", "Calories", "Saturated Fat", "Trans Fat", "Ingredients".
+- Nutrients as plain numbers without units; null when missing.
+- Serving size in g or mL if possible.
+- Ingredients as the full comma-separated list.
+- Fix OCR typos (S0dium -> Sodium). Capitalize only the first letter of Product Name and Brand.
+Return only the JSON object.
+
+OCR TEXT:
+{ocr_text}"""
+
+TRIGGERS_PROMPT = """You are a clinical renal dietitian and gout specialist. Find these hidden triggers in the ingredients below:
+1. Phosphorus additives ('phos', e.g. Sodium Tripolyphosphate, Phosphoric Acid).
+2. Gout triggers: high-purine items (Yeast Extract, Organ Meats, Anchovies) and High Fructose Corn Syrup.
+3. Potassium salts used as salt substitutes (e.g. Potassium Chloride).
+4. Inflammatory fats (trans fats, hydrogenated oils, lard).
+Return only a JSON list of short warnings, e.g. ["Contains Phosphoric Acid (Hidden Phosphorus)"], or None if there are none.
+
+INGREDIENTS:
+{ingredients}"""
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token) for responses without usageMetadata."""
+    return max(1, len(text) // 4) if text else 0
+
+
+async def generate(client, config, prompt):
+    """Raw response text for one prompt."""
+    if not config.gemini_key:
+        return ProviderResult.failed("gemini", CONFIG, "GEMINI_API_KEY is not set.")
+    _, refused = acquire_key("gemini")
+    if refused:
+        return refused
+
+    body = {"contents": [{"parts": [{"text": prompt}]}]}
+    response, failed = await send(client, "gemini", "POST", GEMINI_URL.format(config.gemini_model),
+                                  sent_bytes=len(prompt), timeout=config.timeouts["gemini"],
+                                  headers={"x-goog-api-key": config.gemini_key}, json=body)
+    if failed:
+        return failed
+
+    payload_bytes = len(prompt) + len(response.content)
+    # Gemini answered, so the breaker counts a success even when the content is unusable
+    # (a safety block or empty candidates): that is about this prompt, not the provider
+    quota.record_success("gemini", response.headers)
+    try:
+        data = response.json()
+        text = data["candidates"][0]["content"]["parts"][0]["text"]
+    except (ValueError, KeyError, IndexError) as e:
+        return ProviderResult.failed("gemini", PARSE, f"No text in response: {e!r}", payload_bytes=payload_bytes)
+    usage = data.get("usageMetadata") or {}
+    return ProviderResult(
+        "gemini", text, payload_bytes=payload_bytes,
+        prompt_tokens=usage.get("promptTokenCount") or estimate_tokens(prompt),
+        # Thinking tokens are billed as output too
+        response_tokens=(usage.get("candidatesTokenCount") or estimate_tokens(text)) + (usage.get("thoughtsTokenCount") or 0),
+    )
+
+
+def _failed_parse(result, message):
+    """A PARSE failure that still carries the tokens the call used."""
+    failed = ProviderResult.failed("gemini", PARSE, message, payload_bytes=result.payload_bytes)
+    failed.prompt_tokens, failed.response_tokens = result.prompt_tokens, result.response_tokens
+    return failed
+
+
+async def extract_label_info(client, config, ocr_text):
+    """Label fields as a dict (the keys listed in EXTRACT_PROMPT) from raw OCR text."""
+    result = await generate(client, config, EXTRACT_PROMPT.format(ocr_text=ocr_text))
+    if not result.ok:
+        return result
+    try:
+        # Clean the response text to ensure it's valid JSON
+        result.value = json.loads(re.search(r"\{.*\}", result.value, re.DOTALL).group())
+    except (AttributeError, ValueError) as e:
+        return _failed_parse(result, f"Unreadable extraction response: {e}")
+    return result
+
+
+async def analyze_triggers(client, config, ingredients):
+    """A list of short trigger warnings for the ingredient text, or None if there are none."""
+    result = await generate(client, config, TRIGGERS_PROMPT.format(ingredients=ingredients))
+    if not result.ok:
+        return result
+    # Extract JSON from the response text (cleaning up any markdown code blocks)
+    match = re.search(r"\[.*\]", result.value, re.DOTALL)
+    try:
+        result.value = json.loads(match.group()) if match else None
+    except ValueError as e:
+        return _failed_parse(result, f"Unreadable trigger response: {e}")
+    return result
@@ -0,0 +1,58 @@
+"""Shared request plumbing: key selection, quota accounting and error mapping."""
+
+import httpx
+
+from renal_app import quota
+from renal_app.core.results import CONFIG, HTTP, NETWORK, QUOTA, RATE_LIMITED, ProviderResult
+
+
+def acquire_key(provider, keys=()):
+    """
+    Picks the least-loaded key through the quota manager.
+    Returns (key, None), or (None, failed result) when every key is refused or the
+    chosen key is not among keys.
+    """
+    try:
+        key = quota.acquire(provider)
+    except quota.ProviderError as e:
+        return None, ProviderResult.failed(provider, QUOTA, str(e))
+    if key is None:
+        # Providers without a key pool share one budget, whichever key is sent
+        return (keys[0] if keys else None), None
+    if keys and key not in keys:
+        # Sending another key would spend a budget the quota manager did not charge
+        return None, ProviderResult.failed(provider, CONFIG, f"{provider} key chosen by the quota manager is not configured.")
+    return key, None
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+async def send(client, provider, method, url, key=None, sent_bytes=0, penalty=None, **kwargs):
+    """
+    Sends one request and records transport and HTTP failures against key.
+    Returns (response, None) for a 2xx response, which the caller still has to
+    report with quota.record_success/record_failure once it has read the body,
+    or (None, failed result). penalty is the cooldown for a 429 without Retry-After.
+    """
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError as e:
+        quota.record_failure(provider, e, key=key)
+        return None, ProviderResult.failed(provider, NETWORK, f"{type(e).__name__}: {e}", payload_bytes=sent_bytes)
+
+    payload_bytes = sent_bytes + len(response.content)
+    if response.status_code >= 400:
+        retry_after = _retry_after(response) or (penalty if response.status_code == 429 else None)
+        quota.record_failure(provider, f"HTTP {response.status_code}", status_code=response.status_code,
+                             headers=response.headers, retry_after=retry_after, key=key)
+        kind = RATE_LIMITED if response.status_code == 429 else HTTP
+        return None, ProviderResult.failed(
+            provider, kind, f"HTTP {response.status_code}: {response.text[:200]}", payload_bytes=payload_bytes,
+            status_code=response.status_code, retry_after=retry_after,
+        )
+    return response, None
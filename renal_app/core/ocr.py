@@ -0,0 +1,50 @@
+"""Async OCR.space calls."""
+
+from renal_app import quota
+from renal_app.core.http import acquire_key, send
+from renal_app.core.results import CONFIG, PARSE, PROVIDER, ProviderResult
+
+OCR_URL = "https://api.ocr.space/parse/image"
+
+
+async def read_text(client, config, image_bytes):
+    """Detected text for a JPEG label photo."""
+    if not config.ocr_keys:
+        return ProviderResult.failed("ocr_space", CONFIG, "OCR_API_KEY is not set.")
+    key, refused = acquire_key("ocr_space", config.ocr_keys)
+    if refused:
+        return refused
+
+    data = {
+        "apikey": key,
+        "language": "eng",        # You can change to 'fre' for French
+        "isOverlayRequired": "false",
+        "FileType": "JPG",
+        "OCREngine": "2",         # Engine 2 is better for tables/labels
+    }
+    files = {"screenshot": ("image.jpg", image_bytes, "image/jpeg")}
+    response, failed = await send(client, "ocr_space", "POST", OCR_URL, key=key, sent_bytes=len(image_bytes),
+                                  timeout=config.timeouts["ocr_space"], data=data, files=files)
+    if failed:
+        return failed
+
+    payload_bytes = len(image_bytes) + len(response.content)
+    try:
+        result = response.json()
+    except ValueError as e:
+        quota.record_failure("ocr_space", e, key=key)
+        return ProviderResult.failed("ocr_space", PARSE, f"Invalid JSON: {e}", payload_bytes=payload_bytes)
+
+    if result.get("OCRExitCode") == 1:
+        quota.record_success("ocr_space", response.headers, key=key)
+        return ProviderResult("ocr_space", result["ParsedResults"][0]["ParsedText"], payload_bytes=payload_bytes)
+
+    # OCR.space reports quota and engine errors in a 200 body (e.g. API key limit reached)
+    error_msg = result.get("ErrorMessage") or "Unknown Error"
+    if isinstance(error_msg, list):
+        error_msg = " ".join(error_msg)
+    quota_hit = any(word in error_msg.lower() for word in ("limit", "maximum"))
+    quota.record_failure("ocr_space", error_msg, status_code=429 if quota_hit else None,
+                         headers=response.headers, key=key)
+    return ProviderResult.failed("ocr_space", PROVIDER, error_msg, payload_bytes=payload_bytes,
+                                 status_code=429 if quota_hit else response.status_code)
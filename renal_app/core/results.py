@@ -0,0 +1,67 @@
+"""Structured provider outcomes.
+
+Core calls never raise or print for provider problems; they return a
+ProviderResult whose `failure` says what went wrong, so batch jobs can count,
+retry or fall back without parsing messages.
+"""
+
+# ProviderFailure.kind values
+CONFIG = "config"              # missing key or setting
+QUOTA = "quota"                # refused locally: budget spent or circuit open
+RATE_LIMITED = "rate_limited"  # provider answered 429
+HTTP = "http"                  # other 4xx/5xx
+NETWORK = "network"            # timeout, DNS, connection reset
+PROVIDER = "provider"          # 200 with an error body (e.g. OCR exit code)
+PARSE = "parse"                # response we could not read
+
+# HTTP statuses that reject the request's content, so sending it again fails the same way
+REJECTED_STATUSES = (400, 413, 422)
+
+
+class ProviderFailure:
+    __slots__ = ("kind", "message", "status_code", "retry_after")
+
+    def __init__(self, kind, message, status_code=None, retry_after=None):
+        self.kind = kind
+        self.message = message
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __str__(self):
+        return self.message
+
+    def __repr__(self):
+        return f"ProviderFailure({self.kind!r}, {self.message!r}, status_code={self.status_code!r})"
+
+
+def is_rejected(failure):
+    """True if the provider refused the request itself (e.g. a 422 on a bad field value) rather than being unavailable."""
+    return failure is not None and failure.kind == HTTP and failure.status_code in REJECTED_STATUSES
+
+
+class ProviderResult:
+    __slots__ = ("provider", "value", "failure", "payload_bytes", "prompt_tokens", "response_tokens")
+
+    def __init__(self, provider, value=None, failure=None, payload_bytes=0, prompt_tokens=0, response_tokens=0):
+        self.provider = provider
+        self.value = value
+        self.failure = failure
+        self.payload_bytes = payload_bytes
+        # Model token counts, for LLM providers only
+        self.prompt_tokens = prompt_tokens
+        self.response_tokens = response_tokens
+
+    @property
+    def ok(self):
+        return self.failure is None
+
+    @classmethod
+    def failed(cls, provider, kind, message, payload_bytes=0, **details):
+        return cls(provider, failure=ProviderFailure(kind, message, **details), payload_bytes=payload_bytes)
+
+    def __repr__(self):
+        state = "ok" if self.ok else repr(self.failure)
+        return f"ProviderResult({self.provider!r}, {state}, payload_bytes={self.payload_bytes})"
@@ -0,0 +1,69 @@
+"""One background event loop and HTTP client shared by every sync caller.
+
+Streamlit scripts are synchronous, so the adapters hand coroutines to a single
+long-lived loop thread. All sessions then share one connection pool, and batch
+code can submit many calls at once with `gather`.
+
+    result = run(usda.search_foods, config, "greek yogurt")
+"""
+
+import asyncio
+import threading
+
+import httpx
+
+HTTP_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=50)
+
+_lock = threading.Lock()
+_loop = None
+_client = None
+
+
+def _ensure_loop():
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="renal-provider-loop", daemon=True).start()
+        return _loop
+
+
+def get_client():
+    """The shared AsyncClient, created on first use."""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = httpx.AsyncClient(limits=HTTP_LIMITS, follow_redirects=True)
+        return _client
+
+
+def set_client(client):
+    """Swaps the shared client (e.g. for one with a mock transport). Returns the previous one."""
+    global _client
+    with _lock:
+        previous, _client = _client, client
+        return previous
+
+
+def submit(func, *args, **kwargs):
+    """Schedules func(client, *args, **kwargs) on the loop; returns a concurrent.futures.Future."""
+    client = get_client()
+    return asyncio.run_coroutine_threadsafe(func(client, *args, **kwargs), _ensure_loop())
+
+
+def run(func, *args, **kwargs):
+    """Runs func(client, *args, **kwargs) on the loop and waits for its ProviderResult."""
+    return submit(func, *args, **kwargs).result()
+
+
+def gather(func, items, *args, **kwargs):
+    """
+    Runs func(client, *args, item, **kwargs) for every item concurrently on the loop
+    and returns the results in item order.
+    """
+    client = get_client()
+
+    async def run_all():
+        return await asyncio.gather(*(func(client, *args, item, **kwargs) for item in items))
+
+    return asyncio.run_coroutine_threadsafe(run_all(), _ensure_loop()).result()
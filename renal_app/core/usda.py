@@ -0,0 +1,38 @@
+"""Async USDA FoodData Central calls."""
+
+from renal_app import quota
+from renal_app.core.http import acquire_key, send
+from renal_app.core.results import CONFIG, PARSE, ProviderResult
+
+USDA_SEARCH_URL = "https://api.nal.usda.gov/fdc/v1/foods/search"
+USDA_FOOD_URL = "https://api.nal.usda.gov/fdc/v1/food/{}"
+
+
+async def _get_json(client, config, url, params):
+    if not config.usda_keys:
+        return ProviderResult.failed("usda", CONFIG, "USDA_API_KEY environment variable not set.")
+    key, refused = acquire_key("usda", config.usda_keys)
+    if refused:
+        return refused
+
+    response, failed = await send(client, "usda", "GET", url, key=key, timeout=config.timeouts["usda"],
+                                  params={**params, "api_key": key})
+    if failed:
+        return failed
+    try:
+        data = response.json()
+    except ValueError as e:
+        quota.record_failure("usda", e, key=key)
+        return ProviderResult.failed("usda", PARSE, f"Invalid JSON: {e}", payload_bytes=len(response.content))
+    quota.record_success("usda", response.headers, key=key)
+    return ProviderResult("usda", data, payload_bytes=len(response.content))
+
+
+async def search_foods(client, config, query, page_size=100):
+    """Search results for query; value is the FDC search response ({"foods": [...]})."""
+    return await _get_json(client, config, USDA_SEARCH_URL, {"query": query, "pageSize": page_size})
+
+
+async def fetch_food(client, config, fdc_id):
+    """The full FDC record for one item, including foodPortions."""
+    return await _get_json(client, config, USDA_FOOD_URL.format(fdc_id), {})
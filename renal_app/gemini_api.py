@@ -1,100 +1,94 @@
-import google.generativeai as genai
 import streamlit as st
-import os
-import json
-import re
-
-GEMINI_API_KEY = st.secrets.get("GEMINI_API_KEY")
-
-# Configure your API Key (Best practice: use st.secrets or env vars)
-genai.configure(api_key=GEMINI_API_KEY)
-
-
-@st.cache_resource
-def get_gemini_model():
-    return genai.GenerativeModel("gemini-2.5-flash-lite")
-
-@st.cache_data(show_spinner=False)
-def extract_label_info_from_ocr(ocr_text):
+from renal_app.metrics import traced, mark_cache_miss, snapshot
+from renal_app.singleflight import single_flight
+from renal_app import quota
+from renal_app.quota import ProviderError
+from renal_app.providers import call
+from renal_app.core import gemini as core_gemini
+from renal_app.label_parser import parse_label_text, trim_ocr_text
+from renal_app.logic import merge_ingredients, scan_additive_triggers, trigger_names
+
+GEMINI_CACHE_ENTRIES = 1000
+# Prompt tokens one call should stay under, per traced operation
+TOKEN_BUDGETS = {"extract_label": 600, "analyze_triggers": 400}
+
+@traced("gemini", "extract_label", cached=True)
+@single_flight()
+@st.cache_data(show_spinner=False, max_entries=GEMINI_CACHE_ENTRIES)
+def _gemini_extract_label_info(ocr_text):
+    mark_cache_miss()
+    return call(core_gemini.extract_label_info, ocr_text)
+
+def extract_label_info_with_source(ocr_text):
     """
-    Converts messy OCR text into a structured dictionary for st.session_state['label_vals'].
+    Returns (label_vals, source) where source is "gemini", or "parser" when Gemini
+    was unavailable and the rule-based label parser was used instead.
     """
     if not ocr_text:
-        return {}
-
-    model = get_gemini_model()
-
-    prompt = f"""
-    You are a data extraction expert. I will provide messy OCR text from a nutrition label.
-    Extract the following fields into a valid JSON object. 
-    
-    RULES:
-    1. Use ONLY these keys: "Product Name", "Brand", "Serving Size", "Serving Unit", "Protein", "Sodium", "Potassium", "Phosphorus", "Sugar", "Calories", "Saturated Fat", "Trans Fat", "Ingredients".
-    2. Convert all nutrient values to numbers (floats). Do not include units like 'mg' or 'g' in the values.
-    3. If a value is missing, use null.
-    4. For 'Ingredients', extract the full comma-separated list.
-    5. Clean up OCR typos (e.g., 'S0dium' -> 'Sodium').
-    6. Get serving size in g or mL if possible.
-    7. Capitalize the first letter only for Product Name and Brand.
-
-    OCR TEXT:
-    {ocr_text}
+        return {}, "parser"
+    try:
+        # Only the panel lines go to Gemini; the parser fallback still reads everything
+        return _gemini_extract_label_info(trim_ocr_text(ocr_text)), "gemini"
+    except ProviderError:
+        return parse_label_text(ocr_text), "parser"
 
-    RETURN ONLY THE JSON OBJECT.
+def extract_label_info_from_ocr(ocr_text):
     """
+    Converts messy OCR text into a structured dictionary for st.session_state['label_vals'].
+    Falls back to the rule-based label parser when Gemini is unavailable.
+    """
+    label_vals, source = extract_label_info_with_source(ocr_text)
+    if ocr_text and source == "parser":
+        st.warning("AI extraction unavailable. Used the basic label parser, please check the values.")
+    return label_vals
+
+def extract_label_info_many(ocr_texts):
+    """extract_label_info_with_source for several OCR texts in parallel."""
+    results = quota.fan_out("gemini", extract_label_info_with_source, ocr_texts)
+    return [
+        (parse_label_text(text), "parser") if isinstance(result, Exception) else result
+        for text, result in zip(ocr_texts, results)
+    ]
+
+@traced("gemini", "analyze_triggers", cached=True)
+@single_flight()
+@st.cache_data(show_spinner=False, max_entries=GEMINI_CACHE_ENTRIES)
+def _gemini_analyze_triggers(ingredients):
+    mark_cache_miss()
+    return call(core_gemini.analyze_triggers, ingredients)
 
-    try:
-        response = model.generate_content(prompt)
-        # Clean the response text to ensure it's valid JSON
-        clean_json = re.search(r'\{.*\}', response.text, re.DOTALL).group()
-        data = json.loads(clean_json)
-        return data
-    except Exception as e:
-        st.error(f"AI Extraction Error: {e}")
-        return {}
-
-@st.cache_data(show_spinner=False)
 def analyze_ingredients_for_triggers(label_in_text, usda_in_text):
     """
     Analyzes raw ingredient text for CKD/Gout triggers that numbers miss.
-    Returns a list of strings (warnings).
-    """
-    if not label_in_text or label_in_text == "Not Available":
-        if not usda_in_text or usda_in_text == "Not Available":
-            return None
-
-    model = get_gemini_model()
-
-    prompt = f"""
-    You are a clinical renal dietitian and gout specialist. 
-    Analyze the following ingredient list for specific 'Hidden Triggers':
-    
-    1. PHOSPHORUS ADDITIVES: Look for 'phos' (e.g., Sodium Tripolyphosphate, Phosphoric Acid).
-    2. GOUT TRIGGERS: High-purine items (Yeast Extract, Organ Meats, Anchovies) and High Fructose Corn Syrup.
-    3. POTASSIUM SALTS: (e.g., Potassium Chloride) used as salt substitutes.
-    4. INFLAMMATORY FATS: (Trans-fats, Hydrogenated oils, Lard).
-
-    INGREDIENTS:
-    {label_in_text}{usda_in_text}
-
-    OUTPUT FORMAT:
-    Return ONLY a JSON list of strings. Each string should be a short warning.
-    Example: ["Contains Phosphoric Acid (Hidden Phosphorus)", "Contains High Fructose Corn Syrup (Gout Trigger)"]
-    If no triggers are found, return None.
+    Returns a list of strings (warnings). Falls back to the ADDITIVE_TRIGGERS
+    keyword scan when Gemini is unavailable.
     """
-
-    try:
-        response = model.generate_content(prompt)
-        
-        # Extract JSON from the response text (cleaning up any markdown code blocks)
-        text = response.text
-        json_match = re.search(r'\[.*\]', text, re.DOTALL)
-        
-        if json_match:
-            return json.loads(json_match.group())
+    # The label and USDA lists mostly repeat each other, so each ingredient is sent once
+    ingredients = merge_ingredients(label_in_text, usda_in_text)
+    if not ingredients:
         return None
-
-    except Exception as e:
-        st.error(f"Error calling Gemini API: {e}")
-        return ["Error analyzing ingredients."]
-    
\ No newline at end of file
+    try:
+        return _gemini_analyze_triggers(ingredients)
+    except ProviderError:
+        mask = scan_additive_triggers(ingredients)
+        return [f"Contains {name} (keyword scan, AI analysis unavailable)" for name in trigger_names(mask)] or None
+
+def token_budget_report():
+    """Gemini token use per operation against TOKEN_BUDGETS (cache hits cost no tokens, so are not counted)."""
+    rows = []
+    for row in snapshot():
+        if row["provider"] != "gemini":
+            continue
+        sent = row["token_calls"]
+        budget = TOKEN_BUDGETS.get(row["operation"])
+        rows.append({
+            "operation": row["operation"],
+            "gemini_calls": sent,
+            "prompt_tokens": row["prompt_tokens"],
+            "response_tokens": row["response_tokens"],
+            "mean_prompt_tokens": row["prompt_tokens"] / sent if sent else None,
+            "max_prompt_tokens": row["max_prompt_tokens"],
+            "budget": budget,
+            "within_budget": row["max_prompt_tokens"] <= budget if budget and sent else None,
+        })
+    return rows
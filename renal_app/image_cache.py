@@ -0,0 +1,121 @@
+"""Perceptual-hash cache of label extractions, so a re-photographed label skips OCR and Gemini.
+
+Each scanned photo is reduced to a 256-bit difference hash (dHash) of the
+grayscale JPEG that prepare_photo produces. Hashes and their extraction
+(label_vals, OCR text, source) are appended to a JSONL file and indexed in a
+BK-tree, which finds every stored hash within a Hamming radius while only
+visiting a small part of the tree.
+
+Nutrition panels share a layout, so the radius is kept tight: a match should
+mean the same label photographed again, not a similar-looking product.
+"""
+
+import io
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 16          # 16x16 gradient bits = 256-bit hash
+MAX_DISTANCE = 12       # ~5% of the bits
+
+
+def dhash(image_bytes, hash_size=HASH_SIZE):
+    """Difference hash: one bit per horizontally adjacent pixel pair of a shrunken grayscale image."""
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        # JPEG can decode straight to a reduced size, which skips most of the decode work
+        img.draft("L", (hash_size * 8, hash_size * 8))
+        small = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes with Hamming distance."""
+
+    __slots__ = ("root", "size")
+
+    def __init__(self):
+        # Node: [hash, items, {distance: child}]
+        self.root = None
+        self.size = 0
+
+    def add(self, image_hash, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [image_hash, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(image_hash, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [image_hash, [item], {}]
+                return
+            node = child
+
+    def search(self, image_hash, max_distance):
+        """All (distance, item) pairs within max_distance, closest first."""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(image_hash, node[0])
+            if distance <= max_distance:
+                found.extend((distance, item) for item in node[1])
+            # Triangle inequality: only children at |d - r| .. d + r can hold matches
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+class LabelPhotoCache:
+    """BK-tree of photo hashes backed by an append-only JSONL file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.tree = BKTree()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.tree.add(int(entry["hash"], 16), entry)
+
+    def lookup(self, image_hash, max_distance=MAX_DISTANCE):
+        """The closest stored extraction within max_distance (newest on ties), or None."""
+        with self._lock:
+            matches = self.tree.search(image_hash, max_distance)
+        if not matches:
+            return None
+        best = matches[0][0]
+        return max((entry for distance, entry in matches if distance == best), key=lambda e: e["created"])
+
+    def add(self, image_hash, label_vals, ocr_text, source):
+        entry = {
+            "hash": f"{image_hash:x}",
+            "label_vals": label_vals,
+            "ocr_text": ocr_text,
+            "source": source,
+            "created": time.time(),
+        }
+        with self._lock:
+            self.tree.add(image_hash, entry)
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+        return entry
@@ -0,0 +1,173 @@
+"""Daily intake log with running totals per user and day.
+
+Audited items are logged with their per-serving nutrients and a number of
+servings. A daily_totals row per (user, day) holds the running sums, updated
+by the delta of every add, removal or servings change in the same
+transaction, so the budget view reads one row per day instead of summing the
+history. Both tables are keyed by (user, day), so a date range is one index
+range scan.
+
+    log = IntakeLog("data/intake.sqlite3")
+    item_id = log.add_item("u1", "2026-01-31", "Greek Yogurt", nutrients, servings=1.5)
+    totals, count = log.day_totals("u1", "2026-01-31")
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from renal_app.nutrients import NUTRIENTS_TO_DISPLAY, NutrientVector
+
+COLUMNS = [name.lower().replace(" ", "_") for name in NUTRIENTS_TO_DISPLAY]
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS intake_items (
+    id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    day TEXT NOT NULL,
+    added REAL NOT NULL,
+    name TEXT NOT NULL,
+    fdc_id INTEGER,
+    servings REAL NOT NULL,
+    {", ".join(f"{column} REAL" for column in COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS intake_items_user_day ON intake_items (user, day);
+CREATE TABLE IF NOT EXISTS daily_totals (
+    user TEXT NOT NULL,
+    day TEXT NOT NULL,
+    items INTEGER NOT NULL DEFAULT 0,
+    {", ".join(f"{column} REAL NOT NULL DEFAULT 0" for column in COLUMNS)},
+    PRIMARY KEY (user, day)
+) WITHOUT ROWID;
+"""
+
+_ADD_TOTALS = f"""
+INSERT INTO daily_totals (user, day, items, {", ".join(COLUMNS)})
+VALUES (?, ?, ?, {", ".join("?" for _ in COLUMNS)})
+ON CONFLICT (user, day) DO UPDATE SET
+    items = items + excluded.items,
+    {", ".join(f"{column} = {column} + excluded.{column}" for column in COLUMNS)}
+"""
+
+
+def _values(nutrients):
+    """Per-serving values as a float array; missing nutrients are NaN."""
+    return np.asarray(NutrientVector.from_mapping(nutrients).values, dtype=np.float64)
+
+
+def _row_values(row):
+    return np.array([np.nan if row[column] is None else row[column] for column in COLUMNS], dtype=np.float64)
+
+
+class IntakeLog:
+    """SQLite-backed intake log, shared by all sessions of the server process."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def _apply_delta(self, user, day, items, delta):
+        # Missing values count as 0 in the totals
+        delta = np.nan_to_num(delta)
+        self._db.execute(_ADD_TOTALS, (user, day, items, *map(float, delta)))
+
+    def add_item(self, user, day, name, nutrients, servings=1.0, fdc_id=None):
+        """Logs an item (nutrients per serving) and adds it to the day's totals. Returns the item id."""
+        values = _values(nutrients)
+        stored = [None if np.isnan(v) else float(v) for v in values]
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            cursor = self._db.execute(
+                f"INSERT INTO intake_items (user, day, added, name, fdc_id, servings, {', '.join(COLUMNS)}) "
+                f"VALUES (?, ?, ?, ?, ?, ?, {', '.join('?' for _ in COLUMNS)})",
+                (user, str(day), time.time(), name, fdc_id, float(servings), *stored),
+            )
+            self._apply_delta(user, str(day), 1, values * servings)
+            return cursor.lastrowid
+
+    def _item(self, user, item_id):
+        return self._db.execute("SELECT * FROM intake_items WHERE id = ? AND user = ?", (item_id, user)).fetchone()
+
+    def remove_item(self, user, item_id):
+        """Removes an item and subtracts it from its day's totals. Returns False if it does not exist."""
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            row = self._item(user, item_id)
+            if row is None:
+                return False
+            self._db.execute("DELETE FROM intake_items WHERE id = ?", (item_id,))
+            self._apply_delta(user, row["day"], -1, -_row_values(row) * row["servings"])
+            # Clear float residue once a day is empty, so rounding error cannot build up
+            self._db.execute(
+                f"UPDATE daily_totals SET {', '.join(f'{column} = 0' for column in COLUMNS)} "
+                "WHERE user = ? AND day = ? AND items = 0",
+                (user, row["day"]),
+            )
+            return True
+
+    def set_servings(self, user, item_id, servings):
+        """Changes an item's servings and moves its day's totals by the difference."""
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            row = self._item(user, item_id)
+            if row is None:
+                return False
+            self._db.execute("UPDATE intake_items SET servings = ? WHERE id = ?", (float(servings), item_id))
+            self._apply_delta(user, row["day"], 0, _row_values(row) * (servings - row["servings"]))
+            return True
+
+    def items(self, user, day):
+        """The day's items in the order they were logged, with per-serving nutrients."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM intake_items WHERE user = ? AND day = ? ORDER BY added", (user, str(day))
+            ).fetchall()
+        return [
+            {
+                "id": row["id"],
+                "name": row["name"],
+                "fdc_id": row["fdc_id"],
+                "servings": row["servings"],
+                "nutrients": NutrientVector(_row_values(row)),
+            }
+            for row in rows
+        ]
+
+    def totals_range(self, user, start, end):
+        """[(day, NutrientVector of totals, item count)] for logged days from start to end inclusive."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM daily_totals WHERE user = ? AND day BETWEEN ? AND ? ORDER BY day",
+                (user, str(start), str(end)),
+            ).fetchall()
+        return [
+            (row["day"], NutrientVector(np.array([row[column] for column in COLUMNS], dtype=np.float64)), row["items"])
+            for row in rows
+            if row["items"] > 0
+        ]
+
+    def top_products(self, limit):
+        """[(fdc_id, name, times logged)] of the most logged USDA items across all users."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT fdc_id, MAX(name) AS name, COUNT(*) AS logged FROM intake_items"
+                " WHERE fdc_id IS NOT NULL GROUP BY fdc_id ORDER BY logged DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [(row["fdc_id"], row["name"], row["logged"]) for row in rows]
+
+    def day_totals(self, user, day):
+        """(NutrientVector of totals, item count) for one day; zeros when nothing is logged."""
+        days = self.totals_range(user, day, day)
+        if not days:
+            return NutrientVector(np.zeros(len(COLUMNS))), 0
+        _, totals, count = days[0]
+        return totals, count
@@ -0,0 +1,101 @@
+"""Merging label fields extracted from several photos of one package.
+
+Each photo yields its own label_vals (Gemini or the rule-based parser). For
+every field we score each photo's value and keep the value with the most
+confidence, summed over the photos that agree on it:
+
+- values from Gemini start at 1.0, values from the regex parser at 0.8
+- a value that can be found in that photo's own OCR text keeps its score,
+  one that cannot (a likely hallucination or misread) is halved
+- ingredient lists are weighted by length, since a cropped side photo
+  usually shows only part of the list
+"""
+
+import re
+
+from renal_app.nutrients import NUTRIENTS_TO_DISPLAY, to_float
+
+SOURCE_CONFIDENCE = {"gemini": 1.0, "parser": 0.8}
+UNVERIFIED_PENALTY = 0.5
+
+TEXT_FIELDS = ["Product Name", "Brand"]
+SERVING_FIELDS = ("Serving Size", "Serving Unit")
+
+
+def _number_in_text(value, text):
+    number = to_float(value, default=None)
+    if number is None:
+        return False
+    forms = {f"{number:g}", f"{number:.1f}"}
+    return any(re.search(rf"(?<![\d.]){re.escape(form)}(?![\d])", text) for form in forms)
+
+
+def _verified(field, value, text):
+    if field in TEXT_FIELDS or field == "Ingredients":
+        words = re.findall(r"\w+", str(value).lower())[:3]
+        return bool(words) and all(word in text.lower() for word in words)
+    return _number_in_text(value, text)
+
+
+def field_confidence(field, value, ocr_text, source):
+    """Confidence in one photo's value for a field (0 for a missing value)."""
+    if value in (None, "", "Not Available"):
+        return 0.0
+    score = SOURCE_CONFIDENCE.get(source, 0.5)
+    if not _verified(field, value, ocr_text or ""):
+        score *= UNVERIFIED_PENALTY
+    if field == "Ingredients":
+        score *= min(1.0, len(str(value)) / 200) + 0.5
+    return score
+
+
+def _vote_key(field, value):
+    if field in TEXT_FIELDS or field == "Ingredients":
+        return " ".join(str(value).lower().split())
+    number = to_float(value, default=None)
+    return round(number, 2) if number is not None else str(value).lower()
+
+
+def merge_label_vals(extractions):
+    """
+    Merges [(label_vals, ocr_text, source), ...] into one label_vals dict.
+    Returns (merged, conflicts) where conflicts maps each field the photos
+    disagreed on to the distinct values seen, for the user to double-check.
+    """
+    merged, conflicts = {}, {}
+    fields = TEXT_FIELDS + list(NUTRIENTS_TO_DISPLAY) + ["Ingredients"]
+
+    for field in fields + [SERVING_FIELDS]:
+        votes = {}
+        for vals, text, source in extractions:
+            if field == SERVING_FIELDS:
+                # Size and unit only make sense together, so they are voted on as a pair
+                value = (vals.get("Serving Size"), vals.get("Serving Unit"))
+                score = field_confidence("Serving Size", value[0], text, source)
+                key = (_vote_key("Serving Size", value[0]), str(value[1] or "").lower())
+            else:
+                value = vals.get(field)
+                score = field_confidence(field, value, text, source)
+                key = _vote_key(field, value)
+            if score:
+                value_score = votes.setdefault(key, [value, 0.0])
+                value_score[1] += score
+
+        if not votes:
+            if field == SERVING_FIELDS:
+                merged.update(dict.fromkeys(SERVING_FIELDS))
+            else:
+                merged[field] = None
+            continue
+
+        best, _ = max(votes.values(), key=lambda value_score: value_score[1])
+        if field == SERVING_FIELDS:
+            merged.update(zip(SERVING_FIELDS, best))
+        else:
+            merged[field] = best
+        # Ingredient lists from two photos rarely match word for word, so only numbers and names count as conflicts
+        if len(votes) > 1 and field != "Ingredients":
+            name = "Serving Size" if field == SERVING_FIELDS else field
+            conflicts[name] = [value for value, _ in votes.values()]
+
+    return merged, conflicts
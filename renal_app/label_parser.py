@@ -0,0 +1,95 @@
+"""Rule-based nutrition label parser, used when Gemini extraction is unavailable."""
+
+import re
+
+# "1,200" is twelve hundred (a comma before exactly three digits groups thousands); "0,5" is a half
+_AMOUNT = r"(\d{1,3}(?:,\d{3})+(?:\.\d+)?(?![\d,])|\d+(?:[.,]\d+)?)"
+_NUMBER = r"[^\d\n]{0,12}?" + _AMOUNT
+_THOUSANDS = re.compile(r",(?=\d{3}\b)")
+
+LABEL_PATTERNS = {
+    "Calories": re.compile(r"calories" + _NUMBER, re.IGNORECASE),
+    "Protein": re.compile(r"prot[eé]in" + _NUMBER + r"\s*g", re.IGNORECASE),
+    "Sodium": re.compile(r"s[o0]dium" + _NUMBER + r"\s*mg", re.IGNORECASE),
+    "Potassium": re.compile(r"potassium" + _NUMBER + r"\s*mg", re.IGNORECASE),
+    "Phosphorus": re.compile(r"phosph[oa]rus" + _NUMBER + r"\s*mg", re.IGNORECASE),
+    "Sugar": re.compile(r"(?<!added )sugars?" + _NUMBER + r"\s*g", re.IGNORECASE),
+    "Saturated Fat": re.compile(r"saturated(?:\s+fat)?" + _NUMBER + r"\s*g", re.IGNORECASE),
+    "Trans Fat": re.compile(r"trans(?:\s+fat)?" + _NUMBER + r"\s*g", re.IGNORECASE),
+}
+
+# "Serving Size 3/4 cup (175 g)" or "Per 175 g"
+_SERVING = re.compile(
+    r"\b(?:serving\s+size|per)\b[^\n(]*?(?:\(\s*)?" + _AMOUNT + r"\s*(g|ml|mL)\b", re.IGNORECASE
+)
+_INGREDIENTS = re.compile(r"ingredients?\s*[:.]\s*(.+?)(?:\n\s*\n|contains\s*:|$)", re.IGNORECASE | re.DOTALL)
+
+# Lines trim_ocr_text keeps: serving size and the nutrients the audit uses
+_PANEL_LINE = re.compile(
+    r"serving|\bper\b|calor|[ée]nergy|prot[eé]in|s[o0]dium|potassium|phosph|sugar|saturated|trans",
+    re.IGNORECASE,
+)
+_INGREDIENTS_START = re.compile(r"\bingredients?\s*[:.]", re.IGNORECASE)
+_PANEL_START = re.compile(r"nutrition\s+(?:facts|information)|valeur\s+nutritive", re.IGNORECASE)
+_FOOTNOTE = re.compile(r"^\s*\*|daily\s+value|calories\s+a\s+day|a\s+little|a\s+lot", re.IGNORECASE)
+_DAILY_VALUE = re.compile(r"\s+\d+(?:[.,]\d+)?\s*%\s*$")
+_SECTION_END = re.compile(r"^\s*(?:contains|may\s+contain|distributed|manufactured|best\s+before|keep\s+refrigerated)\b", re.IGNORECASE)
+HEADER_LINES = 4
+
+
+def trim_ocr_text(ocr_text):
+    """
+    The lines of OCR text the label extraction needs: up to HEADER_LINES lines above the
+    nutrition panel (product and brand), the serving size and audited nutrient lines
+    without their %DV column, and the ingredient list. Footnotes and the nutrients the
+    audit ignores (vitamins, minerals, carbohydrate) are dropped. Without a "Nutrition
+    Facts" heading, the panel starts at the first serving, nutrient or ingredient line.
+    """
+    lines = [" ".join(line.split()) for line in (ocr_text or "").splitlines()]
+    panel_start = next((i for i, line in enumerate(lines) if _PANEL_START.search(line)), None)
+    if panel_start is None:
+        panel_start = next(
+            (i for i, line in enumerate(lines) if _PANEL_LINE.search(line) or _INGREDIENTS_START.search(line)),
+            len(lines),
+        )
+    header = [line for line in lines[:panel_start] if line][:HEADER_LINES]
+
+    kept, in_ingredients = [], False
+    for line in lines[panel_start:]:
+        if _INGREDIENTS_START.search(line):
+            in_ingredients = True
+        elif in_ingredients and (not line or _SECTION_END.match(line)):
+            in_ingredients = False
+        if in_ingredients:
+            kept.append(line)
+        elif line and _PANEL_LINE.search(line) and not _FOOTNOTE.search(line):
+            kept.append(_DAILY_VALUE.sub("", line))
+    trimmed = "\n".join(header + kept)
+    # Labels in a layout the filters miss are sent whole rather than lose their values
+    return trimmed if LABEL_PATTERNS["Sodium"].search(trimmed) or not LABEL_PATTERNS["Sodium"].search(ocr_text or "") else ocr_text
+
+
+def _number(text):
+    return float(_THOUSANDS.sub("", text).replace(",", "."))
+
+
+def parse_label_text(ocr_text):
+    """
+    Pulls nutrient values, serving size and ingredients out of raw OCR text.
+    Returns the same keys as the Gemini extraction, with None for anything not found.
+    """
+    vals = {"Product Name": None, "Brand": None, "Serving Size": None, "Serving Unit": None}
+    text = ocr_text or ""
+
+    serving = _SERVING.search(text)
+    if serving:
+        vals["Serving Size"] = _number(serving.group(1))
+        vals["Serving Unit"] = serving.group(2).lower().replace("ml", "mL")
+
+    for name, pattern in LABEL_PATTERNS.items():
+        match = pattern.search(text)
+        vals[name] = _number(match.group(1)) if match else None
+
+    ingredients = _INGREDIENTS.search(text)
+    vals["Ingredients"] = " ".join(ingredients.group(1).split()).rstrip(".") if ingredients else None
+    return vals
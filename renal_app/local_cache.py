@@ -0,0 +1,253 @@
+"""Client-side cache of recent lookups in the browser's localStorage.
+
+Shoppers on a weak connection often look up the same products again. The
+server queues recent USDA searches, food details and audit verdicts (keyed by
+normalized query and FDC ID) with the `remember_*` functions, and
+`show_local_cache` hands them to a small st.components.v2 component that
+stores them in localStorage. Its filter box searches that store in the
+browser, so a repeat lookup renders at once without a round trip.
+
+Opening a cached product while offline queues the request in localStorage.
+The queue is sent as component state when the component mounts or the
+browser comes back online, and it stays queued until the server has
+acknowledged it. Data from the browser only selects a product; it is never
+written to the shared server caches.
+"""
+
+import hashlib
+import json
+
+import streamlit as st
+
+LOCAL_CACHE_LIMITS = {"searches": 30, "foods": 200, "verdicts": 200}
+SEARCH_RESULTS_KEPT = 10
+OUTBOX_LIMIT = 50
+ACKED_KEPT = 100
+SUMMARY_NUTRIENTS = ["Sodium", "Potassium", "Phosphorus"]
+
+_CSS = """
+.local-cache summary { cursor: pointer; font-size: 0.9rem; }
+.local-cache input { width: 100%; box-sizing: border-box; margin: 0.4rem 0; padding: 0.3rem 0.5rem;
+    border: 1px solid var(--st-border-color, #ccc); border-radius: 0.4rem; font: inherit;
+    background: var(--st-secondary-background-color); color: var(--st-text-color); }
+.local-cache .row { padding: 0.35rem 0; border-bottom: 1px solid var(--st-border-color, #eee); }
+.local-cache .name { font-weight: 600; cursor: pointer; }
+.local-cache .meta { font-size: 0.75rem; opacity: 0.7; }
+.local-cache .detail { font-size: 0.8rem; margin: 0.2rem 0 0 0.5rem; }
+.local-cache button { font-size: 0.75rem; margin-top: 0.2rem; padding: 0.1rem 0.5rem; border-radius: 0.4rem;
+    border: 1px solid var(--st-border-color, #ccc); background: transparent; color: var(--st-text-color); cursor: pointer; }
+"""
+
+_JS = """
+const STORE = "renal_audit_cache_v1";
+const ICONS = { red: "🔴", yellow: "🟡", green: "🟢" };
+
+function load() {
+    let cache;
+    try { cache = JSON.parse(localStorage.getItem(STORE)) || {}; } catch (e) { cache = {}; }
+    for (const kind of ["searches", "foods", "verdicts"]) cache[kind] = cache[kind] || {};
+    cache.pending = cache.pending || [];
+    return cache;
+}
+
+function prune(entries, limit) {
+    const keys = Object.keys(entries).sort((a, b) => entries[b].ts - entries[a].ts);
+    for (const key of keys.slice(limit)) delete entries[key];
+}
+
+function save(cache, limits) {
+    for (const kind in limits) prune(cache[kind], limits[kind]);
+    try {
+        localStorage.setItem(STORE, JSON.stringify(cache));
+    } catch (e) {
+        // Storage full: keep the newer half of each kind and try once more
+        for (const kind in limits) prune(cache[kind], Math.floor(limits[kind] / 2));
+        try { localStorage.setItem(STORE, JSON.stringify(cache)); } catch (e2) {}
+    }
+}
+
+function matches(text, words) {
+    text = (text || "").toLowerCase();
+    return words.every((word) => text.includes(word));
+}
+
+export default function (component) {
+    const { data, setStateValue, parentElement } = component;
+    const limits = data.limits || {};
+    const cache = load();
+    const now = Date.now();
+    for (const entry of data.put || []) cache[entry.kind][entry.key] = { ...entry.value, ts: now };
+    const acked = new Set(data.ack || []);
+    cache.pending = cache.pending.filter((request) => !acked.has(request.id));
+    save(cache, limits);
+
+    const sync = () => { if (cache.pending.length) setStateValue("pending", cache.pending); };
+    sync();
+    window.addEventListener("online", sync);
+    if (!data.visible) return () => window.removeEventListener("online", sync);
+
+    const root = document.createElement("details");
+    root.className = "local-cache";
+    const summary = document.createElement("summary");
+    summary.textContent = `📱 Saved on this device (${Object.keys(cache.foods).length + Object.keys(cache.verdicts).length})`;
+    const input = document.createElement("input");
+    input.placeholder = "Search recent products";
+    const list = document.createElement("div");
+    root.append(summary, input, list);
+    parentElement.appendChild(root);
+
+    function open(fdcId, name) {
+        cache.pending.push({ id: `${Date.now()}-${Math.random().toString(36).slice(2, 8)}`, fdc_id: fdcId, name });
+        save(cache, limits);
+        if (navigator.onLine) sync();
+        status.textContent = navigator.onLine ? "Opening..." : "Offline: it will open when you're back online.";
+    }
+
+    function products(words) {
+        // Audited and looked-up products first, then results of earlier searches
+        const seen = new Map();
+        for (const [fdcId, verdict] of Object.entries(cache.verdicts)) seen.set(fdcId, { name: verdict.name, verdict });
+        for (const [fdcId, food] of Object.entries(cache.foods)) {
+            const item = seen.get(fdcId) || { name: food.name };
+            seen.set(fdcId, { ...item, food });
+        }
+        for (const search of Object.values(cache.searches)) {
+            for (const food of search.foods || []) {
+                const fdcId = String(food.fdc_id);
+                if (!seen.has(fdcId)) seen.set(fdcId, { name: food.name });
+            }
+        }
+        return [...seen.entries()].filter(([, item]) => matches(item.name, words));
+    }
+
+    function render() {
+        const words = input.value.toLowerCase().split(/\\s+/).filter(Boolean);
+        list.replaceChildren();
+        for (const [fdcId, item] of products(words).slice(0, 20)) {
+            const row = document.createElement("div");
+            row.className = "row";
+            const name = document.createElement("div");
+            name.className = "name";
+            name.textContent = `${item.verdict ? ICONS[item.verdict.color] || "" : "🔍"} ${item.name}`;
+            const meta = document.createElement("div");
+            meta.className = "meta";
+            meta.textContent = [
+                item.verdict ? item.verdict.status : null,
+                item.food ? item.food.summary : null,
+            ].filter(Boolean).join(" | ");
+            const detail = document.createElement("div");
+            detail.className = "detail";
+            detail.hidden = true;
+            for (const flag of (item.verdict && item.verdict.flags) || []) {
+                const line = document.createElement("div");
+                line.textContent = flag;
+                detail.appendChild(line);
+            }
+            const button = document.createElement("button");
+            button.textContent = "Open";
+            button.onclick = () => open(Number(fdcId), item.name);
+            detail.appendChild(button);
+            name.onclick = () => { detail.hidden = !detail.hidden; };
+            row.append(name, meta, detail);
+            list.appendChild(row);
+        }
+    }
+
+    const status = document.createElement("div");
+    status.className = "meta";
+    root.appendChild(status);
+    input.oninput = render;
+    render();
+
+    return () => {
+        window.removeEventListener("online", sync);
+        root.remove();
+    };
+}
+"""
+
+_local_cache = st.components.v2.component("local_cache", css=_CSS, js=_JS)
+
+
+def _normalize(query):
+    return " ".join(str(query).lower().split())
+
+
+def _queue(kind, key, value):
+    """Queues an entry for the browser unless the same value was already sent this session."""
+    key = str(key)
+    digest = hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+    sent = st.session_state.setdefault("local_cache_sent", {})
+    if sent.get(f"{kind}:{key}") == digest:
+        return
+    sent[f"{kind}:{key}"] = digest
+    outbox = [entry for entry in st.session_state.get("local_cache_outbox", []) if (entry["kind"], entry["key"]) != (kind, key)]
+    outbox.append({"kind": kind, "key": key, "value": value})
+    st.session_state["local_cache_outbox"] = outbox[-OUTBOX_LIMIT:]
+
+
+def remember_search(query, foods):
+    """Keeps the top USDA search results for query on the device."""
+    _queue("searches", _normalize(query), {
+        "foods": [
+            {
+                "fdc_id": food.get("fdcId"),
+                "name": " ".join(filter(None, [food.get("brandName") or food.get("brandOwner"), food.get("description")])).title(),
+            }
+            for food in foods[:SEARCH_RESULTS_KEPT]
+        ],
+    })
+
+
+def remember_food(fdc_id, name, details):
+    """Keeps a food's serving and key nutrients on the device."""
+    if fdc_id is None or "error" in details:
+        return
+    nutrients = details.get("nutrients") or {}
+    summary = " | ".join(
+        f"{nutrient} {nutrients.get(nutrient):.0f}mg"
+        for nutrient in SUMMARY_NUTRIENTS
+        if nutrients.get(nutrient) is not None
+    )
+    serving = f"{details.get('Serving Size') or ''}{details.get('Serving Unit') or ''}"
+    _queue("foods", fdc_id, {"name": name, "summary": f"{serving}: {summary}" if serving and summary else summary})
+
+
+def remember_verdict(fdc_id, name, report):
+    """Keeps an audit verdict and its flags on the device."""
+    if fdc_id is None or not report:
+        return
+    _queue("verdicts", fdc_id, {
+        "name": name,
+        "color": report.get("color"),
+        "status": report.get("status"),
+        "flags": list(report.get("flags", []))[:5],
+    })
+
+
+def show_local_cache(on_select, visible=True):
+    """
+    Mounts the component, handing it the entries queued this session. Call it once per
+    run, after the page has rendered. on_select(fdc_id, name) runs for a product opened
+    from the device cache, then the app reruns.
+    """
+    outbox = st.session_state.pop("local_cache_outbox", [])
+    acked = st.session_state.setdefault("local_cache_acked", [])
+    result = _local_cache(
+        key="local_cache",
+        data={"put": outbox, "ack": acked, "limits": LOCAL_CACHE_LIMITS, "visible": visible},
+        default={"pending": []},
+        on_pending_change=lambda: None,
+        height="content",
+    )
+
+    requests = [request for request in (result.get("pending") or []) if request.get("id") not in acked]
+    if not requests:
+        return
+    acked.extend(request["id"] for request in requests)
+    del acked[:-ACKED_KEPT]
+    # This run's entries were queued but may not reach the browser before the rerun
+    st.session_state["local_cache_outbox"] = outbox + st.session_state.get("local_cache_outbox", [])
+    request = requests[-1]
+    on_select(request["fdc_id"], request.get("name"))
+    st.rerun()
@@ -1,50 +1,34 @@
 """Logic for calculations and audit verdicts."""
 
-from copy import deepcopy
-
-def to_float(val):
-    """
-    Safely converts any input (String, None, Int) to a Float.
-    Returns 0.0 if the input is invalid or missing.
-    """
-    # 1. Handle None or empty values immediately
-    if val is None or str(val).strip() == "" or str(val).lower() == "null":
-        return 0.0
-    
-    try:
-        # 2. Clean the string (remove commas or spaces just in case)
-        if isinstance(val, str):
-            val = val.replace(",", "").strip()
-            
-        # 3. Perform the conversion
-        return float(val)
-        
-    except (ValueError, TypeError):
-        # 4. If someone types "N/A" or "Unknown", return 0.0 instead of crashing
-        return 0.0
-
-units = {
-    "Protein": "g",
-    "Sodium": "mg",
-    "Potassium": "mg",
-    "Phosphorus": "mg",
-    "Sugar": "g",
-    "Saturated Fat": "g",
-    "Trans Fat": "g",
-    "Calories": "kcal",
+import re
+
+import numpy as np
+import streamlit as st
+
+from renal_app.nutrients import (
+    ComparisonRecord,
+    NUTRIENTS_TO_DISPLAY,
+    units,
+)
+from renal_app.metrics import traced
+from renal_app.rules import (
+    BUILTIN_PROFILES_PATH,
+    DEFAULT_PROFILE,
+    DEFAULT_TOLERANCE,
+    SEVERITIES,
+    STATUSES,
+    compile_profile,
+    load_rule_profiles,
+    rule_set,
+)
+
+# FoodData Central nutrient IDs for the nutrients we audit
+USDA_NUTRIENT_IDS = {
+    1003: "Protein", 1093: "Sodium", 1092: "Potassium",
+    1091: "Phosphorus", 2000: "Sugar", 1258: "Saturated Fat",
+    1257: "Trans Fat", 1008: "Calories",
 }
 
-NUTRIENTS_TO_DISPLAY = [
-    "Protein",
-    "Sodium",
-    "Potassium",
-    "Phosphorus",
-    "Sugar",
-    "Saturated Fat",
-    "Trans Fat",
-    "Calories",
-]
-
 CRITICAL_NUTRIENTS = [
     "Protein",
     "Sodium",
@@ -65,33 +49,100 @@ SAFETY_LIMITS = {
     "Trans Fat": 0.1,
 }
 
-COMPARISON_TEMPLATE = {
-    "Protein": {"usda": None, "label": None},
-    "Sodium": {"usda": None, "label": None},
-    "Potassium": {"usda": None, "label": None},
-    "Phosphorus": {"usda": None, "label": None},
-    "Sugar": {"usda": None, "label": None},
-    "Saturated Fat": {"usda": None, "label": None},
-    "Trans Fat": {"usda": None, "label": None},
-    "Calories": {"usda": None, "label": None},
+# Daily totals for a general renal diet, checked by the intake log
+DAILY_BUDGETS = {
+    "Sodium": 2000,
+    "Potassium": 2000,
+    "Phosphorus": 1000,
+}
+
+# The general-purpose profile, used when no other rule profile is chosen
+DEFAULT_RULE_PROFILE = {
+    "name": DEFAULT_PROFILE,
+    "version": 1,
+    "title": "General Renal",
+    "discrepancy_tolerance": DEFAULT_TOLERANCE,
+    "rules": {name: {"limit": SAFETY_LIMITS[name], "severity": "high"} for name in CRITICAL_NUTRIENTS},
+    "daily_budgets": DAILY_BUDGETS,
+}
+
+_rule_profiles = {}
+
+# Keyword scan for additive triggers, used where an AI pass is too slow or
+# unavailable (e.g. the offline renal profile build).
+ADDITIVE_TRIGGERS = {
+    "Phosphorus Additive": ["phosphate", "phosphoric acid", "pyrophosphate", "polyphosphate"],
+    "Potassium Salt": ["potassium chloride", "potassium lactate", "potassium citrate", "potassium phosphate"],
+    "Gout Trigger": ["yeast extract", "high fructose corn syrup", "anchov", "liver", "autolyzed yeast"],
+    "Inflammatory Fat": ["hydrogenated", "shortening", "lard"],
 }
 
 
+def scan_additive_triggers(ingredients):
+    """
+    Returns a bitmask of ADDITIVE_TRIGGERS categories found in the ingredient text.
+    Bit i corresponds to the i-th key of ADDITIVE_TRIGGERS.
+    """
+    if not ingredients or ingredients == "Not Available":
+        return 0
+
+    text = ingredients.lower()
+    mask = 0
+    for bit, keywords in enumerate(ADDITIVE_TRIGGERS.values()):
+        if any(keyword in text for keyword in keywords):
+            mask |= 1 << bit
+    return mask
+
+
+def trigger_names(mask):
+    """Expand a scan_additive_triggers bitmask back into category names."""
+    return [name for bit, name in enumerate(ADDITIVE_TRIGGERS) if mask & (1 << bit)]
+
+
+_INGREDIENT_PREFIX = re.compile(r"^\s*ingredients?\s*[:.]\s*", re.IGNORECASE)
+
+
+def split_ingredients(text):
+    """Top-level items of an ingredient list; commas inside parentheses stay within their item."""
+    if not text or text == "Not Available":
+        return []
+    items, depth, current = [], 0, []
+    for char in _INGREDIENT_PREFIX.sub("", text):
+        if char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth = max(depth - 1, 0)
+        if char in ",;" and depth == 0:
+            items.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    items.append("".join(current))
+    return [" ".join(item.split()).strip(" .") for item in items if item.strip(" .")]
+
+
+def merge_ingredients(*texts):
+    """
+    One comma-separated list of the ingredients in texts, each kept once (compared
+    case- and punctuation-insensitively) in first-seen order. The label and USDA lists
+    usually name the same ingredients, so the merged list is often half their total.
+    """
+    merged = {}
+    for text in texts:
+        for item in split_ingredients(text):
+            merged.setdefault(re.sub(r"[^a-z0-9]+", " ", item.lower()).strip(), item)
+    return ", ".join(merged.values())
+
+
 def init_comparison_data():
-    return deepcopy(COMPARISON_TEMPLATE)
+    return ComparisonRecord()
 
 
 def update_comparison_data(comparison_data, label_vals=None, usda_nutrients=None):
     if not comparison_data:
         comparison_data = init_comparison_data()
 
-    for nutrient in comparison_data:
-        if label_vals:
-            comparison_data[nutrient]["label"] = label_vals.get(nutrient)
-        if usda_nutrients:
-            comparison_data[nutrient]["usda"] = usda_nutrients.get(nutrient)
-
-    return comparison_data
+    return comparison_data.update(label_vals=label_vals, usda_nutrients=usda_nutrients)
 
 def _coerce_number(value):
     if isinstance(value, (int, float)):
@@ -106,39 +157,89 @@ def calculate_delta(label_value, usda_value):
         return None
     return ((usda - label) / label) * 100
 
-def get_audit_details(data):
+def _profile_report(profile, data, label_over, usda_over, mismatch, status):
+    """Report dict for one record and one profile, from that profile's row of the masks."""
+    name, color = STATUSES[int(status)]
     report = {
-        "status": "Renal Safe",
-        "color": "green",
+        "status": name,
+        "color": color,
+        "profile": profile.name,
         "flags": [], # List of specific safety violations
         "discrepancies": [] # List of label vs usda mismatches
     }
 
-    for nutrient in CRITICAL_NUTRIENTS:
-        nutrient_info = data.get(nutrient, {"label": None, "usda": None})
-        l_val = to_float(nutrient_info.get("label"))
-        u_val = to_float(nutrient_info.get("usda"))
-        limit = SAFETY_LIMITS.get(nutrient)
+    for i in np.flatnonzero(label_over | usda_over | mismatch):
+        nutrient = NUTRIENTS_TO_DISPLAY[i]
+        unit = units.get(nutrient, '')
+        l_val = data.label.get(nutrient, 0.0)
+        u_val = data.usda.get(nutrient, 0.0)
+        limit = profile.limit_values.get(nutrient)
+        icon = "ℹ️" if profile.severities[i] == SEVERITIES["info"] else "⚠️"
 
         # 1. Detail: Safety Limit Violation
-        if limit and l_val > limit:
-            excess = l_val - limit
-            report["flags"].append(f"⚠️ Label {nutrient}: {l_val}{units.get(nutrient, '')} exceeds safe limit of {limit}{units.get(nutrient, '')} (+{excess}{units.get(nutrient, '')})")
-            report["status"] = "High Renal Load"
-            report["color"] = "red"
-
-        if limit and u_val > limit:
-            excess = u_val - limit
-            report["flags"].append(f"⚠️ USDA {nutrient}: {u_val}{units.get(nutrient, '')} exceeds safe limit of {limit}{units.get(nutrient, '')} (+{excess}{units.get(nutrient, '')})")
-            report["status"] = "High Renal Load"
-            report["color"] = "red"
+        if label_over[i]:
+            report["flags"].append(f"{icon} Label {nutrient}: {l_val}{unit} exceeds safe limit of {limit}{unit} (+{l_val - limit}{unit})")
+        if usda_over[i]:
+            report["flags"].append(f"{icon} USDA {nutrient}: {u_val}{unit} exceeds safe limit of {limit}{unit} (+{u_val - limit}{unit})")
 
         # 2. Detail: USDA Discrepancy
-        delta = calculate_delta(l_val, u_val)
-        if delta and delta > 20:
+        if mismatch[i]:
             report["discrepancies"].append(f"🔍 {nutrient}: Label says {l_val}, but USDA suggests {u_val}")
-            if report["color"] != "red": # Don't overwrite red with yellow
-                report["status"] = "Data Mismatch"
-                report["color"] = "yellow"
 
     return report
+
+
+def rule_profiles_path():
+    """
+    The deployment's rule profile directory (RULE_PROFILES_PATH), whose profiles are
+    added to or override the built-in ones. Read on first use rather than at import,
+    so offline tools such as the profile table build need no secrets.
+    """
+    return st.secrets.get("RULE_PROFILES_PATH", "data/rule_profiles")
+
+
+def get_rule_profiles(path=None):
+    """
+    The default profile plus the built-in rule profiles and any in path (the configured
+    rule_profiles_path() by default), keyed by name. Compiled once per path; profile
+    files are cached by version and content (see renal_app.rules).
+    """
+    path = path or rule_profiles_path()
+    profiles = _rule_profiles.get(path)
+    if profiles is None:
+        profiles = {DEFAULT_PROFILE: compile_profile(DEFAULT_RULE_PROFILE)}
+        profiles.update(load_rule_profiles(BUILTIN_PROFILES_PATH, path))
+        _rule_profiles[path] = profiles
+    return profiles
+
+
+def _resolve_profiles(profiles):
+    """Profile names are looked up among the configured profiles, the same ones the audit page offers."""
+    if profiles is None:
+        return list(get_rule_profiles().values())
+    if all(not isinstance(p, str) for p in profiles):
+        return list(profiles)
+    available = get_rule_profiles()
+    return [available[p] if isinstance(p, str) else p for p in profiles]
+
+
+@traced("logic", "audit")
+def get_audit_details(data, profile=None):
+    """
+    Audits one ComparisonRecord against a rule profile (a name or a CompiledProfile,
+    the default profile when omitted).
+    """
+    compiled = _resolve_profiles([profile or DEFAULT_PROFILE])[0]
+    label_over, usda_over, mismatch, status = rule_set([compiled]).evaluate(data.label.values, data.usda.values)
+    return _profile_report(compiled, data, label_over[0, 0], usda_over[0, 0], mismatch[0, 0], status[0, 0])
+
+
+@traced("logic", "audit_profiles")
+def audit_all_profiles(data, profiles=None):
+    """Reports for one ComparisonRecord against several profiles (all by default) in one pass, keyed by name."""
+    compiled = _resolve_profiles(profiles)
+    label_over, usda_over, mismatch, status = rule_set(compiled).evaluate(data.label.values, data.usda.values)
+    return {
+        profile.name: _profile_report(profile, data, label_over[0, p], usda_over[0, p], mismatch[0, p], status[0, p])
+        for p, profile in enumerate(compiled)
+    }
@@ -0,0 +1,132 @@
+"""Session memory: large blobs out of st.session_state, cleanup of ended sessions, and a memory report.
+
+Label photos go into the shared BlobStore and sessions keep only their
+digests (`put_session_blobs` / `get_session_blobs`). `sweep_ended_sessions`
+runs from the main script at most once a minute and releases the blobs of
+sessions the server no longer holds. The report functions back the Admin
+page's memory section.
+"""
+
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+
+import streamlit as st
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit.runtime.stats import CACHE_MEMORY_FAMILY
+
+from renal_app.blob_store import BlobStore
+
+BLOB_STORE_PATH = st.secrets.get("BLOB_STORE_PATH") or os.path.join(tempfile.gettempdir(), "renal_blobs")
+SWEEP_INTERVAL = 60
+
+_sweep_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+@st.cache_resource
+def get_blob_store():
+    """The process-wide blob store, shared by every session."""
+    return BlobStore(BLOB_STORE_PATH)
+
+
+def _session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "no-session"
+
+
+def put_session_blobs(key, blobs):
+    """Stores blobs in the shared store and keeps only their digests in st.session_state[key]."""
+    store = get_blob_store()
+    owner = _session_id()
+    digests = [store.put(blob, owner) for blob in blobs]
+    store.release(set(st.session_state.get(key, [])) - set(digests), owner)
+    st.session_state[key] = digests
+    return digests
+
+
+def get_session_blobs(key):
+    """The bytes of the blobs whose digests are in st.session_state[key]."""
+    store = get_blob_store()
+    blobs = (store.get(digest) for digest in st.session_state.get(key, []))
+    return [blob for blob in blobs if blob is not None]
+
+
+def clear_session_blobs(key):
+    get_blob_store().release(st.session_state.pop(key, []), _session_id())
+
+
+def _server_sessions():
+    """SessionInfo of every session the server still holds (connected or awaiting reconnect), or None."""
+    if not runtime.exists():
+        return None
+    # Streamlit has no public API for listing sessions; the session manager is internal
+    session_mgr = getattr(runtime.get_instance(), "_session_mgr", None)
+    return session_mgr.list_sessions() if session_mgr is not None else None
+
+
+def sweep_ended_sessions(force=False):
+    """
+    Releases the blobs of sessions that have ended. Runs at most every SWEEP_INTERVAL
+    seconds unless forced; returns the number of references released.
+    """
+    global _last_sweep
+    with _sweep_lock:
+        now = time.time()
+        if not force and now - _last_sweep < SWEEP_INTERVAL:
+            return 0
+        _last_sweep = now
+
+    # Owners are read first: a session that starts after the list of live sessions
+    # was taken may already own blobs, and must not look ended
+    store = get_blob_store()
+    owners = store.owners()
+    sessions = _server_sessions()
+    if sessions is None:
+        return 0
+    alive = {info.session.id for info in sessions}
+    return sum(store.release_owner(owner) for owner in owners - alive)
+
+
+def _pickled_size(value):
+    try:
+        return len(pickle.dumps(value))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+def session_memory_report():
+    """One row per server session with its st.session_state size and the blob bytes it references."""
+    blob_bytes = get_blob_store().owner_bytes()
+    rows = []
+    for info in _server_sessions() or []:
+        state = info.session.session_state.filtered_state
+        sizes = {key: _pickled_size(value) for key, value in state.items()}
+        largest = max(sizes, key=sizes.get) if sizes else None
+        rows.append({
+            "session": info.session.id[:8],
+            "connected": info.client is not None,
+            "keys": len(sizes),
+            "state_bytes": sum(sizes.values()),
+            "largest_key": f"{largest} ({sizes[largest]} B)" if largest else None,
+            "blob_bytes": blob_bytes.get(info.session.id, 0),
+        })
+    return sorted(rows, key=lambda row: row["state_bytes"], reverse=True)
+
+
+def cache_memory_report():
+    """Bytes held per st.cache_data / st.cache_resource function (as Streamlit measures them) and by the blob store."""
+    totals = {}
+    if runtime.exists():
+        stats = runtime.get_instance().stats_mgr.get_stats([CACHE_MEMORY_FAMILY]).get(CACHE_MEMORY_FAMILY, [])
+        for stat in stats:
+            key = (stat.category_name, stat.cache_name)
+            totals[key] = totals.get(key, 0) + stat.byte_length
+    store = get_blob_store()
+    totals[("blob_store", store.path)] = store.stats()["bytes"]
+    rows = [{"cache_type": category, "cache": name, "bytes": size} for (category, name), size in totals.items()]
+    return sorted(rows, key=lambda row: row["bytes"], reverse=True)
@@ -0,0 +1,247 @@
+"""Per-stage latency, cache, payload and error metrics for provider calls.
+
+Wrap a call with the `traced` decorator or the `span` context manager:
+
+    @traced("usda", "search", cached=True)
+    @st.cache_data(show_spinner=False)
+    def search_usda_foods(query):
+        mark_cache_miss()  # only runs when st.cache_data misses
+        ...
+
+Metrics are process-wide, so they cover every Streamlit session on the server.
+"""
+
+import contextvars
+import functools
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Seconds between textfile dumps; scrapers read it far less often than sessions rerun
+DUMP_INTERVAL = 15
+
+_lock = threading.Lock()
+_dump_lock = threading.Lock()
+_last_dump = 0.0
+_stats = {}
+_current_span = contextvars.ContextVar("renal_current_span", default=None)
+
+
+class Span:
+    __slots__ = ("provider", "operation", "cache_hit", "payload_bytes", "prompt_tokens", "response_tokens", "error", "coalesced")
+
+    def __init__(self, provider, operation, cached):
+        self.provider = provider
+        self.operation = operation
+        # A cached call counts as a hit unless the wrapped body runs and says otherwise
+        self.cache_hit = True if cached else None
+        self.payload_bytes = 0
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        self.error = False
+        self.coalesced = False
+
+
+def _new_stats():
+    return {
+        "calls": 0,
+        "errors": 0,
+        "cache_hits": 0,
+        "cache_misses": 0,
+        "coalesced": 0,
+        "payload_bytes": 0,
+        "token_calls": 0,
+        "prompt_tokens": 0,
+        "response_tokens": 0,
+        "max_prompt_tokens": 0,
+        "latency_sum": 0.0,
+        "latency_buckets": [0] * len(LATENCY_BUCKETS),
+    }
+
+
+def _record(current, elapsed):
+    with _lock:
+        stats = _stats.setdefault((current.provider, current.operation), _new_stats())
+        stats["calls"] += 1
+        stats["errors"] += int(current.error)
+        stats["coalesced"] += int(current.coalesced)
+        stats["payload_bytes"] += current.payload_bytes
+        stats["token_calls"] += int(current.prompt_tokens > 0)
+        stats["prompt_tokens"] += current.prompt_tokens
+        stats["response_tokens"] += current.response_tokens
+        stats["max_prompt_tokens"] = max(stats["max_prompt_tokens"], current.prompt_tokens)
+        stats["latency_sum"] += elapsed
+        if current.cache_hit is True:
+            stats["cache_hits"] += 1
+        elif current.cache_hit is False:
+            stats["cache_misses"] += 1
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                stats["latency_buckets"][i] += 1
+
+
+@contextmanager
+def span(provider, operation, cached=False):
+    """Times the block and records it under (provider, operation). Exceptions count as errors."""
+    current = Span(provider, operation, cached)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except Exception:
+        current.error = True
+        raise
+    finally:
+        _current_span.reset(token)
+        _record(current, time.perf_counter() - start)
+
+
+def traced(provider, operation=None, cached=False):
+    """Decorator form of `span`. The operation defaults to the function name."""
+    def decorator(func):
+        name = operation or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(provider, name, cached=cached):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def mark_cache_miss():
+    current = _current_span.get()
+    if current is not None:
+        current.cache_hit = False
+
+
+def add_payload(nbytes):
+    current = _current_span.get()
+    if current is not None:
+        current.payload_bytes += nbytes
+
+
+def add_tokens(prompt_tokens, response_tokens):
+    """Adds LLM prompt and response token counts to the current span."""
+    current = _current_span.get()
+    if current is not None:
+        current.prompt_tokens += prompt_tokens
+        current.response_tokens += response_tokens
+
+
+def mark_coalesced():
+    """Flags the current span as answered by another session's in-flight call."""
+    current = _current_span.get()
+    if current is not None:
+        current.coalesced = True
+        current.cache_hit = None
+
+
+def mark_error():
+    """Flags the current span as failed for calls that return an error instead of raising."""
+    current = _current_span.get()
+    if current is not None:
+        current.error = True
+
+
+def snapshot():
+    """Returns one dict per (provider, operation) with counters and latency percentiles."""
+    with _lock:
+        items = [(key, dict(stats, latency_buckets=list(stats["latency_buckets"]))) for key, stats in _stats.items()]
+
+    rows = []
+    for (provider, operation), stats in sorted(items):
+        calls = stats["calls"]
+        lookups = stats["cache_hits"] + stats["cache_misses"]
+        rows.append({
+            "provider": provider,
+            "operation": operation,
+            "calls": calls,
+            "errors": stats["errors"],
+            "cache_hit_rate": stats["cache_hits"] / lookups if lookups else None,
+            "coalesced": stats["coalesced"],
+            "payload_bytes": stats["payload_bytes"],
+            "token_calls": stats["token_calls"],
+            "prompt_tokens": stats["prompt_tokens"],
+            "response_tokens": stats["response_tokens"],
+            "max_prompt_tokens": stats["max_prompt_tokens"],
+            "mean_ms": 1000 * stats["latency_sum"] / calls if calls else None,
+            "p50_ms": _bucket_quantile(stats, 0.50),
+            "p95_ms": _bucket_quantile(stats, 0.95),
+            "p99_ms": _bucket_quantile(stats, 0.99),
+        })
+    return rows
+
+
+def _bucket_quantile(stats, q):
+    """Upper bucket bound (ms) containing the q-th quantile, like Prometheus histogram_quantile."""
+    calls = stats["calls"]
+    if not calls:
+        return None
+    for count, bound in zip(stats["latency_buckets"], LATENCY_BUCKETS):
+        if count >= q * calls:
+            return bound * 1000
+    return float("inf")
+
+
+def render_prometheus():
+    """Renders all metrics in the Prometheus text exposition format."""
+    with _lock:
+        items = sorted((key, dict(stats, latency_buckets=list(stats["latency_buckets"]))) for key, stats in _stats.items())
+
+    lines = [
+        "# HELP renal_provider_latency_seconds Provider call latency.",
+        "# TYPE renal_provider_latency_seconds histogram",
+    ]
+    for (provider, operation), stats in items:
+        labels = f'provider="{provider}",operation="{operation}"'
+        for count, bound in zip(stats["latency_buckets"], LATENCY_BUCKETS):
+            lines.append(f'renal_provider_latency_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'renal_provider_latency_seconds_bucket{{{labels},le="+Inf"}} {stats["calls"]}')
+        lines.append(f"renal_provider_latency_seconds_sum{{{labels}}} {stats['latency_sum']:.6f}")
+        lines.append(f"renal_provider_latency_seconds_count{{{labels}}} {stats['calls']}")
+
+    counters = [
+        ("errors", "Provider calls that failed."),
+        ("cache_hits", "Provider calls answered from st.cache_data."),
+        ("cache_misses", "Provider calls that missed st.cache_data."),
+        ("coalesced", "Provider calls that waited on an identical in-flight call."),
+        ("payload_bytes", "Bytes sent to and received from the provider."),
+        ("prompt_tokens", "LLM prompt tokens sent to the provider."),
+        ("response_tokens", "LLM response tokens received from the provider."),
+    ]
+    for name, help_text in counters:
+        lines.append(f"# HELP renal_provider_{name}_total {help_text}")
+        lines.append(f"# TYPE renal_provider_{name}_total counter")
+        for (provider, operation), stats in items:
+            lines.append(f'renal_provider_{name}_total{{provider="{provider}",operation="{operation}"}} {stats[name]}')
+
+    return "\n".join(lines) + "\n"
+
+
+def dump_prometheus(path, force=False):
+    """
+    Atomically writes render_prometheus() to path (e.g. for a node_exporter textfile collector).
+    Writes at most every DUMP_INTERVAL seconds unless forced; returns True if it wrote.
+    """
+    global _last_dump
+    with _dump_lock:
+        now = time.time()
+        if not force and now - _last_dump < DUMP_INTERVAL:
+            return False
+        _last_dump = now
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".tmp") as tmp:
+        tmp.write(render_prometheus())
+    os.replace(tmp.name, path)
+    return True
+
+
+def reset():
+    with _lock:
+        _stats.clear()
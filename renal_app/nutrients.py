@@ -0,0 +1,127 @@
+"""Typed nutrient records with fixed nutrient indices."""
+
+import re
+
+import numpy as np
+
+units = {
+    "Protein": "g",
+    "Sodium": "mg",
+    "Potassium": "mg",
+    "Phosphorus": "mg",
+    "Sugar": "g",
+    "Saturated Fat": "g",
+    "Trans Fat": "g",
+    "Calories": "kcal",
+}
+
+NUTRIENTS_TO_DISPLAY = [
+    "Protein",
+    "Sodium",
+    "Potassium",
+    "Phosphorus",
+    "Sugar",
+    "Saturated Fat",
+    "Trans Fat",
+    "Calories",
+]
+
+NUTRIENT_INDEX = {name: i for i, name in enumerate(NUTRIENTS_TO_DISPLAY)}
+
+_NUMBER = re.compile(r"-?\d*\.?\d+")
+
+
+def to_float(val, default=0.0):
+    """
+    Safely converts any input (String, None, Int) to a Float.
+    Strips thousands separators and units the AI may include (e.g. "1,200mg" -> 1200.0).
+    Returns default if the input is invalid or missing.
+    """
+    if val is None:
+        return default
+    if isinstance(val, (int, float)):
+        return default if np.isnan(val) else float(val)
+
+    match = _NUMBER.search(str(val).replace(",", ""))
+    if not match:
+        return default
+    return float(match.group())
+
+
+class NutrientVector:
+    """
+    The NUTRIENTS_TO_DISPLAY values for one food, stored as a float array.
+    Missing values are NaN internally and None when read by name.
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self, values=None):
+        if values is None:
+            values = np.full(len(NUTRIENTS_TO_DISPLAY), np.nan)
+        self.values = values
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        """Builds a vector from a dict keyed by nutrient name (label_vals, USDA nutrients)."""
+        if isinstance(mapping, cls):
+            return mapping
+        vector = cls()
+        for name, value in (mapping or {}).items():
+            if name in NUTRIENT_INDEX:
+                vector.values[NUTRIENT_INDEX[name]] = to_float(value, default=np.nan)
+        return vector
+
+    def __getitem__(self, name):
+        value = self.values[NUTRIENT_INDEX[name]]
+        return None if np.isnan(value) else float(value)
+
+    def __setitem__(self, name, value):
+        self.values[NUTRIENT_INDEX[name]] = to_float(value, default=np.nan)
+
+    def get(self, name, default=None):
+        value = self[name] if name in NUTRIENT_INDEX else None
+        return default if value is None else value
+
+    def is_empty(self):
+        return bool(np.isnan(self.values).all())
+
+    def scaled(self, factor, decimals=2):
+        return NutrientVector(np.round(self.values * factor, decimals))
+
+    def to_dict(self):
+        return {name: self[name] for name in NUTRIENTS_TO_DISPLAY if self[name] is not None}
+
+    def to_fields(self, prefix):
+        """Airtable columns, e.g. to_fields("Label") -> {"Label Sodium (mg)": 120.0, ...}"""
+        return {f"{prefix} {name} ({units[name]})": self[name] for name in NUTRIENTS_TO_DISPLAY}
+
+    @classmethod
+    def from_fields(cls, fields, prefix):
+        """Inverse of to_fields: reads the "<prefix> <nutrient> (<unit>)" columns of an Airtable record."""
+        return cls.from_mapping({
+            name: fields.get(f"{prefix} {name} ({units[name]})") for name in NUTRIENTS_TO_DISPLAY
+        })
+
+    def __repr__(self):
+        return f"NutrientVector({self.to_dict()})"
+
+
+class ComparisonRecord:
+    """Label and USDA nutrient vectors for the product being audited."""
+
+    __slots__ = ("label", "usda")
+
+    def __init__(self, label=None, usda=None):
+        self.label = label if label is not None else NutrientVector()
+        self.usda = usda if usda is not None else NutrientVector()
+
+    def update(self, label_vals=None, usda_nutrients=None):
+        if label_vals:
+            self.label = NutrientVector.from_mapping(label_vals)
+        if usda_nutrients:
+            self.usda = NutrientVector.from_mapping(usda_nutrients)
+        return self
+
+    def __repr__(self):
+        return f"ComparisonRecord(label={self.label!r}, usda={self.usda!r})"
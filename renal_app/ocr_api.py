@@ -1,36 +1,55 @@
-import requests
-import json
+import io
 import streamlit as st
+from renal_app.metrics import traced, mark_cache_miss
+from renal_app.singleflight import single_flight
+from renal_app import quota
+from renal_app.quota import ProviderError
+from renal_app.providers import call
+from renal_app.core import ocr as core_ocr
 
-OCR_API_KEY = st.secrets.get("OCR_API_KEY")
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:  # Local OCR fallback is optional
+    pytesseract = None
 
-@st.cache_data(show_spinner=False)
-def perform_ocr(image_bytes):
+OCR_CACHE_ENTRIES = 1000
+
+@traced("ocr_space", "ocr", cached=True)
+@single_flight()
+@st.cache_data(show_spinner=False, max_entries=OCR_CACHE_ENTRIES)
+def _ocr_space(image_bytes):
     """
     Sends image bytes to OCR Space API and returns the detected text.
+    Raises ProviderError on failure, so errors are never cached as label text.
+    """
+    mark_cache_miss()
+    return call(core_ocr.read_text, image_bytes)
+
+@traced("local_ocr", "ocr")
+def _local_ocr(image_bytes):
+    image = Image.open(io.BytesIO(image_bytes))
+    return pytesseract.image_to_string(image)
+
+def perform_ocr(image_bytes):
+    """
+    Returns the detected label text. Uses OCR Space, falling back to local
+    Tesseract (when installed) if OCR Space is over quota or failing.
+    Raises ProviderError if no OCR engine is available.
+    """
+    try:
+        return _ocr_space(image_bytes)
+    except ProviderError:
+        if pytesseract is None:
+            raise
+    try:
+        return _local_ocr(image_bytes)
+    except Exception as e:
+        raise ProviderError("local_ocr", str(e)) from e
+
+def perform_ocr_many(images):
+    """
+    OCR for several images at once, spread in parallel across the OCR Space key pool.
+    Returns the text for each image, or the ProviderError raised for it.
     """
-    url = "https://api.ocr.space/parse/image"
-    
-    payload = {
-        "apikey": OCR_API_KEY,
-        "language": "eng",        # You can change to 'fre' for French
-        "isOverlayRequired": False,
-        "FileType": "JPG",
-        "OCREngine": 2            # Engine 2 is better for tables/labels
-    }
-    
-    # We pass the bytes directly as a file
-    files = {
-        "screenshot": ("image.jpg", image_bytes, "image/jpeg")
-    }
-    
-    response = requests.post(url, data=payload, files=files, timeout=20)
-    result = response.json()
-    
-    if result.get("OCRExitCode") == 1:
-        # Success! Grab the full text
-        return result["ParsedResults"][0]["ParsedText"]
-    else:
-        # Error handling (e.g., API key limit reached)
-        error_msg = result.get("ErrorMessage", "Unknown Error")
-        return f"Error: {error_msg}"
\ No newline at end of file
+    return quota.fan_out("ocr_space", perform_ocr, images)
@@ -0,0 +1,183 @@
+"""Warm-start preloading of the caches after a deploy or restart.
+
+Every st.cache_data cache starts empty in a new server process, so without
+this the first users to audit the popular products pay full USDA and Gemini
+latency. `start_preload` runs once per process, from the first script run,
+in a daemon thread:
+
+1. Loads the shared resources: the renal profile table (its memory-mapped
+   pages are read once so they sit in the page cache), the alternatives
+   index, the local mirror search choices, the GTIN index, the label photo
+   cache and the rule profiles.
+2. Ranks the PRELOAD_TOP_N most audited products by the intake log and the
+   Airtable registry.
+3. For each one, fills the same cache entries an audit of it would read:
+   the FDC ID lookup, a name search and the ingredient trigger analysis.
+
+Provider calls only go out while more than PRELOAD_HEADROOM of the
+provider's budget is left, so preloading never takes requests from users.
+"""
+
+import mmap
+import threading
+import time
+
+import numpy as np
+import streamlit as st
+
+from renal_app import quota
+from renal_app.gemini_api import analyze_ingredients_for_triggers
+from renal_app.logic import get_rule_profiles
+from renal_app.quota import ProviderError
+from renal_app.reaudit import registry_pages
+from renal_app.usda_api import (
+    fetch_usda_food_details,
+    get_alternatives_index,
+    get_gtin_index,
+    get_mirror_search_choices,
+    get_renal_profiles,
+    search_usda_foods,
+)
+from renal_app.wizards import get_label_photo_cache
+
+PRELOAD_TOP_N = int(st.secrets.get("PRELOAD_TOP_N", 50))
+# Registry pages (100 records each) scanned to rank products
+PRELOAD_MAX_PAGES = 20
+# Share of a provider's budget left for users while preloading
+PRELOAD_HEADROOM = 0.5
+REGISTRY_FIELDS = ["FDC_ID", "Product", "Brand", "Serving Size", "Serving Unit", "Label Ingredients", "USDA Ingredients"]
+
+_status_lock = threading.Lock()
+_status = {"state": "idle", "products": 0, "warmed": 0, "skipped": 0, "started": None, "finished": None, "error": None}
+
+
+def preload_status():
+    with _status_lock:
+        return dict(_status)
+
+
+def _set_status(**changes):
+    with _status_lock:
+        _status.update(changes)
+
+
+def _touch_pages(arrays):
+    """Reads one byte per page of each memory-mapped array, so the first lookups don't fault from disk."""
+    for array in (arrays or {}).values():
+        if isinstance(array, np.memmap) and array.size:
+            int(array.reshape(-1).view(np.uint8)[::mmap.PAGESIZE].sum())
+
+
+def load_resources():
+    """Loads every process-wide index and table the audit reads."""
+    _touch_pages(get_renal_profiles())
+    get_alternatives_index()
+    get_mirror_search_choices()
+    get_gtin_index()
+    get_label_photo_cache()
+    get_rule_profiles()
+
+
+def top_products(n, intake_log=None):
+    """
+    The n most audited products as dicts (fdc_id, query, serving size and unit,
+    ingredients), ranked by intake log entries plus registry records.
+    """
+    products, counts = {}, {}
+    if intake_log is not None:
+        for fdc_id, name, logged in intake_log.top_products(n):
+            products.setdefault(fdc_id, {"fdc_id": fdc_id, "query": name})
+            counts[fdc_id] = counts.get(fdc_id, 0) + logged
+
+    try:
+        for page, (records, _) in enumerate(registry_pages(fields=REGISTRY_FIELDS)):
+            for record in records:
+                fields = record.get("fields", {})
+                fdc_id = str(fields.get("FDC_ID") or "")
+                if not fdc_id.isdigit():
+                    continue
+                fdc_id = int(fdc_id)
+                name = f"{fields.get('Brand') or ''} {fields.get('Product') or ''}".strip()
+                # The latest record wins: it has the serving and ingredients users see now
+                products[fdc_id] = {
+                    "fdc_id": fdc_id,
+                    "query": name or products.get(fdc_id, {}).get("query"),
+                    "serving_size": fields.get("Serving Size"),
+                    "serving_unit": fields.get("Serving Unit"),
+                    "label_ingredients": fields.get("Label Ingredients"),
+                    "usda_ingredients": fields.get("USDA Ingredients"),
+                }
+                counts[fdc_id] = counts.get(fdc_id, 0) + 1
+            if page + 1 >= PRELOAD_MAX_PAGES:
+                break
+    except ProviderError:
+        # No registry (not configured or unavailable): rank by the intake log alone
+        pass
+
+    ranked = sorted(counts, key=counts.get, reverse=True)[:n]
+    return [products[fdc_id] for fdc_id in ranked]
+
+
+def _has_headroom(provider):
+    """Waits until more than PRELOAD_HEADROOM of the provider's budget is free; False if its circuit is open."""
+    while True:
+        keys = [row for row in quota.status() if row["provider"] == provider and row["state"] != quota.OPEN]
+        if not keys:
+            return False
+        if sum(row["remaining"] for row in keys) > PRELOAD_HEADROOM * sum(row["limit"] for row in keys):
+            return True
+        time.sleep(max(min(row["window_s"] / row["limit"] for row in keys), 0.5))
+
+
+def _audit_ingredients(product):
+    """The (label, USDA) ingredient texts the audit page sends for this product."""
+    # Label audits send the label list with the USDA one "Not Available", USDA-only audits the reverse
+    if product.get("label_ingredients"):
+        return product["label_ingredients"], "Not Available"
+    return "Not Available", product.get("usda_ingredients") or "Not Available"
+
+
+def warm_product(product):
+    """Fills the USDA and Gemini cache entries an audit of this product reads. Returns True if all were warmed."""
+    warmed = True
+    try:
+        if _has_headroom("usda"):
+            details = fetch_usda_food_details(product["fdc_id"], product.get("serving_size"), product.get("serving_unit"))
+            if not product.get("usda_ingredients"):
+                product["usda_ingredients"] = details.get("Ingredients")
+        else:
+            warmed = False
+        if product.get("query") and _has_headroom("usda"):
+            search_usda_foods(product["query"])
+        # Without Gemini this falls back to the keyword scan, which is not cached
+        if _has_headroom("gemini"):
+            analyze_ingredients_for_triggers(*_audit_ingredients(product))
+        else:
+            warmed = False
+    except ProviderError:
+        return False
+    return warmed
+
+
+def preload(intake_log=None, top_n=PRELOAD_TOP_N):
+    _set_status(state="running", started=time.time())
+    try:
+        load_resources()
+        products = top_products(top_n, intake_log) if top_n else []
+        _set_status(products=len(products))
+        for product in products:
+            key = "warmed" if warm_product(product) else "skipped"
+            with _status_lock:
+                _status[key] += 1
+        _set_status(state="done", finished=time.time())
+    except Exception as e:
+        # A failed preload only means colder caches; the app works without it
+        _set_status(state="failed", finished=time.time(), error=repr(e))
+
+
+@st.cache_resource(show_spinner=False)
+def start_preload(_intake_log=None):
+    """Starts preload() in a daemon thread, once per server process."""
+    thread = threading.Thread(target=preload, args=(_intake_log,), name="renal-preload", daemon=True)
+    thread.start()
+    return thread
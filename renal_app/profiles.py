@@ -0,0 +1,234 @@
+"""Precomputed per-100 g (per-100 mL for drinks) renal profiles for FoodData Central items.
+
+Build the table offline from the FDC bulk JSON downloads (streamed with
+ijson, so the multi-GB Branded file never has to fit in memory):
+
+    python -m renal_app.profiles FoodData_Central_branded_food.json --out data/renal_profiles
+
+The table is a directory of .npy arrays sorted by FDC ID, so a lookup is a
+single binary search and the arrays can be memory-mapped.
+"""
+
+import argparse
+import os
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from renal_app.logic import (
+    CRITICAL_NUTRIENTS,
+    SAFETY_LIMITS,
+    USDA_NUTRIENT_IDS,
+    scan_additive_triggers,
+)
+from renal_app.nutrients import NUTRIENT_INDEX, NUTRIENTS_TO_DISPLAY, NutrientVector
+from renal_app.barcodes import normalize_gtin
+from renal_app.conversions import base_unit
+
+TEXT_COLUMNS = ["description", "brand", "category", "ingredients"]
+# What a row's per-100 values are per, stored as an index into this tuple
+BASE_UNITS = ("g", "ml")
+
+_LIMITS = np.array([SAFETY_LIMITS[name] for name in CRITICAL_NUTRIENTS], dtype=np.float32)
+_CRITICAL_COLUMNS = [NUTRIENT_INDEX[name] for name in CRITICAL_NUTRIENTS]
+
+
+def _nutrient_values(food):
+    """Per-100g values for NUTRIENTS_TO_DISPLAY, NaN where USDA has no entry."""
+    values = np.full(len(NUTRIENTS_TO_DISPLAY), np.nan, dtype=np.float32)
+    for nutrient in food.get("foodNutrients", []):
+        # Search results use nutrientId/value, bulk downloads nutrient.id/amount
+        nutrient_id = nutrient.get("nutrientId") or (nutrient.get("nutrient") or {}).get("id")
+        if nutrient_id not in USDA_NUTRIENT_IDS:
+            continue
+        amount = nutrient.get("value", nutrient.get("amount"))
+        if amount is None:
+            continue
+        values[NUTRIENT_INDEX[USDA_NUTRIENT_IDS[nutrient_id]]] = amount
+    return values
+
+
+def _category(food):
+    category = food.get("brandedFoodCategory") or food.get("foodCategory") or ""
+    if isinstance(category, dict):
+        category = category.get("description", "")
+    return category
+
+
+def _pack_strings(strings):
+    """Concatenate strings into one UTF-8 buffer plus an offsets array."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return blob, offsets
+
+
+def _unpack_string(blob, offsets, row):
+    return bytes(blob[offsets[row]:offsets[row + 1]]).decode("utf-8")
+
+
+def iter_fdc_foods(path):
+    """
+    Yield food dicts from an FDC bulk JSON download (any top-level food list), parsed
+    incrementally so only one food is in memory at a time: the Branded download is
+    several GB as a single JSON document.
+    """
+    import ijson
+
+    builder, item_prefix = None, None
+    with open(path, "rb") as f:
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if builder is None:
+                # A food is a map directly in the top-level list, or in a list under a top-level key
+                if event == "start_map" and (prefix == "item" or (prefix.endswith(".item") and prefix.count(".") == 1)):
+                    builder, item_prefix = ijson.ObjectBuilder(), prefix
+                    builder.event(event, value)
+                continue
+            builder.event(event, value)
+            if event == "end_map" and prefix == item_prefix:
+                yield builder.value
+                builder = None
+
+
+def build_profiles(foods):
+    """
+    Builds the profile arrays from an iterable of FDC food dicts.
+    Returns a dict of numpy arrays sorted by FDC ID.
+    """
+    fdc_ids, rows, triggers, gtins, bases = [], [], [], [], []
+    texts = {column: [] for column in TEXT_COLUMNS}
+
+    for food in foods:
+        fdc_id = food.get("fdcId")
+        if fdc_id is None:
+            continue
+        ingredients = food.get("ingredients") or ""
+        fdc_ids.append(int(fdc_id))
+        rows.append(_nutrient_values(food))
+        triggers.append(scan_additive_triggers(ingredients))
+        gtins.append(normalize_gtin(food.get("gtinUpc")) or 0)
+        bases.append(BASE_UNITS.index(base_unit(food)))
+        texts["description"].append(food.get("description") or "")
+        texts["brand"].append(food.get("brandName") or food.get("brandOwner") or "")
+        texts["category"].append(_category(food))
+        texts["ingredients"].append(ingredients)
+
+    fdc_ids = np.array(fdc_ids, dtype=np.int64)
+    order = np.argsort(fdc_ids, kind="stable")
+    nutrients = np.array(rows, dtype=np.float32).reshape(-1, len(NUTRIENTS_TO_DISPLAY))[order]
+
+    profiles = {
+        "fdc_id": fdc_ids[order],
+        "nutrients": nutrients,
+        "limit_ratio": nutrients[:, _CRITICAL_COLUMNS] / _LIMITS,
+        "triggers": np.array(triggers, dtype=np.uint8)[order],
+        "base_unit": np.array(bases, dtype=np.uint8)[order],
+    }
+    # Barcode index: GTINs sorted for binary search, with the table row of each
+    gtins = np.array(gtins, dtype=np.int64)[order]
+    gtin_rows = np.flatnonzero(gtins)
+    gtin_rows = gtin_rows[np.argsort(gtins[gtin_rows], kind="stable")]
+    profiles["gtin"] = gtins[gtin_rows]
+    profiles["gtin_row"] = gtin_rows
+    for column in TEXT_COLUMNS:
+        blob, offsets = _pack_strings([texts[column][i] for i in order])
+        profiles[f"{column}_blob"] = blob
+        profiles[f"{column}_offsets"] = offsets
+    return profiles
+
+
+def save_profiles(profiles, path):
+    os.makedirs(path, exist_ok=True)
+    for name, array in profiles.items():
+        np.save(os.path.join(path, f"{name}.npy"), array)
+
+
+def load_profiles(path, mmap=True):
+    """Loads a saved profile table, or returns None if it has not been built."""
+    if not os.path.isdir(path):
+        return None
+    mode = "r" if mmap else None
+    return {
+        name[:-4]: np.load(os.path.join(path, name), mmap_mode=mode)
+        for name in os.listdir(path)
+        if name.endswith(".npy")
+    }
+
+
+def find_profile(profiles, fdc_id):
+    """Returns the row index for an FDC ID, or None if it is not in the table."""
+    try:
+        fdc_id = int(fdc_id)
+    except (TypeError, ValueError):
+        return None
+    ids = profiles["fdc_id"]
+    row = int(np.searchsorted(ids, fdc_id))
+    if row < len(ids) and ids[row] == fdc_id:
+        return row
+    return None
+
+
+def find_profile_by_gtin(profiles, gtin):
+    """Returns the row index for a normalized GTIN, or None (also for tables built without barcodes)."""
+    if gtin is None or "gtin" not in profiles:
+        return None
+    gtins = profiles["gtin"]
+    i = int(np.searchsorted(gtins, gtin))
+    if i < len(gtins) and gtins[i] == gtin:
+        return int(profiles["gtin_row"][i])
+    return None
+
+
+def profile_text(profiles, row, column):
+    return _unpack_string(profiles[f"{column}_blob"], profiles[f"{column}_offsets"], row)
+
+
+def profile_row(profiles, row):
+    """Per-100 nutrients (in the row's base unit), limit ratios and text fields for one table row."""
+    nutrients = NutrientVector(np.array(profiles["nutrients"][row], dtype=np.float64))
+    limit_ratios = {
+        name: float(value)
+        for name, value in zip(CRITICAL_NUTRIENTS, profiles["limit_ratio"][row])
+        if not np.isnan(value)
+    }
+    record = {column: profile_text(profiles, row, column) for column in TEXT_COLUMNS}
+    record.update({
+        "fdc_id": int(profiles["fdc_id"][row]),
+        "nutrients": nutrients,
+        "limit_ratios": limit_ratios,
+        "triggers": int(profiles["triggers"][row]),
+        # Tables built before base units were stored hold per-100 g rows
+        "base_unit": BASE_UNITS[int(profiles["base_unit"][row])] if "base_unit" in profiles else "g",
+    })
+    return record
+
+
+def profile_search_choices(profiles):
+    """"brand description" strings for every row, for fuzzy search over the table."""
+    return [
+        f"{profile_text(profiles, row, 'brand')} {profile_text(profiles, row, 'description')}".strip()
+        for row in range(len(profiles["fdc_id"]))
+    ]
+
+
+def search_profiles(choices, query, limit=25):
+    """Row indices of the closest matches to query, best first."""
+    matches = process.extract(query, choices, scorer=fuzz.token_set_ratio, limit=limit)
+    return [row for _, _, row in matches]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the per-FDC-item renal profile table.")
+    parser.add_argument("inputs", nargs="+", help="FDC bulk JSON files (Branded, Foundation, Survey)")
+    parser.add_argument("--out", default="data/renal_profiles", help="Output directory")
+    args = parser.parse_args()
+
+    foods = (food for path in args.inputs for food in iter_fdc_foods(path))
+    profiles = build_profiles(foods)
+    save_profiles(profiles, args.out)
+    print(f"Saved {len(profiles['fdc_id'])} profiles to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Streamlit side of the async provider core: secrets in, blocking calls out."""
+
+import streamlit as st
+from renal_app.core import runner
+from renal_app.core.config import ProviderConfig
+from renal_app.metrics import add_payload, add_tokens
+from renal_app.quota import ProviderError
+
+USDA_API_KEY = st.secrets.get("USDA_API_KEY")
+OCR_API_KEY = st.secrets.get("OCR_API_KEY")
+
+CONFIG = ProviderConfig(
+    # Optional pools of keys (USDA_API_KEYS = ["...", "..."]), each with its own budget
+    usda_keys=list(st.secrets.get("USDA_API_KEYS") or [USDA_API_KEY]),
+    ocr_keys=list(st.secrets.get("OCR_API_KEYS") or [OCR_API_KEY]),
+    gemini_key=st.secrets.get("GEMINI_API_KEY"),
+    gemini_model=st.secrets.get("GEMINI_MODEL", "gemini-2.5-flash-lite"),
+    airtable_key=st.secrets.get("AIRTABLE_API_KEY"),
+    airtable_base_id=st.secrets.get("AIRTABLE_BASE_ID"),
+    airtable_table_id=st.secrets.get("AIRTABLE_TABLE_ID"),
+).register_keys()
+
+
+def call(func, *args, **kwargs):
+    """
+    Runs a core provider coroutine on the shared loop and returns its value.
+    Raises ProviderError on failure, so st.cache_data never caches an error.
+    """
+    result = runner.run(func, CONFIG, *args, **kwargs)
+    add_payload(result.payload_bytes)
+    add_tokens(result.prompt_tokens, result.response_tokens)
+    if not result.ok:
+        raise ProviderError(result.provider, result.failure.message, result.failure)
+    return result.value
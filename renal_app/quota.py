@@ -0,0 +1,278 @@
+"""Provider quota tracking and circuit breakers.
+
+Each provider call site takes a key with `acquire(provider)` before calling out
+and reports the outcome with `record_success` / `record_failure`. When a key's
+budget is spent or it keeps failing, its breaker opens and the next call goes
+to another key, or straight to a fallback once no key is left, instead of
+waiting on timeouts. Batch jobs can read `status()`, sleep for
+`wait_time(provider)`, or spread work over every key with `fan_out`.
+
+A provider can have a pool of keys (`register_keys`); each key has its own
+budget and breaker, and `acquire` hands out the least-loaded one.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Requests allowed per window (seconds) for one key
+DEFAULT_QUOTAS = {
+    "usda": (1000, 3600),
+    "ocr_space": (500, 86400),
+    "gemini": (15, 60),
+    "airtable": (5, 1),
+}
+
+FAILURE_THRESHOLD = 3
+COOLDOWN_SECONDS = 30
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class ProviderError(Exception):
+    """A provider call failed or was refused because its breaker is open."""
+
+    def __init__(self, provider, message, failure=None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        # The core's structured ProviderFailure, when the error came from a call
+        self.failure = failure
+
+
+class ProviderHealth:
+    __slots__ = (
+        "provider", "key", "label", "limit", "window", "calls", "header_remaining", "header_reset_at",
+        "state", "failures", "opened_until", "last_error", "trial_in_flight",
+    )
+
+    def __init__(self, provider, limit, window, key=None, label="default"):
+        self.provider = provider
+        self.key = key
+        self.label = label
+        self.limit = limit
+        self.window = window
+        self.calls = deque()
+        self.header_remaining = None
+        self.header_reset_at = None
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_until = 0.0
+        self.last_error = None
+        self.trial_in_flight = False
+
+    def _prune(self, now):
+        while self.calls and self.calls[0] <= now - self.window:
+            self.calls.popleft()
+        if self.header_reset_at is not None and now >= self.header_reset_at:
+            self.header_remaining = None
+            self.header_reset_at = None
+
+    def remaining(self, now):
+        self._prune(now)
+        counted = self.limit - len(self.calls)
+        if self.header_remaining is not None:
+            return min(counted, self.header_remaining)
+        return counted
+
+    def available(self, now):
+        """True if this key may take a call right now."""
+        if self.state == OPEN and now < self.opened_until:
+            return False
+        if self.state != CLOSED and self.trial_in_flight:
+            return False
+        return self.remaining(now) > 0
+
+    def wait_time(self, now):
+        """Seconds until a call would be allowed (0 if allowed now)."""
+        if self.state == OPEN and now < self.opened_until:
+            return self.opened_until - now
+        if self.remaining(now) > 0:
+            return 0.0
+        if self.header_remaining == 0 and self.header_reset_at:
+            return max(0.0, self.header_reset_at - now)
+        return max(0.0, self.calls[0] + self.window - now) if self.calls else 0.0
+
+
+_lock = threading.Lock()
+_pools = {name: [ProviderHealth(name, *quota)] for name, quota in DEFAULT_QUOTAS.items()}
+
+
+def _pool(provider):
+    pool = _pools.get(provider)
+    if pool is None:
+        pool = _pools[provider] = [ProviderHealth(provider, float("inf"), 1)]
+    return pool
+
+
+def _health(provider, key):
+    pool = _pool(provider)
+    for health in pool:
+        if health.key == key:
+            return health
+    return pool[0]
+
+
+def key_label(key):
+    """Short, non-secret name for a key in dashboards ("…a1b2")."""
+    return f"…{str(key)[-4:]}" if key else "default"
+
+
+def register_keys(provider, keys):
+    """
+    Gives a provider a pool of API keys, each with its own budget and breaker.
+    Keys keep their counters if they were already registered.
+    """
+    keys = [key for key in dict.fromkeys(keys or []) if key]
+    if not keys:
+        return
+    with _lock:
+        existing = {health.key: health for health in _pool(provider)}
+        limit, window = DEFAULT_QUOTAS.get(provider, (float("inf"), 1))
+        _pools[provider] = [
+            existing.get(key) or ProviderHealth(provider, limit, window, key=key, label=key_label(key))
+            for key in keys
+        ]
+
+
+def configure_quota(provider, limit, window):
+    """Overrides the per-key request budget for a provider (e.g. a paid Gemini tier)."""
+    with _lock:
+        for health in _pool(provider):
+            health.limit = limit
+            health.window = window
+
+
+def acquire(provider):
+    """
+    Reserves one request on the least-loaded key of the provider and returns that key
+    (None for providers without a key pool). After a key's cooldown one trial request
+    is let through (half-open) to probe whether it recovered.
+    Raises ProviderError when every key's breaker is open or budget is spent.
+    """
+    now = time.time()
+    with _lock:
+        candidates = [health for health in _pool(provider) if health.available(now)]
+        if not candidates:
+            raise ProviderError(provider, "request budget exhausted or circuit open")
+        health = max(candidates, key=lambda h: h.remaining(now))
+        if health.state == OPEN:
+            health.state = HALF_OPEN
+        if health.state == HALF_OPEN:
+            health.trial_in_flight = True
+        health.calls.append(now)
+        if health.header_remaining is not None:
+            health.header_remaining -= 1
+        return health.key
+
+
+def allow(provider):
+    """acquire() for callers that only need a yes/no."""
+    try:
+        acquire(provider)
+    except ProviderError:
+        return False
+    return True
+
+
+def _read_headers(health, headers, now):
+    if not headers:
+        return
+    remaining = headers.get("X-RateLimit-Remaining")
+    if remaining is not None:
+        try:
+            health.header_remaining = int(remaining)
+            health.header_reset_at = now + health.window
+        except ValueError:
+            pass
+
+
+def record_success(provider, headers=None, key=None):
+    now = time.time()
+    with _lock:
+        health = _health(provider, key)
+        _read_headers(health, headers, now)
+        health.state = CLOSED
+        health.failures = 0
+        health.trial_in_flight = False
+
+
+def record_failure(provider, error=None, status_code=None, headers=None, retry_after=None, key=None):
+    """
+    Counts a failed call on a key. A 429 (quota exhausted) opens its breaker straight away,
+    for Retry-After seconds when given; other failures open it after FAILURE_THRESHOLD in a row.
+    """
+    now = time.time()
+    with _lock:
+        health = _health(provider, key)
+        _read_headers(health, headers, now)
+        health.failures += 1
+        health.last_error = str(error or status_code)
+        health.trial_in_flight = False
+        if retry_after is None and headers:
+            try:
+                retry_after = float(headers.get("Retry-After"))
+            except (TypeError, ValueError):
+                retry_after = None
+        if status_code == 429 or health.state == HALF_OPEN or health.failures >= FAILURE_THRESHOLD:
+            health.state = OPEN
+            health.opened_until = now + (retry_after or COOLDOWN_SECONDS)
+
+
+def wait_time(provider):
+    """Seconds a batch job should wait before its next call to this provider (on any key)."""
+    now = time.time()
+    with _lock:
+        return min(health.wait_time(now) for health in _pool(provider))
+
+
+def key_count(provider):
+    with _lock:
+        return len(_pool(provider))
+
+
+def fan_out(provider, func, items, per_key=2):
+    """
+    Maps func over items with per_key concurrent calls for every key in the provider's
+    pool, so bulk throughput grows with the number of keys. Each worker sleeps for
+    wait_time(provider) before a call instead of failing while every key is busy.
+    Returns results in item order; a failed item's exception is returned in its place.
+    """
+    def call(item):
+        delay = wait_time(provider)
+        if delay:
+            time.sleep(delay)
+        try:
+            return func(item)
+        except Exception as e:
+            return e
+
+    items = list(items)
+    if not items:
+        return []
+    workers = max(1, min(len(items), key_count(provider) * per_key))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{provider}-fan-out") as pool:
+        return list(pool.map(call, items))
+
+
+def status():
+    """One dict per provider key with breaker state and remaining budget, for dashboards and batch pacing."""
+    now = time.time()
+    with _lock:
+        return [
+            {
+                "provider": health.provider,
+                "key": health.label,
+                "state": OPEN if health.state == OPEN and now < health.opened_until else health.state,
+                "remaining": health.remaining(now),
+                "limit": health.limit,
+                "window_s": health.window,
+                "consecutive_failures": health.failures,
+                "retry_in_s": round(health.wait_time(now), 1),
+                "last_error": health.last_error,
+            }
+            for pool in _pools.values()
+            for health in pool
+        ]
@@ -0,0 +1,229 @@
+"""Resumable re-audit of every record in the Airtable registry.
+
+After a threshold change or a fix to the USDA scaling, the stored "Audit
+Colour" and "Audit Result" columns are stale. This job streams the table page
+by page, rebuilds each record's label and USDA nutrients (from the stored
+columns, or refetched by FDC_ID with --refetch-usda), re-runs the audit
+against the record's own "Audit Profile" (--profile for records without one,
+which is then written to them) and PATCHes only the records whose verdict
+changed, ten per request. Listing and
+updates share the Airtable quota (5 req/s), so the job paces itself instead of
+tripping the 30 second penalty.
+
+Progress goes to a JSONL checkpoint, one line per finished page with the
+record IDs done and the next page offset. Re-running with the same checkpoint
+resumes after the last finished page; if Airtable has expired the page offset,
+the job lists from the start again and skips the records already done.
+
+    python -m renal_app.reaudit --checkpoint data/reaudit.jsonl --profile dialysis
+"""
+
+import argparse
+import json
+import os
+import time
+
+import streamlit as st
+
+from renal_app import quota
+from renal_app.airtable_api import audit_result_text, split_audit_result
+from renal_app.core import airtable as core_airtable
+from renal_app.core.results import CONFIG, HTTP
+from renal_app.logic import DEFAULT_PROFILE, get_audit_details, get_rule_profiles
+from renal_app.nutrients import ComparisonRecord, NutrientVector, NUTRIENTS_TO_DISPLAY, units
+from renal_app.providers import call
+from renal_app.quota import ProviderError
+from renal_app.usda_api import fetch_many_usda_food_details
+
+RETRY_ATTEMPTS = 5
+
+NUTRIENT_FIELDS = [f"{prefix} {name} ({units[name]})" for prefix in ("Label", "USDA") for name in NUTRIENTS_TO_DISPLAY]
+READ_FIELDS = ["FDC_ID", "Serving Size", "Serving Unit", "Audit Profile", "Audit Colour", "Audit Result", *NUTRIENT_FIELDS]
+
+
+def _airtable(func, *args):
+    """Calls an Airtable core function, waiting out the shared budget and retrying transient failures."""
+    for attempt in range(RETRY_ATTEMPTS):
+        delay = quota.wait_time("airtable")
+        if delay:
+            time.sleep(delay)
+        try:
+            return call(func, *args)
+        except ProviderError as e:
+            failure = e.failure
+            permanent = failure is not None and (
+                failure.kind == CONFIG or (failure.kind == HTTP and (failure.status_code or 500) < 500)
+            )
+            if permanent or attempt == RETRY_ATTEMPTS - 1:
+                raise
+            time.sleep(min(2 ** attempt, 30))
+
+
+def _fdc_id(fields):
+    value = str(fields.get("FDC_ID") or "")
+    return int(value) if value.isdigit() else None
+
+
+def _usda_key(fields):
+    fdc_id = _fdc_id(fields)
+    if fdc_id is None:
+        return None
+    return fdc_id, fields.get("Serving Size"), fields.get("Serving Unit")
+
+
+def _fetch_usda(keys, known):
+    """Fetches serving-scaled USDA nutrients for keys not in known, spread over the USDA key pool."""
+    missing = [key for key in dict.fromkeys(keys) if key is not None and key not in known]
+    results = fetch_many_usda_food_details([key[0] for key in missing], [key[1:] for key in missing])
+    for key, details in zip(missing, results):
+        nutrients = None if "error" in details else details["nutrients"]
+        known[key] = NutrientVector.from_mapping(nutrients) if nutrients else None
+
+
+def reaudit_record(record, profile, usda=None):
+    """
+    The changed fields for one registry record ({} when its verdict still stands), audited
+    against profile, which is recorded on records that have none. usda replaces the stored
+    USDA nutrients when given.
+    """
+    fields = record.get("fields", {})
+    label = NutrientVector.from_fields(fields, "Label")
+    stored_usda = NutrientVector.from_fields(fields, "USDA")
+    usda = usda if usda is not None else stored_usda
+
+    report = get_audit_details(ComparisonRecord(label, usda), profile)
+    changes = {}
+    if not fields.get("Audit Profile"):
+        changes["Audit Profile"] = profile.name
+    if report["color"] != fields.get("Audit Colour"):
+        changes["Audit Colour"] = report["color"]
+    result = audit_result_text(report, split_audit_result(fields.get("Audit Result"))[2])
+    if result != (fields.get("Audit Result") or ""):
+        changes["Audit Result"] = result
+    if usda is not stored_usda:
+        # Refetched values are written back too, so the registry matches the verdict
+        changes.update({
+            name: value
+            for name, value in usda.to_fields("USDA").items()
+            if fields.get(name) != value
+        })
+    return changes
+
+
+def _read_checkpoint(path):
+    """(job options, done record IDs, next offset, finished, changed count) from a checkpoint file."""
+    job, done, offset, finished, changed = None, set(), None, False, 0
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if "job" in entry:
+                    job = entry["job"]
+                    continue
+                done.update(entry["done"])
+                changed += entry["changed"]
+                offset = entry["offset"]
+                finished = offset is None
+    return job, done, offset, finished, changed
+
+
+def _append_checkpoint(path, entry):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def registry_pages(offset=None, fields=READ_FIELDS):
+    """Yields (records, next offset) from offset to the last page, restarting if the offset has expired."""
+    while True:
+        try:
+            page = _airtable(core_airtable.list_records, offset, fields)
+        except ProviderError as e:
+            # Airtable drops page iterators after a while (422 LIST_RECORDS_ITERATOR_NOT_AVAILABLE)
+            if offset and e.failure is not None and e.failure.status_code == 422:
+                offset = None
+                continue
+            raise
+        yield page["records"], page["offset"]
+        offset = page["offset"]
+        if not offset:
+            return
+
+
+def reaudit_registry(checkpoint_path, profile=DEFAULT_PROFILE, refetch_usda=False, dry_run=False, progress=None):
+    """
+    Re-audits the whole registry, resuming from checkpoint_path if it holds an unfinished run.
+    Records are audited against their own profile; profile covers those without a known one.
+    progress(stats) is called after every page. Returns the stats dict.
+    """
+    options = {"profile": profile, "refetch_usda": refetch_usda, "dry_run": dry_run}
+    job, done, offset, finished, changed = _read_checkpoint(checkpoint_path)
+    if job is not None and job != options:
+        raise ValueError(f"{checkpoint_path} belongs to a run with {job}; use another checkpoint or --restart")
+    if job is None:
+        _append_checkpoint(checkpoint_path, {"job": options})
+
+    stats = {"processed": len(done), "changed": changed, "resumed": bool(done), "finished": finished}
+    if finished:
+        return stats
+
+    profiles = get_rule_profiles()
+    if profile not in profiles:
+        raise ValueError(f"Unknown rule profile {profile!r}; available: {', '.join(profiles)}")
+    fallback = profiles[profile]
+    usda_cache = {}
+    for records, next_offset in registry_pages(offset):
+        records = [record for record in records if record["id"] not in done]
+        if refetch_usda:
+            _fetch_usda([_usda_key(record.get("fields", {})) for record in records], usda_cache)
+
+        updates = []
+        for record in records:
+            fields = record.get("fields", {})
+            usda = usda_cache.get(_usda_key(fields)) if refetch_usda else None
+            # Each record keeps the profile it was audited against, when this deployment still has it
+            changes = reaudit_record(record, profiles.get(fields.get("Audit Profile"), fallback), usda)
+            if changes:
+                updates.append({"id": record["id"], "fields": changes})
+
+        if not dry_run:
+            for start in range(0, len(updates), core_airtable.AIRTABLE_BATCH_SIZE):
+                _airtable(core_airtable.update_records, updates[start:start + core_airtable.AIRTABLE_BATCH_SIZE])
+
+        ids = [record["id"] for record in records]
+        done.update(ids)
+        _append_checkpoint(checkpoint_path, {"offset": next_offset, "done": ids, "changed": len(updates)})
+        stats["processed"] += len(ids)
+        stats["changed"] += len(updates)
+        if progress:
+            progress(stats)
+
+    stats["finished"] = True
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-audit every record in the Airtable registry.")
+    parser.add_argument("--checkpoint", default="data/reaudit.jsonl", help="Progress file; reused to resume")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, help="Rule profile for records without one")
+    parser.add_argument("--refetch-usda", action="store_true", help="Refetch USDA nutrients by FDC_ID")
+    parser.add_argument("--dry-run", action="store_true", help="Count changes without writing them")
+    parser.add_argument("--restart", action="store_true", help="Discard the checkpoint and start over")
+    args = parser.parse_args()
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    def report(stats):
+        print(f"{stats['processed']} records re-audited, {stats['changed']} changed", flush=True)
+
+    stats = reaudit_registry(args.checkpoint, args.profile, args.refetch_usda, args.dry_run, progress=report)
+    print(f"Done: {stats['processed']} records, {stats['changed']} changed")
+
+
+if __name__ == "__main__":
+    main()
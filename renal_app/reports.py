@@ -0,0 +1,396 @@
+"""Printable audit reports (HTML, or PDF when WeasyPrint is installed).
+
+A report is rendered from a stored audit record (the Airtable fields written
+by prepare_airtable_record): the label-vs-USDA grid from
+nutrient_comparison_style, the flags, the discrepancies and the AI ingredient
+warnings. Rendering runs on a small worker pool, never on the script thread,
+and the output is cached on disk by audit fingerprint, so the same audit is
+rendered once however often or by however many sessions it is downloaded.
+The cache keeps the most recently used reports up to REPORT_CACHE_MAX_BYTES.
+
+Bulk export writes many reports into one zip archive entry by entry, so
+memory use stays flat whatever the number of audits. Its reports are rendered
+into a scratch directory rather than the cache, so an export does not push
+out the reports users are downloading. The Admin page runs the export as a
+background job (`start_registry_export`) that writes the archive to
+REPORT_EXPORT_PATH; from the command line:
+
+    python -m renal_app.reports --out reports.zip [--format pdf]
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import streamlit as st
+
+from renal_app.airtable_api import split_audit_result
+from renal_app.logic import calculate_delta
+from renal_app.nutrients import NutrientVector, NUTRIENTS_TO_DISPLAY, units
+from renal_app.reaudit import registry_pages
+from renal_app.styles import delta_color, nutrient_comparison_style
+
+try:
+    from weasyprint import HTML
+except ImportError:  # PDF export is optional, HTML always works
+    HTML = None
+
+REPORT_CACHE_PATH = st.secrets.get("REPORT_CACHE_PATH") or os.path.join(tempfile.gettempdir(), "renal_reports")
+REPORT_CACHE_MAX_BYTES = int(st.secrets.get("REPORT_CACHE_MAX_BYTES", 200_000_000))
+REPORT_EXPORT_PATH = st.secrets.get("REPORT_EXPORT_PATH") or os.path.join(tempfile.gettempdir(), "renal_report_exports")
+REPORT_WORKERS = 2
+PRUNE_INTERVAL = 60
+# Bump when the report layout changes, so cached reports are rendered again
+REPORT_VERSION = 2
+
+FORMATS = {"html": "text/html", "pdf": "application/pdf"}
+COLOUR_STATUSES = {"red": "🔴 High Renal Load", "yellow": "🟡 Use Caution", "green": "🟢 Renal Safe"}
+REPORT_FIELDS = [
+    "Product", "Brand", "Serving Size", "Serving Unit", "FDC_ID", "Audit Profile", "Audit Colour", "Audit Result",
+    "Label Ingredients", "USDA Ingredients",
+    *(f"{prefix} {name} ({units[name]})" for prefix in ("Label", "USDA") for name in NUTRIENTS_TO_DISPLAY),
+]
+
+_lock = threading.Lock()
+_pool = None
+_pending = {}   # (fingerprint, format) -> Future of the report path
+_last_prune = 0.0
+_exports = {}   # format -> status of the latest registry export
+
+
+def formats():
+    """The report formats this server can render."""
+    return [fmt for fmt in FORMATS if fmt != "pdf" or HTML is not None]
+
+
+def audit_fingerprint(fields):
+    """Hash of everything a report shows, so an unchanged audit maps to the same cached report."""
+    content = {name: fields.get(name) for name in REPORT_FIELDS}
+    payload = json.dumps([REPORT_VERSION, content], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _product_name(fields):
+    return f"{fields.get('Brand') or ''} {fields.get('Product') or ''}".strip() or "Unknown Product"
+
+
+def _items(title, lines):
+    if not lines:
+        return ""
+    items = "".join(f"<li>{html.escape(str(line))}</li>" for line in lines)
+    return f"<h2>{title}</h2><ul>{items}</ul>"
+
+
+def render_html(fields):
+    """The report for one audit record as a standalone HTML page."""
+    label = NutrientVector.from_fields(fields, "Label")
+    usda = NutrientVector.from_fields(fields, "USDA")
+    flags, discrepancies, ai_report = split_audit_result(fields.get("Audit Result"))
+
+    rows = []
+    for nutrient in NUTRIENTS_TO_DISPLAY:
+        delta_percent = calculate_delta(label[nutrient], usda[nutrient])
+        rows.append(nutrient_comparison_style(
+            {"label": label[nutrient], "usda": usda[nutrient]},
+            delta_color(delta_percent), delta_percent, nutrient, units[nutrient],
+        ))
+
+    product = html.escape(_product_name(fields))
+    serving = html.escape(f"{fields.get('Serving Size') or '-'} {fields.get('Serving Unit') or ''}".strip())
+    status = COLOUR_STATUSES.get(fields.get("Audit Colour"), "Not audited")
+    ai_text = ai_report if ai_report and ai_report != "None" else ""
+    ingredients = fields.get("Label Ingredients") or fields.get("USDA Ingredients") or ""
+
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Audit report: {product}</title>
+<style>
+    body {{ font-family: sans-serif; max-width: 640px; margin: 2rem auto; color: #222; }}
+    h1 {{ font-size: 1.4rem; margin-bottom: 0.2rem; }}
+    h2 {{ font-size: 1.1rem; margin-top: 1.5rem; }}
+    .meta {{ color: #666; font-size: 0.85rem; }}
+    .status {{ font-size: 1.1rem; font-weight: bold; margin: 1rem 0; }}
+    .header {{ display: grid; grid-template-columns: 1fr 100px 1fr; font-weight: bold; text-align: center;
+              border-bottom: 2px solid #31333F; margin-bottom: 0.5rem; padding: 0.25rem; }}
+</style>
+</head>
+<body>
+<h1>{product}</h1>
+<div class="meta">Serving Size: {serving} | FDC ID: {html.escape(str(fields.get('FDC_ID') or '-'))} | Profile: {html.escape(str(fields.get('Audit Profile') or '-'))}</div>
+<div class="status">{status}</div>
+<div class="header"><div>Label</div><div>Nutrient</div><div>USDA</div></div>
+{''.join(rows)}
+{_items("Flags", flags)}
+{_items("Discrepancies", discrepancies)}
+{_items("AI Ingredient Warnings", [ai_text] if ai_text else [])}
+{_items("Ingredients", [ingredients] if ingredients else [])}
+</body>
+</html>
+"""
+
+
+def _report_path(fingerprint, fmt):
+    return os.path.join(REPORT_CACHE_PATH, f"{fingerprint}.{fmt}")
+
+
+def _render(fields, fmt, path):
+    """Renders a report to path (via a temp file, so readers never see a partial report)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    page = render_html(fields)
+    if fmt == "pdf":
+        HTML(string=page).write_pdf(tmp)
+    else:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(page)
+    os.replace(tmp, path)
+    return path
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="report")
+        return _pool
+
+
+def _check_format(fmt):
+    if fmt not in formats():
+        raise ValueError(f"Unsupported report format {fmt!r}; available: {', '.join(formats())}")
+
+
+def prune_report_cache(force=False):
+    """
+    Deletes the least recently used cached reports until the cache is under
+    REPORT_CACHE_MAX_BYTES. Runs at most every PRUNE_INTERVAL seconds unless forced;
+    returns the number of reports deleted.
+    """
+    global _last_prune
+    with _lock:
+        now = time.time()
+        if not force and now - _last_prune < PRUNE_INTERVAL:
+            return 0
+        _last_prune = now
+
+    reports = []
+    try:
+        entries = list(os.scandir(REPORT_CACHE_PATH))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if entry.name.endswith(".tmp"):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        reports.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in reports)
+    deleted = 0
+    for _, size, path in sorted(reports):
+        if total <= REPORT_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            deleted += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+    return deleted
+
+
+def submit_report(fields, fmt="html"):
+    """
+    Starts rendering the report for an audit record in the background and returns a
+    Future of its file path. Cached reports resolve at once, and a report already being
+    rendered is shared rather than rendered twice.
+    """
+    _check_format(fmt)
+    fingerprint = audit_fingerprint(fields)
+    path = _report_path(fingerprint, fmt)
+    try:
+        # A hit counts as a use, so pruning deletes the reports nobody has asked for lately
+        os.utime(path)
+        future = Future()
+        future.set_result(path)
+        return future
+    except FileNotFoundError:
+        pass
+
+    prune_report_cache()
+    key = (fingerprint, fmt)
+    pool = _get_pool()
+    with _lock:
+        future = _pending.get(key)
+        started = future is None
+        if started:
+            # Copy the fields so later edits by the caller don't change what is rendered
+            future = _pending[key] = pool.submit(_render, dict(fields), fmt, path)
+    if started:
+        # Outside the lock: the callback runs at once if the render has already finished
+        future.add_done_callback(lambda _: _forget(key))
+    return future
+
+
+def _forget(key):
+    with _lock:
+        _pending.pop(key, None)
+
+
+def report_bytes(fields, fmt="html"):
+    """The rendered report, waiting for the background render if it is still running."""
+    try:
+        with open(submit_report(fields, fmt).result(), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        # Pruned between the lookup and the read: render it again
+        with open(submit_report(fields, fmt).result(), "rb") as f:
+            return f.read()
+
+
+def report_filename(fields, fmt="html", record_id=None):
+    slug = re.sub(r"[^a-z0-9]+", "_", _product_name(fields).lower()).strip("_") or "audit"
+    suffix = record_id or audit_fingerprint(fields)[:8]
+    return f"{slug[:60]}_{suffix}.{fmt}"
+
+
+def write_reports_zip(records, out, fmt="html"):
+    """
+    Writes the reports of records ({"id", "fields"} dicts, any iterable) into a zip archive
+    on out, which may be unseekable (e.g. stdout). At most 2 x REPORT_WORKERS reports
+    are rendered ahead of the one being written, each into a scratch file that is copied
+    in and deleted, so memory and disk use do not grow with the number of records and
+    the report cache is left alone. Returns the count written.
+    """
+    _check_format(fmt)
+    pool = _get_pool()
+    ahead = deque()
+    written = 0
+    with tempfile.TemporaryDirectory(prefix="renal_export_") as scratch, \
+            zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        def write_next():
+            record, future = ahead.popleft()
+            name = report_filename(record.get("fields", {}), fmt, record.get("id"))
+            path = future.result()
+            with open(path, "rb") as src, archive.open(name, "w") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(path)
+
+        for index, record in enumerate(records):
+            path = os.path.join(scratch, f"{index}.{fmt}")
+            ahead.append((record, pool.submit(_render, dict(record.get("fields", {})), fmt, path)))
+            if len(ahead) >= 2 * REPORT_WORKERS:
+                write_next()
+                written += 1
+        while ahead:
+            write_next()
+            written += 1
+    return written
+
+
+def registry_records(fields=REPORT_FIELDS):
+    """Every record in the Airtable registry, streamed page by page."""
+    for records, _ in registry_pages(fields=fields):
+        yield from records
+
+
+def export_registry(path, fmt="html"):
+    """
+    Writes the reports of the whole registry to a zip file at path (via a temp file, so
+    an earlier export stays whole until the new one is done); returns the count written.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            count = write_reports_zip(registry_records(), f, fmt)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return count
+
+
+def registry_export_path(fmt="html"):
+    return os.path.join(REPORT_EXPORT_PATH, f"audit_reports_{fmt}.zip")
+
+
+def registry_export_bytes(fmt="html"):
+    """The latest finished registry export in fmt, read for a download button."""
+    with open(registry_export_path(fmt), "rb") as f:
+        return f.read()
+
+
+def _stored_export(fmt):
+    """Status for an archive written earlier, possibly by another process, or for none."""
+    path = registry_export_path(fmt)
+    if os.path.exists(path):
+        return {"state": "done", "path": path, "count": None, "finished": os.path.getmtime(path), "error": None}
+    return {"state": "idle", "path": None, "count": None, "finished": None, "error": None}
+
+
+def registry_export_status(fmt="html"):
+    """State of the latest registry export in fmt (idle, running, done or failed) and its archive path."""
+    with _lock:
+        status = _exports.get(fmt)
+        if status is not None:
+            return dict(status)
+    return _stored_export(fmt)
+
+
+def _run_export(fmt):
+    path = registry_export_path(fmt)
+    try:
+        changes = {"state": "done", "path": path, "count": export_registry(path, fmt), "finished": time.time()}
+    except Exception as e:
+        # The previous archive, if any, is still there and still offered
+        changes = {"state": "failed", "error": str(e)}
+    with _lock:
+        _exports[fmt].update(changes)
+
+
+def start_registry_export(fmt="html"):
+    """
+    Starts writing the registry export in fmt to REPORT_EXPORT_PATH in a daemon thread,
+    unless one is already running. Returns its status; the previous archive stays
+    available until the new one replaces it.
+    """
+    _check_format(fmt)
+    with _lock:
+        status = _exports.get(fmt)
+        if status is None or status["state"] != "running":
+            status = _exports[fmt] = {**(status or _stored_export(fmt)), "state": "running", "error": None}
+            threading.Thread(target=_run_export, args=(fmt,), name=f"report-export-{fmt}", daemon=True).start()
+        return dict(status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export audit reports of the whole Airtable registry as a zip.")
+    parser.add_argument("--out", default="-", help="Zip file to write, or - for stdout")
+    parser.add_argument("--format", default="html", choices=list(FORMATS), help="Report format")
+    args = parser.parse_args()
+
+    if args.out == "-":
+        count = write_reports_zip(registry_records(), sys.stdout.buffer, args.format)
+    else:
+        count = export_registry(args.out, args.format)
+    print(f"Exported {count} report(s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Versioned audit rule profiles compiled to threshold arrays.
+
+A rule profile (JSON, or YAML when PyYAML is installed) sets per-serving
+limits, a label-vs-USDA discrepancy tolerance and a severity for each
+nutrient:
+
+    {
+      "name": "dialysis",
+      "version": 1,
+      "title": "Dialysis",
+      "discrepancy_tolerance": 20,
+      "rules": {
+        "Potassium": {"limit": 200, "severity": "high"},
+        "Sugar": {"limit": 15, "severity": "caution", "tolerance": 30}
+      },
+      "daily_budgets": {"Sodium": 2000, "Potassium": 2000, "Phosphorus": 1000}
+    }
+
+Severities: "high" makes the audit red (High Renal Load), "caution" yellow
+(Use Caution), "info" only lists the flag. A nutrient without a limit is not
+flagged, and one with tolerance null is not checked for discrepancies.
+daily_budgets are the day's totals the intake log measures against.
+
+Profiles are compiled once per (name, version, content hash) into arrays
+over NUTRIENTS_TO_DISPLAY and stacked into a RuleSet, so any number of records
+can be evaluated against any number of profiles in one numpy pass. Bump the
+version whenever a profile file changes; the hash keeps an override file that
+reuses a built-in's name and version from getting the built-in's arrays.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from renal_app.nutrients import NUTRIENT_INDEX, NUTRIENTS_TO_DISPLAY
+
+try:
+    import yaml
+except ImportError:  # YAML profiles are optional, JSON always works
+    yaml = None
+
+BUILTIN_PROFILES_PATH = os.path.join(os.path.dirname(__file__), "rule_profiles")
+DEFAULT_PROFILE = "default"
+DEFAULT_TOLERANCE = 20
+
+SEVERITIES = {"info": 0, "caution": 1, "high": 2}
+
+# Status codes, ordered so the worst finding wins
+SAFE, MISMATCH, CAUTION, HIGH = 0, 1, 2, 3
+STATUSES = {
+    SAFE: ("Renal Safe", "green"),
+    MISMATCH: ("Data Mismatch", "yellow"),
+    CAUTION: ("Use Caution", "yellow"),
+    HIGH: ("High Renal Load", "red"),
+}
+
+
+def spec_digest(spec):
+    """Short hash of a profile spec's content, independent of key order."""
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class CompiledProfile:
+    """One rule profile as arrays aligned with NUTRIENTS_TO_DISPLAY (NaN = no rule)."""
+
+    __slots__ = ("name", "version", "digest", "title", "limits", "tolerances", "severities", "limit_values", "daily_budgets")
+
+    def __init__(self, spec):
+        self.name = str(spec["name"])
+        self.version = spec.get("version", 1)
+        self.digest = spec_digest(spec)
+        self.title = spec.get("title") or self.name.title()
+        size = len(NUTRIENTS_TO_DISPLAY)
+        self.limits = np.full(size, np.nan)
+        self.tolerances = np.full(size, np.nan)
+        self.severities = np.full(size, SEVERITIES["high"], dtype=np.int8)
+        # The limits as written in the profile, so messages read "140mg" rather than "140.0mg"
+        self.limit_values = {}
+        self.daily_budgets = dict(spec.get("daily_budgets") or {})
+        for nutrient in self.daily_budgets:
+            if nutrient not in NUTRIENT_INDEX:
+                raise ValueError(f"Rule profile {self.name!r}: unknown nutrient {nutrient!r} in daily_budgets")
+
+        default_tolerance = spec.get("discrepancy_tolerance", DEFAULT_TOLERANCE)
+        for nutrient, rule in (spec.get("rules") or {}).items():
+            if nutrient not in NUTRIENT_INDEX:
+                raise ValueError(f"Rule profile {self.name!r}: unknown nutrient {nutrient!r}")
+            severity = rule.get("severity", "high")
+            if severity not in SEVERITIES:
+                raise ValueError(f"Rule profile {self.name!r}: unknown severity {severity!r} for {nutrient}")
+            i = NUTRIENT_INDEX[nutrient]
+            if rule.get("limit") is not None:
+                self.limits[i] = rule["limit"]
+                self.limit_values[nutrient] = rule["limit"]
+            tolerance = rule.get("tolerance", default_tolerance)
+            if tolerance is not None:
+                self.tolerances[i] = tolerance
+            self.severities[i] = SEVERITIES[severity]
+
+    @property
+    def key(self):
+        return self.name, self.version, self.digest
+
+    def __repr__(self):
+        return f"CompiledProfile({self.name!r}, version={self.version!r})"
+
+
+class RuleSet:
+    """Several compiled profiles stacked into (profiles x nutrients) arrays."""
+
+    __slots__ = ("profiles", "limits", "tolerances", "severities", "index")
+
+    def __init__(self, profiles):
+        self.profiles = list(profiles)
+        self.limits = np.array([p.limits for p in self.profiles]).reshape(-1, len(NUTRIENTS_TO_DISPLAY))
+        self.tolerances = np.array([p.tolerances for p in self.profiles]).reshape(self.limits.shape)
+        self.severities = np.array([p.severities for p in self.profiles], dtype=np.int8).reshape(self.limits.shape)
+        self.index = {p.name: i for i, p in enumerate(self.profiles)}
+
+    def evaluate(self, label, usda):
+        """
+        Evaluates (records x nutrients) label and USDA arrays (NaN = missing) against every profile.
+        Returns boolean (records x profiles x nutrients) masks label_over, usda_over and
+        mismatch, and the (records x profiles) status codes.
+        """
+        label = np.atleast_2d(np.asarray(label, dtype=np.float64))
+        usda = np.atleast_2d(np.asarray(usda, dtype=np.float64))
+        limits = self.limits[None]
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            label_over = label[:, None, :] > limits
+            usda_over = usda[:, None, :] > limits
+            # Missing values count as 0, as in calculate_delta: a zero or missing label gives no delta
+            delta = (np.nan_to_num(usda) - label) / np.where(label == 0, np.nan, label) * 100
+            mismatch = delta[:, None, :] > self.tolerances[None]
+
+        flagged = label_over | usda_over
+        worst = np.where(flagged, self.severities[None], -1).max(axis=2, initial=-1)
+        status = np.select(
+            [worst == SEVERITIES["high"], worst == SEVERITIES["caution"], mismatch.any(axis=2)],
+            [HIGH, CAUTION, MISMATCH],
+            default=SAFE,
+        )
+        return label_over, usda_over, mismatch, status
+
+
+_lock = threading.Lock()
+_compiled = {}
+_rule_sets = {}
+
+
+def compile_profile(spec):
+    """Compiles a profile spec, reusing the compiled arrays for a (name, version, content) seen before."""
+    key = (str(spec["name"]), spec.get("version", 1), spec_digest(spec))
+    with _lock:
+        compiled = _compiled.get(key)
+        if compiled is None:
+            compiled = _compiled[key] = CompiledProfile(spec)
+        return compiled
+
+
+def rule_set(profiles):
+    """The RuleSet for these compiled profiles, cached by their keys."""
+    key = tuple(profile.key for profile in profiles)
+    with _lock:
+        rules = _rule_sets.get(key)
+        if rules is None:
+            rules = _rule_sets[key] = RuleSet(profiles)
+        return rules
+
+
+def _read_spec(path):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def load_rule_profiles(*paths):
+    """
+    Compiles every profile file in the given directories, keyed by name. Later
+    directories override earlier ones, so a deployment can replace a built-in profile.
+    """
+    extensions = (".json", ".yaml", ".yml") if yaml is not None else (".json",)
+    specs = {}
+    for path in paths:
+        if not path or not os.path.isdir(path):
+            continue
+        for filename in sorted(os.listdir(path)):
+            if filename.endswith(extensions):
+                spec = _read_spec(os.path.join(path, filename))
+                specs[spec["name"]] = spec
+    return {name: compile_profile(spec) for name, spec in specs.items()}
+
+
+def builtin_profiles():
+    return load_rule_profiles(BUILTIN_PROFILES_PATH)
@@ -0,0 +1,86 @@
+"""Coalesces concurrent identical provider calls across sessions (single-flight).
+
+st.cache_data only helps once a response has landed. While the first call for
+a key is still in flight, every other session asking for the same key waits on
+that call's future instead of hitting the provider again:
+
+    @traced("usda", "search", cached=True)
+    @single_flight(normalize=normalize_query)
+    @st.cache_data(show_spinner=False)
+    def search_usda_foods(query, page_size=100):
+        ...
+"""
+
+import copy
+import functools
+import threading
+from concurrent.futures import Future
+
+from renal_app.metrics import mark_coalesced
+
+_lock = threading.Lock()
+_in_flight = {}
+
+
+class _Call:
+    __slots__ = ("future", "waiters")
+
+    def __init__(self):
+        self.future = Future()
+        self.waiters = 0
+
+
+def normalize_query(query, *args, **kwargs):
+    """Search text is case- and whitespace-insensitive, so "Greek  Yogurt" shares a call with "greek yogurt"."""
+    if isinstance(query, str):
+        query = " ".join(query.lower().split())
+    return (query, *args), kwargs
+
+
+def single_flight(normalize=None):
+    """
+    Decorator: concurrent calls with the same (normalized) arguments share one execution.
+    Waiters get a deep copy of the result, or the same exception. Calls with unhashable
+    arguments run normally.
+    """
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if normalize:
+                args, kwargs = normalize(*args, **kwargs)
+            key = (name, args, tuple(sorted(kwargs.items())))
+            try:
+                hash(key)
+            except TypeError:
+                return func(*args, **kwargs)
+
+            with _lock:
+                call = _in_flight.get(key)
+                leader = call is None
+                if leader:
+                    call = _in_flight[key] = _Call()
+                else:
+                    call.waiters += 1
+
+            if not leader:
+                mark_coalesced()
+                return copy.deepcopy(call.future.result())
+
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                with _lock:
+                    del _in_flight[key]
+                call.future.set_exception(e)
+                raise
+
+            with _lock:
+                del _in_flight[key]
+                shared = call.waiters > 0
+            call.future.set_result(result)
+            # Waiters copy the result we hand to the future, so keep ours separate
+            return copy.deepcopy(result) if shared else result
+        return wrapper
+    return decorator
@@ -91,6 +91,13 @@ def apply_custom_styles():
     )
 
 
+def delta_color(delta_percent):
+    """Red when the USDA value is higher than the label, green when lower, grey when unknown."""
+    if delta_percent is None:
+        return "#666"
+    return "#ff4b4b" if delta_percent > 0 else "#00cc66"
+
+
 def nutrient_comparison_style(values, delta_color, delta_percent, nutrient, unit):
     """
     Generate the HTML style for nutrient comparison.
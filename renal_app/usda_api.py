@@ -1,55 +1,80 @@
-import requests
 import streamlit as st
 from rapidfuzz import fuzz
+from renal_app.logic import USDA_NUTRIENT_IDS
+from renal_app.nutrients import NutrientVector, to_float
+from renal_app.conversions import base_unit, conversion_factors, rebase_factors, to_base_amount
+from renal_app.metrics import traced, mark_cache_miss
+from renal_app.singleflight import single_flight, normalize_query
+from renal_app.profiles import (
+    load_profiles, find_profile, find_profile_by_gtin, profile_row, profile_text,
+    profile_search_choices, search_profiles,
+)
+from renal_app.barcodes import GtinIndex, decode_barcodes, gtin_text
+from renal_app import quota
+from renal_app.quota import ProviderError
+from renal_app.providers import call
+from renal_app.core import usda as core_usda
+from renal_app.alternatives import build_alternatives_index, find_safer_alternatives
+from renal_app.local_cache import remember_search
 
-USDA_API_KEY = st.secrets.get("USDA_API_KEY")
-USDA_SEARCH_URL = "https://api.nal.usda.gov/fdc/v1/foods/search"
+RENAL_PROFILE_PATH = st.secrets.get("RENAL_PROFILE_PATH", "data/renal_profiles")
+GTIN_INDEX_PATH = st.secrets.get("GTIN_INDEX_PATH", "data/gtin_index.jsonl")
+MIRROR_DATA_TYPE = "Local Mirror"
 
-def to_float(val):
-    """
-    Safely converts any input (String, None, Int) to a Float.
-    Returns 0.0 if the input is invalid or missing.
-    """
-    # 1. Handle None or empty values immediately
-    if val is None or str(val).strip() == "" or str(val).lower() == "null":
-        return 0.0
-    
-    try:
-        # 2. Clean the string (remove commas or spaces just in case)
-        if isinstance(val, str):
-            val = val.replace(",", "").strip()
-            
-        # 3. Perform the conversion
-        return float(val)
-        
-    except (ValueError, TypeError):
-        # 4. If someone types "N/A" or "Unknown", return 0.0 instead of crashing
-        return 0.0
+# st.cache_data keeps every entry until the process exits unless bounded
+SEARCH_CACHE_ENTRIES = 500
+FOOD_CACHE_ENTRIES = 2000
+
+# Fields of a search hit the app reads; the rest of the FDC payload is dropped before caching
+SEARCH_FOOD_FIELDS = (
+    "fdcId", "description", "dataType", "gtinUpc", "brandOwner", "brandName", "ingredients",
+    "servingSize", "servingSizeUnit", "householdServingFullText", "brandedFoodCategory",
+    "foodCategory", "packageWeight",
+)
+
+def _slim_search_results(results):
+    foods = [
+        {
+            **{field: food[field] for field in SEARCH_FOOD_FIELDS if field in food},
+            "foodNutrients": [
+                {"nutrientId": nutrient["nutrientId"], "value": nutrient.get("value")}
+                for nutrient in food.get("foodNutrients", [])
+                if nutrient.get("nutrientId") in USDA_NUTRIENT_IDS
+            ],
+        }
+        for food in results.get("foods", [])
+    ]
+    return {"totalHits": results.get("totalHits"), "foods": foods}
+
+@traced("usda", "search", cached=True)
+@single_flight(normalize=normalize_query)
+@st.cache_data(show_spinner=False, max_entries=SEARCH_CACHE_ENTRIES)
+def _search_usda_api(query, page_size=100):
+    """Calls the FDC search endpoint. Raises ProviderError so failures are not cached."""
+    mark_cache_miss()
+    results = _slim_search_results(call(core_usda.search_foods, query, page_size))
+    get_gtin_index().add_foods(results["foods"])
+    return results
 
-@st.cache_data(show_spinner=False)
 def search_usda_foods(query, page_size=100):
     """
     Search the USDA FoodData Central database for foods matching the query.
+    Falls back to the local FDC mirror (the renal profile table) when the API
+    is over quota or its circuit is open.
     Args:
         query (str): The search term (food name, brand, etc.)
         page_size (int): Number of results to return (default 10)
     Returns:
         dict: JSON response from USDA API or error message
     """
-    if not USDA_API_KEY:
-        raise ValueError("USDA_API_KEY environment variable not set.")
-    params = {
-        "api_key": USDA_API_KEY,
-        "query": query,
-        "pageSize": page_size,
-    }
     try:
-        response = requests.get(USDA_SEARCH_URL, params=params, timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
+        return _search_usda_api(query, page_size)
+    except ProviderError as e:
+        foods = search_local_mirror(query, page_size)
+        if foods:
+            return {"foods": foods, "source": "mirror"}
         return {"error": str(e)}
-    
+
 def sort_results_by_relevance(foods, query):
     query = query.lower()
     for item in foods:
@@ -95,7 +120,7 @@ def display_and_select_usda_results(foods, search_query, radio_key="usda_product
         return False
     
     # Step 1: Filter by allowed types
-    allowed_types = ["Branded", "Foundation", "Survey (FNDDS)"]
+    allowed_types = ["Branded", "Foundation", "Survey (FNDDS)", MIRROR_DATA_TYPE]
     filtered_foods = [
         f for f in foods 
         if f.get("dataType") in allowed_types
@@ -150,6 +175,64 @@ def display_and_select_usda_results(foods, search_query, radio_key="usda_product
     
     return False
 
+@st.cache_resource
+def get_gtin_index():
+    """GTINs seen in USDA search results, loaded once per process."""
+    return GtinIndex(GTIN_INDEX_PATH)
+
+@traced("barcode", "decode", cached=True)
+@st.cache_data(show_spinner=False, max_entries=FOOD_CACHE_ENTRIES)
+def _decode_photo_barcodes(image_bytes):
+    mark_cache_miss()
+    return decode_barcodes(image_bytes)
+
+@traced("barcode", "resolve")
+def resolve_gtin(gtin):
+    """
+    The FDC item for a scanned GTIN as {"fdc_id", "name"}, or None if it is not found.
+    Checks the profile table, then GTINs learned from earlier searches, then searches USDA for the code.
+    """
+    profiles = get_renal_profiles()
+    row = find_profile_by_gtin(profiles, gtin) if profiles else None
+    if row is not None:
+        brand = profile_text(profiles, row, "brand") or "Generic"
+        description = profile_text(profiles, row, "description")
+        return {"fdc_id": int(profiles["fdc_id"][row]), "name": f"{brand.title()} - {clean_usda_label(description)}"}
+
+    index = get_gtin_index()
+    entry = index.get(gtin)
+    if entry is None:
+        try:
+            results = _search_usda_api(gtin_text(gtin), 25)
+        except ProviderError:
+            return None
+        index.add_foods(results.get("foods", []))
+        entry = index.get(gtin)
+    if entry is None:
+        return None
+    brand = entry["brand"] or "Generic"
+    return {"fdc_id": entry["fdc_id"], "name": f"{brand.title()} - {clean_usda_label(entry['description'])}"}
+
+def select_food_by_barcode(images):
+    """
+    Reads barcodes from the photos and selects the first FDC item one of them resolves to.
+    Returns (gtin, match): match is None when a code was read but is not in FDC,
+    and both are None when no barcode was read.
+    """
+    gtins = list(dict.fromkeys(gtin for image in images for gtin in _decode_photo_barcodes(image)))
+    if not gtins:
+        return None, None
+    for gtin in gtins:
+        match = resolve_gtin(gtin)
+        if match:
+            # Only select once per code, so a later manual pick is not overwritten on rerun
+            if st.session_state.get("barcode_gtin") != gtin:
+                st.session_state["barcode_gtin"] = gtin
+                st.session_state["selected_fdc_id"] = match["fdc_id"]
+                st.session_state["selected_food_name"] = match["name"]
+            return gtin, match
+    return gtins[0], None
+
 def usda_manual_entry_wizard():
     search_query = st.text_input("Enter product name (e.g., 'Greek Yogurt Liberte')", key="usda_search_input")
 
@@ -162,49 +245,191 @@ def usda_manual_entry_wizard():
             st.error(f"Error: {results['error']}")
         else:
             foods = results.get('foods', [])
+            remember_search(search_query, foods)
+            if results.get("source") == "mirror":
+                st.caption("USDA is unavailable right now, showing matches from the local FDC mirror.")
             
             # 2. Display and handle selection
             display_and_select_usda_results(foods, search_query, radio_key="manual_entry_usda_radio")
 
-def _build_food_details(food, label_serving_size=None):
+@traced("usda", "food", cached=True)
+@st.cache_data(show_spinner=False, max_entries=FOOD_CACHE_ENTRIES)
+def fetch_usda_food(fdc_id):
+    """
+    Fetch the full FoodData Central record for one item (includes foodPortions).
+    Raises ProviderError when the API is unavailable, so failures are not cached.
+    """
+    mark_cache_miss()
+    return call(core_usda.fetch_food, fdc_id)
+
+@st.cache_data(show_spinner=False, max_entries=FOOD_CACHE_ENTRIES)
+def get_conversion_factors(fdc_id, base="g"):
+    """
+    Unit conversion factors from the item's household servings and foodPortions, cached per FDC ID,
+    in base units ("g" or "ml"). None when they can't be expressed in that base.
+    """
+    food = fetch_usda_food(fdc_id)
+    factors = conversion_factors(food)
+    return factors if base_unit(food) == base else rebase_factors(factors, base)
+
+def _resolve_conversion_factors(fdc_id, food, label_serving_size, label_serving_unit, base=None):
+    # Mass units (and branded household text) resolve from the payload we already have;
+    # only fetch foodPortions when the label uses a unit those can't convert.
+    # Without a payload (the profile table path) base says what the per-100 values are per.
+    base = base or base_unit(food)
+    factors = conversion_factors(food, base)
+    size = to_float(label_serving_size, default=None)
+    if size and to_base_amount(size, label_serving_unit, factors) is None:
+        try:
+            # The full record can use another base (mL for drinks), so it is converted to ours first
+            fetched = get_conversion_factors(fdc_id, base)
+        except ProviderError:
+            fetched = None
+        if fetched:
+            factors = {**fetched, **factors}
+    return factors
+
+def _serving_amount(label_serving_size, label_serving_unit, factors, base="g"):
+    """
+    Returns (serving size, serving unit, base amount, converted) for scaling per-100 values.
+    Falls back to 100 base units, with converted False, when there is no label serving
+    or its unit can't be converted.
+    """
+    size = to_float(label_serving_size, default=None)
+    base_amount = to_base_amount(size, label_serving_unit, factors) if size else None
+    if base_amount is None:
+        return 100, base, 100, False
+    return size, label_serving_unit or "g", base_amount, True
+
+def _build_food_details(food, label_serving_size=None, label_serving_unit=None, factors=None):
     # USDA often uses 'description' for the product name
     product_name = food.get("description", "Unknown Product")
     brand = food.get("brandName", "Generic")
-    serving_size = label_serving_size if label_serving_size is not None else 100
-    serving_unit = food.get("servingSizeUnit", "g")
     ingredients = food.get("ingredients", "Not Available")
 
-    ratio = to_float(serving_size) / 100 if serving_size else 1.0
-
-    id_map = {
-        1003: "Protein", 1093: "Sodium", 1092: "Potassium",
-        1091: "Phosphorus", 2000: "Sugar", 1258: "Saturated Fat",
-        1257: "Trans Fat", 1008: "Calories",
-    }
+    factors = factors or conversion_factors(food)
+    serving_size, serving_unit, base_amount, converted = _serving_amount(
+        label_serving_size, label_serving_unit, factors, base_unit(food)
+    )
 
-    nutrients = {}
+    per_100g = NutrientVector()
     for nutrient in food.get("foodNutrients", []):
         nutrient_id = nutrient.get("nutrientId")
-        if nutrient_id in id_map:
-            clean_name = id_map[nutrient_id]
-            raw_value = nutrient.get("value", 0)
-            nutrients[clean_name] = round(raw_value * ratio, 2)
+        if nutrient_id in USDA_NUTRIENT_IDS:
+            per_100g[USDA_NUTRIENT_IDS[nutrient_id]] = nutrient.get("value", 0)
 
     return {
         "Product Name": product_name,
         "Brand": brand,
         "Serving Size": serving_size,
         "Serving Unit": serving_unit,
-        "nutrients": nutrients,
+        "Serving Base Amount": base_amount,
+        "Serving Converted": converted,
+        "nutrients": per_100g.scaled(base_amount / 100),
         "Ingredients": ingredients,
     }
 
 
-def fetch_usda_food_details(fdc_id, label_serving_size=None):
+@st.cache_resource
+def get_renal_profiles():
+    """Memory-maps the precomputed renal profile table once per process."""
+    return load_profiles(RENAL_PROFILE_PATH)
+
+@st.cache_resource
+def get_alternatives_index():
+    profiles = get_renal_profiles()
+    return build_alternatives_index(profiles) if profiles else None
+
+@st.cache_resource
+def get_mirror_search_choices():
+    profiles = get_renal_profiles()
+    return profile_search_choices(profiles) if profiles else None
+
+def _mirror_food(profiles, row):
+    """A profile table row in the shape of an FDC search result."""
+    profile = profile_row(profiles, row)
+    nutrients = profile["nutrients"]
+    return {
+        "fdcId": profile["fdc_id"],
+        "description": profile["description"],
+        "brandName": profile["brand"] or None,
+        "dataType": MIRROR_DATA_TYPE,
+        "ingredients": profile["ingredients"] or "Not Available",
+        "foodNutrients": [
+            {"nutrientId": nutrient_id, "value": nutrients[name]}
+            for nutrient_id, name in USDA_NUTRIENT_IDS.items()
+            if nutrients[name] is not None
+        ],
+    }
+
+def search_local_mirror(query, page_size=100):
+    """Searches the local profile table by FDC ID or fuzzy text, for when the USDA API is unavailable."""
+    profiles = get_renal_profiles()
+    if not profiles:
+        return []
+    if str(query).strip().isdigit():
+        row = find_profile(profiles, query)
+        rows = [] if row is None else [row]
+    else:
+        rows = search_profiles(get_mirror_search_choices(), str(query), limit=page_size)
+    return [_mirror_food(profiles, row) for row in rows]
+
+@st.cache_data(show_spinner=False)
+def recommend_safer_alternatives(fdc_id, k=5):
+    """
+    Finds similar products under the sodium, potassium and phosphorus limits.
+    Returns an empty list when the profile table is missing or lacks fdc_id.
+    """
+    index = get_alternatives_index()
+    if not index or fdc_id is None:
+        return []
+    return find_safer_alternatives(index, fdc_id, k=k)
+
+def _build_profile_details(profile, label_serving_size=None, label_serving_unit=None, factors=None):
+    factors = factors or conversion_factors(base=profile["base_unit"])
+    serving_size, serving_unit, base_amount, converted = _serving_amount(
+        label_serving_size, label_serving_unit, factors, profile["base_unit"]
+    )
+
+    return {
+        "Product Name": profile["description"] or "Unknown Product",
+        "Brand": profile["brand"] or "Generic",
+        "Serving Size": serving_size,
+        "Serving Unit": serving_unit,
+        "Serving Base Amount": base_amount,
+        "Serving Converted": converted,
+        "nutrients": profile["nutrients"].scaled(base_amount / 100),
+        "Ingredients": profile["ingredients"] or "Not Available",
+    }
+
+
+@traced("usda", "food_details")
+def fetch_usda_food_details(fdc_id, label_serving_size=None, label_serving_unit=None):
+    # Serve from the precomputed profile table when the item is in it
+    profiles = get_renal_profiles()
+    row = find_profile(profiles, fdc_id) if profiles else None
+    if row is not None:
+        profile = profile_row(profiles, row)
+        factors = _resolve_conversion_factors(fdc_id, None, label_serving_size, label_serving_unit, profile["base_unit"])
+        return _build_profile_details(profile, label_serving_size, label_serving_unit, factors)
+
     results = search_usda_foods(fdc_id, page_size=1)
     foods = results.get("foods", [])
 
     if not foods:
         return {"error": "Food item not found."}
 
-    return _build_food_details(foods[0], label_serving_size=label_serving_size)
\ No newline at end of file
+    factors = _resolve_conversion_factors(fdc_id, foods[0], label_serving_size, label_serving_unit)
+    return _build_food_details(foods[0], label_serving_size, label_serving_unit, factors)
+
+def fetch_many_usda_food_details(fdc_ids, servings=None):
+    """
+    Details for many FDC IDs for batch jobs, fetched in parallel across the USDA key pool.
+    servings holds a (label serving size, unit) pair per ID to scale to; without it the
+    values are per 100. Failed items come back as {"error": ...}.
+    """
+    servings = servings or [(None, None)] * len(fdc_ids)
+    results = quota.fan_out(
+        "usda", lambda item: fetch_usda_food_details(item[0], *item[1]), list(zip(fdc_ids, servings))
+    )
+    return [{"error": str(r)} if isinstance(r, Exception) else r for r in results]
@@ -1,9 +1,18 @@
 import io
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 from PIL import Image
-from renal_app.usda_api import usda_manual_entry_wizard
-from renal_app.gemini_api import extract_label_info_from_ocr
-from renal_app.ocr_api import perform_ocr
+from renal_app.usda_api import usda_manual_entry_wizard, select_food_by_barcode
+from renal_app.barcodes import decoder_available, gtin_text
+from renal_app.gemini_api import extract_label_info_many
+from renal_app.ocr_api import perform_ocr_many
+from renal_app.label_merge import merge_label_vals
+from renal_app.nutrients import to_float
+from renal_app.image_cache import LabelPhotoCache, dhash
+from renal_app.metrics import span, mark_cache_miss
+from renal_app.memory import get_session_blobs, put_session_blobs
+
+LABEL_CACHE_PATH = st.secrets.get("LABEL_CACHE_PATH", "data/label_cache.jsonl")
 
 def reset_wizard_choice():
     st.session_state.wizard_choice = None
@@ -11,17 +20,6 @@ def reset_wizard_choice():
 def reset_wizard_label_step_navigator():
     st.session_state.label_step_navigator = None
 
-def to_float(val, default=0.0):
-    if val is None or val == "":
-        return None  # Change default from 0.0 to None
-    try:
-        # Clean string of units if AI included them (e.g., "10g" -> "10")
-        if isinstance(val, str):
-            val = "".join(c for c in val if c.isdigit() or c == '.')
-        return float(val)
-    except (TypeError, ValueError):
-        return None
-
 def prepare_photo(img_file):
     img = Image.open(img_file)
     
@@ -41,14 +39,89 @@ def prepare_photo(img_file):
     # This will almost always be 150KB - 400KB (Safe for 1MB limit!)
     return buf.getvalue()
 
+def show_barcode_match(gtin, match):
+    if match:
+        st.success(f"✅ Barcode {gtin_text(gtin)} matched USDA ID {match['fdc_id']}: {match['name']}")
+    elif gtin:
+        st.info(f"Barcode {gtin_text(gtin)} is not in the USDA database. Search by product name instead.")
+
 def show_usda_wizard():
     """Wizard for USDA Data Input"""
 
+    if decoder_available():
+        barcode_file = st.file_uploader(
+            "Scan the barcode (optional)", type=['jpg', 'jpeg', 'png'], key="usda_barcode_upload"
+        )
+        if barcode_file:
+            gtin, match = select_food_by_barcode([prepare_photo(barcode_file)])
+            if gtin is None:
+                st.warning("No barcode found in this photo.")
+            show_barcode_match(gtin, match)
+
     usda_manual_entry_wizard()
 
     if st.session_state.get('selected_fdc_id') and st.session_state.wizard_choice != None:
         st.button("📊 View Results", width="stretch", on_click=reset_wizard_choice)
     
+@st.cache_resource
+def get_label_photo_cache():
+    """Loads the perceptual-hash index of earlier scans once per process."""
+    return LabelPhotoCache(LABEL_CACHE_PATH)
+
+def _cached_extraction(cache, image_hash):
+    with span("label_cache", "lookup", cached=True):
+        entry = cache.lookup(image_hash)
+        if entry is None:
+            mark_cache_miss()
+            return None
+        return entry["label_vals"], entry["ocr_text"], entry["source"]
+
+def bypass_label_cache():
+    st.session_state["label_cache_bypass"] = True
+
+def read_label_photos(photos):
+    """
+    OCRs and extracts every photo in parallel, then merges them into st.session_state['label_vals'].
+    Photos that look like an earlier scan reuse its extraction instead of calling OCR and Gemini.
+    """
+    cache = get_label_photo_cache()
+    hashes = [dhash(photo) for photo in photos]
+    extractions = [None] * len(photos)
+    if not st.session_state.pop("label_cache_bypass", False):
+        extractions = [_cached_extraction(cache, image_hash) for image_hash in hashes]
+    reused = sum(extraction is not None for extraction in extractions)
+
+    todo = [i for i, extraction in enumerate(extractions) if extraction is None]
+    ocr_results = perform_ocr_many([photos[i] for i in todo])
+    read = [(i, text) for i, text in zip(todo, ocr_results) if isinstance(text, str)]
+    for (i, text), (vals, source) in zip(read, extract_label_info_many([text for _, text in read])):
+        extractions[i] = (vals, text, source)
+        # Keep only AI extractions; a parser fallback should be retried once Gemini is back
+        if source == "gemini":
+            cache.add(hashes[i], vals, text, source)
+
+    extractions = [extraction for extraction in extractions if extraction is not None]
+    failed = len(photos) - len(extractions)
+    if not extractions:
+        st.error(f"Could not read the label ({ocr_results[0]}). Please use Manual Entry.")
+        return
+    if failed:
+        st.warning(f"Could not read {failed} of {len(photos)} photos; using the rest.")
+    if reused:
+        st.caption(f"{reused} photo(s) matched an earlier scan, so they were not read again.")
+        st.button("🔄 Read Again", on_click=bypass_label_cache)
+    if any(source == "parser" for _, _, source in extractions):
+        st.warning("AI extraction unavailable. Used the basic label parser, please check the values.")
+
+    if len(extractions) == 1:
+        st.session_state['label_vals'] = extractions[0][0]
+        return
+    label_vals, conflicts = merge_label_vals(extractions)
+    st.session_state['label_vals'] = label_vals
+    if conflicts:
+        fields = ", ".join(conflicts)
+        st.info(f"The photos disagree on {fields}; kept the clearest reading. Check them in Manual Entry.")
+
 def show_label_wizard():
     """Wizard for Label Data Input"""
 
@@ -62,17 +135,26 @@ def show_label_wizard():
     
     if step == "📸 Scan Label":
         
-        uploaded_file = st.file_uploader("Choose an image", type=['jpg', 'jpeg', 'png'], key="label_upload")
-        if uploaded_file:
-            compressed_photo = prepare_photo(uploaded_file)
-            st.session_state["label_photo_bytes"] = compressed_photo
-            st.image(uploaded_file, caption="Uploaded Image", width="stretch")
+        uploaded_files = st.file_uploader(
+            "Choose one or more images (e.g. the nutrition panel and the ingredients side)",
+            type=['jpg', 'jpeg', 'png'],
+            accept_multiple_files=True,
+            key="label_upload",
+        )
+        if uploaded_files:
+            # Photos are prepared once per upload; reruns read them back from the shared blob store
+            upload_ids = [f.file_id for f in uploaded_files]
+            photos = get_session_blobs("label_photos") if st.session_state.get("label_upload_ids") == upload_ids else []
+            if len(photos) != len(uploaded_files):
+                with ThreadPoolExecutor(max_workers=min(len(uploaded_files), 4)) as pool:
+                    photos = list(pool.map(prepare_photo, uploaded_files))
+                put_session_blobs("label_photos", photos)
+                st.session_state["label_upload_ids"] = upload_ids
+            st.image(uploaded_files, caption=[f.name for f in uploaded_files], width=200)
             with st.spinner("Reading label..."):
-                ocr_text = perform_ocr(compressed_photo)
-            if ocr_text.startswith("Error:"):
-                st.error(ocr_text)
-            else:
-                st.session_state['label_vals'] = extract_label_info_from_ocr(ocr_text)
+                read_label_photos(photos)
+            # A barcode on any photo selects the matching USDA item as well
+            show_barcode_match(*select_food_by_barcode(photos))
 
     elif step == "✍️ Manual Entry":
 
@@ -82,16 +164,16 @@ def show_label_wizard():
             # We ensure 'value' is explicitly a float (e.g., 5.0 instead of 5)
             brand_val = st.text_input("Brand", value=existing_data.get("Brand", ""))
             name_val = st.text_input("Product Name", value=existing_data.get("Product Name", ""))
-            sz_val = st.number_input("Serving Size", value=to_float(existing_data.get("Serving Size")), min_value=0.0, step=0.1)
+            sz_val = st.number_input("Serving Size", value=to_float(existing_data.get("Serving Size"), default=None), min_value=0.0, step=0.1)
             su_val = st.text_input("Serving Unit", value=existing_data.get("Serving Unit", ""))
-            p_val = st.number_input("Protein (g)", value=to_float(existing_data.get("Protein")), min_value=0.0, step=0.1)
-            s_val = st.number_input("Sodium (mg)", value=to_float(existing_data.get("Sodium")), min_value=0.0, step=1.0)
-            k_val = st.number_input("Potassium (mg)", value=to_float(existing_data.get("Potassium")), min_value=0.0, step=1.0)
-            phos_val = st.number_input("Phosphorus (mg)", value=to_float(existing_data.get("Phosphorus")), min_value=0.0, step=1.0)
-            sug_val = st.number_input("Sugar (g)", value=to_float(existing_data.get("Sugar")), min_value=0.0, step=0.1)
-            sat_fat_val = st.number_input("Saturated Fat (g)", value=to_float(existing_data.get("Saturated Fat")), min_value=0.0, step=0.1)
-            trans_fat_val = st.number_input("Trans Fat (g)", value=to_float(existing_data.get("Trans Fat")), min_value=0.0, step=0.1)            
-            cal_val = st.number_input("Calories (kcal)", value=to_float(existing_data.get("Calories")), min_value=0.0, step=1.0)
+            p_val = st.number_input("Protein (g)", value=to_float(existing_data.get("Protein"), default=None), min_value=0.0, step=0.1)
+            s_val = st.number_input("Sodium (mg)", value=to_float(existing_data.get("Sodium"), default=None), min_value=0.0, step=1.0)
+            k_val = st.number_input("Potassium (mg)", value=to_float(existing_data.get("Potassium"), default=None), min_value=0.0, step=1.0)
+            phos_val = st.number_input("Phosphorus (mg)", value=to_float(existing_data.get("Phosphorus"), default=None), min_value=0.0, step=1.0)
+            sug_val = st.number_input("Sugar (g)", value=to_float(existing_data.get("Sugar"), default=None), min_value=0.0, step=0.1)
+            sat_fat_val = st.number_input("Saturated Fat (g)", value=to_float(existing_data.get("Saturated Fat"), default=None), min_value=0.0, step=0.1)
+            trans_fat_val = st.number_input("Trans Fat (g)", value=to_float(existing_data.get("Trans Fat"), default=None), min_value=0.0, step=0.1)            
+            cal_val = st.number_input("Calories (kcal)", value=to_float(existing_data.get("Calories"), default=None), min_value=0.0, step=1.0)
             ingredients_val = st.text_area("Ingredients", value=existing_data.get("Ingredients", ""))
             
             submitted = st.form_submit_button("Save Label Data")
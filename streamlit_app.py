@@ -1,7 +1,13 @@
 import streamlit as st
 from renal_app.styles import apply_custom_styles
 from home_page import home_page
-from audit_page import audit_page
+from audit_page import audit_page, select_cached_food
+from intake_page import intake_page, get_intake_log
+from admin_page import admin_page, METRICS_DUMP_PATH
+from renal_app.metrics import span, dump_prometheus
+from renal_app.memory import sweep_ended_sessions
+from renal_app.preload import start_preload
+from renal_app.local_cache import show_local_cache
 from tracking import inject_ga  # Import your new tracker
 
 def main():
@@ -10,6 +16,12 @@ def main():
 
     #Main application logic
 
+    # Warm the caches for the most audited products in the background (once per process)
+    start_preload(get_intake_log())
+
+    # Give back the photos of sessions that have ended (at most once a minute)
+    sweep_ended_sessions()
+
     # Initialize session state for page navigation if not exists
     if 'page' not in st.session_state:
         st.session_state.page = "Home"
@@ -27,6 +39,19 @@ def main():
         st.session_state.page = "Audit"
         st.rerun()
 
+    if st.sidebar.button("📅 Daily Log", key="nav_log", use_container_width=True, type="primary" if st.session_state.page == "Daily Log" else "secondary"):
+        st.session_state.page = "Daily Log"
+        st.rerun()
+
+    # Admin page is only linked when the URL carries the configured token (?admin=...)
+    admin_token = st.secrets.get("ADMIN_TOKEN")
+    if admin_token and st.query_params.get("admin") == admin_token:
+        if st.sidebar.button("⚙️ Admin", key="nav_admin", use_container_width=True, type="primary" if st.session_state.page == "Admin" else "secondary"):
+            st.session_state.page = "Admin"
+            st.rerun()
+    elif st.session_state.page == "Admin":
+        st.session_state.page = "Home"
+
     st.sidebar.markdown("---")
     st.sidebar.caption("Compare label data against USDA lab truth for renal health")
 
@@ -34,7 +59,20 @@ def main():
     if st.session_state.page == "Home":
         home_page()
     elif st.session_state.page == "Audit":
-        audit_page()
+        with span("streamlit", "render_audit"):
+            audit_page()
+    elif st.session_state.page == "Daily Log":
+        with span("streamlit", "render_daily_log"):
+            intake_page()
+    elif st.session_state.page == "Admin":
+        admin_page()
+
+    # Recent lookups stay in the browser, searchable offline (shown on the Audit page)
+    show_local_cache(select_cached_food, visible=st.session_state.page == "Audit")
+
+    # Keep an offline Prometheus textfile up to date if configured (at most every DUMP_INTERVAL seconds)
+    if METRICS_DUMP_PATH:
+        dump_prometheus(METRICS_DUMP_PATH)
 
 
 if __name__ == "__main__":